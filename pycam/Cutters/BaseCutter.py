@@ -18,6 +18,8 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import array
+import pickle
 import uuid
 
 from pycam.Geometry import number, INFINITE, epsilon
@@ -72,6 +74,16 @@ class BaseCutter(IDGenerator):
     def update_uuid(self):
         self.uuid = uuid.uuid4()
 
+    def get_shared_buffers(self):
+        """ the cutter is transferred only once to every worker process (see
+        pycam.Utils.threading)
+        """
+        return {}, {"state": array.array("B", pickle.dumps(self))}
+
+    @classmethod
+    def from_shared_buffers(cls, settings, buffers):
+        return pickle.loads(buffers["state"])
+
     def __repr__(self):
         return "BaseCutter"
 
@@ -108,6 +120,14 @@ class BaseCutter(IDGenerator):
     def get_required_distance(self):
         return self.required_distance
 
+    def get_shaft_height(self):
+        """ return the height (relative to the location) above which only the cylindrical shaft
+        of the cutter can collide with horizontally approached objects
+
+        None means: unknown (e.g. for tools with a complex shape).
+        """
+        return None
+
     def moveto(self, location):
         # "moveto" is used for collision detection calculation.
         self.location = location
@@ -41,6 +41,10 @@ class CylindricalCutter(BaseCutter):
         BaseCutter.moveto(self, location, **kwargs)
         self.center = (location[0], location[1], location[2] - self.get_required_distance())
 
+    def get_shaft_height(self):
+        # the bottom of the cutter (see "moveto")
+        return self.center[2] - self.location[2]
+
     def intersect_circle_plane(self, direction, triangle, start=None):
         if start is None:
             start = self.location
@@ -41,6 +41,10 @@ class SphericalCutter(BaseCutter):
         BaseCutter.moveto(self, location, **kwargs)
         self.center = (location[0], location[1], location[2] + self.radius)
 
+    def get_shaft_height(self):
+        # the upper half of the sphere does not exceed the shaft
+        return self.center[2] - self.location[2]
+
     def intersect_sphere_plane(self, direction, triangle, start=None):
         if start is None:
             start = self.location
@@ -72,6 +72,10 @@ class ToroidalCutter(BaseCutter):
         BaseCutter.moveto(self, location, **kwargs)
         self.center = (location[0], location[1], location[2]+self.minorradius)
 
+    def get_shaft_height(self):
+        # the top of the torus - it may exceed the shaft due to the required distance
+        return self.center[2] - self.location[2] + self.distance_minorradius
+
     def intersect_torus_plane(self, direction, triangle, start=None):
         if start is None:
             start = self.location
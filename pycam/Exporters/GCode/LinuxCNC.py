@@ -30,6 +30,7 @@ DEFAULT_HEADER = (("G40", "disable tool radius compensation"),
                   ("G90", "disable incremental moves"))
 
 DEFAULT_DIGITS = 6
+AXES = "XYZABCUVW"
 
 
 def _render_number(number):
@@ -59,25 +60,82 @@ class LinuxCNC(pycam.Exporters.GCode.BaseGenerator):
         else:
             self.destination.write(os.linesep)
 
+    def _get_number_formats(self, count):
+        """ return the format strings of the first axes (based on the step width, if available)
+        """
+        formats = self._get_cache("number_formats", {})
+        default_format = "%%.%df" % DEFAULT_DIGITS
+        return [formats.get(axis.lower(), default_format) for axis in AXES[:count]]
+
     def add_move(self, coordinates, is_rapid=False):
-        components = []
+        self.add_move_block([coordinates], is_rapid)
+
+    def add_move_block(self, positions, is_rapid=False):
+        """ write a sequence of straight moves at once
+
+        The coordinates are rendered axis by axis.  Axes without a visible change (at the given
+        precision) are omitted.  All lines are written with a single call.
+        """
         # the cached value may be:
         #   True: the last move was G0
         #   False: the last move was G1
         #   None: some non-move happened before
         if self._get_cache("rapid_move", None) != is_rapid:
-            components.append("G0" if is_rapid else "G1")
+            prefix = "G0" if is_rapid else "G1"
         else:
             # improve gcode style
-            components.append(" ")
-        axes = [axis for axis in "XYZABCUVW"]
-        previous = self._get_cache("position", [None] * len(coordinates))
-        for (axis, value, last) in zip(axes, coordinates, previous):
-            if (last is None) or (last != value):
-                components.append("%s%.6f" % (axis, value))
-        command = " ".join(components)
-        if command.strip():
-            self.add_command(command)
+            prefix = " "
+        previous = self._get_cache("position", ())
+        columns = []
+        for index, number_format in enumerate(self._get_number_formats(len(positions[0]))):
+            # every component starts with a space
+            axis_format = " " + AXES[index] + number_format
+            texts = [axis_format % position[index] for position in positions]
+            last_text = axis_format % previous[index] if index < len(previous) else None
+            columns.append([text if text != last else ""
+                            for text, last in zip(texts, [last_text] + texts[:-1])])
+        rendered = ["".join(components) for components in zip(*columns)]
+        lines = []
+        if prefix != " ":
+            # the first line is written in any case (switching the mode)
+            lines.append(prefix + rendered.pop(0))
+        lines.extend(" " + line for line in rendered if line)
+        if lines:
+            lines.append("")
+            self.destination.write(os.linesep.join(lines))
+
+    def add_arc(self, coordinates, center, clockwise):
+        """ write an arc move (G2/G3) starting at the previous position
+
+        The coordinates of the ends are rounded (see "_get_number_formats").  The center is
+        moved onto the perpendicular bisector of the rounded ends: the machine controller
+        rejects arcs with different radii at their start and end.  The offsets of the center
+        are written with full precision.
+        """
+        previous = self._get_cache("position", None)
+        number_formats = self._get_number_formats(3)
+        start, end = ([float(number_format % value)
+                       for number_format, value in zip(number_formats, position)]
+                      for position in (previous, coordinates))
+        chord_x, chord_y = end[0] - start[0], end[1] - start[1]
+        if chord_x == chord_y == 0:
+            # the rounded arc would be a full circle
+            self.add_move(coordinates)
+            return
+        middle = ((start[0] + end[0]) / 2, (start[1] + end[1]) / 2)
+        offset = (((center[0] - middle[0]) * chord_x + (center[1] - middle[1]) * chord_y)
+                  / (chord_x ** 2 + chord_y ** 2))
+        center = (center[0] - offset * chord_x, center[1] - offset * chord_y)
+        # the arc is a modal motion: the next straight move needs to emit G1
+        components = ["G2" if clockwise else "G3"]
+        for axis, number_format, value, last in zip(AXES, number_formats, coordinates, previous):
+            if number_format % last != number_format % value:
+                components.append(axis + number_format % value)
+        # the center is relative to the (rounded) start of the arc
+        center_format = "%%.%df" % DEFAULT_DIGITS
+        components.append("I" + center_format % (center[0] - start[0]))
+        components.append("J" + center_format % (center[1] - start[1]))
+        self.add_command(" ".join(components))
 
     def command_feedrate(self, feedrate):
         self.add_command("F%s" % _render_number(feedrate), "set feedrate")
@@ -19,10 +19,13 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 
 import pycam.Utils.log
 import pycam.Toolpath.Filters
-from pycam.Toolpath import MOVE_STRAIGHT_RAPID, MACHINE_SETTING, COMMENT, MOVES_LIST
+from pycam.Toolpath import MOVE_STRAIGHT_RAPID, MOVE_ARC, MACHINE_SETTING, COMMENT, MOVES_LIST
 
 _log = pycam.Utils.log.get_logger()
 
+# the maximum number of consecutive straight moves being written at once (see "add_move_block")
+MOVE_BLOCK_SIZE = 10000
+
 
 class BaseGenerator:
 
@@ -59,6 +62,19 @@ class BaseGenerator:
     def add_move(self, coordinates, is_rapid=False):
         raise NotImplementedError("someone forgot to implement 'add_move'")
 
+    def add_move_block(self, positions, is_rapid=False):
+        """ write a sequence of straight moves
+
+        Generators may override this method for writing many moves at once.
+        """
+        for position in positions:
+            self.add_move(position, is_rapid)
+            self._cache["position"] = position
+            self._cache["rapid_move"] = is_rapid
+
+    def add_arc(self, coordinates, center, clockwise):
+        raise NotImplementedError("someone forgot to implement 'add_arc'")
+
     def add_footer(self):
         raise NotImplementedError("someone forgot to implement 'add_footer'")
 
@@ -68,17 +84,40 @@ class BaseGenerator:
             self.destination.close()
 
     def add_moves(self, moves, filters=None):
+        """ write the filtered moves to the destination
+
+        The moves may be a generator.  They are processed step by step (without keeping a copy of
+        the toolpath), if all filters support this (see pycam.Toolpath.Filters.StreamFilter).
+        """
         # combine both lists/tuples in a type-agnostic way
         all_filters = list(self._filters)
         if filters:
             all_filters.extend(filters)
-        filtered_moves = pycam.Toolpath.Filters.get_filtered_moves(moves, all_filters)
+        for one_filter in all_filters:
+            if isinstance(one_filter, pycam.Toolpath.Filters.StepWidth):
+                # the precision of the coordinates is based on the step width
+                self._cache["number_formats"] = one_filter.get_number_formats()
+        filtered_moves = pycam.Toolpath.Filters.iterate_filtered_moves(moves, all_filters)
+        # consecutive straight moves of the same type are written as a block
+        block = []
+        block_is_rapid = None
         for step in filtered_moves:
-            if step.action in MOVES_LIST:
+            if (step.action in MOVES_LIST) and (step.action != MOVE_ARC):
                 is_rapid = step.action == MOVE_STRAIGHT_RAPID
-                self.add_move(step.position, is_rapid)
+                if block and ((is_rapid != block_is_rapid) or (len(block) >= MOVE_BLOCK_SIZE)):
+                    self._write_move_block(block, block_is_rapid)
+                    block = []
+                block.append(step.position)
+                block_is_rapid = is_rapid
+                continue
+            if block:
+                self._write_move_block(block, block_is_rapid)
+                block = []
+            if step.action == MOVE_ARC:
+                # the arc starts at the previous position (see pycam.Toolpath.Filters.ArcFit)
+                self.add_arc(step.position, step.center, step.clockwise)
                 self._cache["position"] = step.position
-                self._cache["rapid_move"] = is_rapid
+                self._cache["rapid_move"] = None
             elif step.action == COMMENT:
                 self.add_comment(step.text)
             elif step.action == MACHINE_SETTING:
@@ -93,3 +132,10 @@ class BaseGenerator:
                               "'%s=%s' -> ignore", step.key, step.value)
             else:
                 _log.warn("A non-basic toolpath item (%s) remained in the queue -> ignore", step)
+        if block:
+            self._write_move_block(block, block_is_rapid)
+
+    def _write_move_block(self, positions, is_rapid):
+        self.add_move_block(positions, is_rapid)
+        self._cache["position"] = positions[-1]
+        self._cache["rapid_move"] = is_rapid
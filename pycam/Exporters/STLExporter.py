@@ -19,29 +19,101 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 
 import datetime
 import os
+import struct
 
 from pycam import VERSION
 from pycam.Geometry.PointUtils import pnormalized
+from pycam.Importers.STLImporter import FACET_FORMAT, HEADER_SIZE
+
+try:
+    import numpy
+except ImportError:
+    # numpy is not available: pack the facets of the binary format one by one
+    numpy = None
+
+
+# the number of facets being packed and written at once (binary format)
+FACET_CHUNK_SIZE = 65536
+
+_FACET_STRUCT = struct.Struct(FACET_FORMAT)
 
 
 class STLExporter:
 
-    def __init__(self, model, name="model", created_by="pycam", linesep=None, **kwargs):
+    def __init__(self, model, name="model", created_by="pycam", linesep=None, binary=False,
+                 **kwargs):
+        """
+        @param binary: write the compact binary format instead of text (the stream needs to
+            accept bytes)
+        """
         self.model = model
         self.name = name
         self.created_by = created_by
+        self.binary = binary
         if linesep is None:
             self.linesep = os.linesep
         else:
             self.linesep = linesep
 
     def __str__(self):
-        return self.linesep.join(self.get_output_lines)
+        return self.linesep.join(self.get_output_lines())
 
     def write(self, stream):
-        for line in self.get_output_lines():
-            stream.write(line)
-            stream.write(self.linesep)
+        if self.binary:
+            self.write_binary(stream)
+        else:
+            for line in self.get_output_lines():
+                stream.write(line)
+                stream.write(self.linesep)
+
+    def write_binary(self, stream):
+        """ write the model in the binary STL format
+
+        The facets are packed in chunks - based on the arrays of the triangle mesh (with numpy)
+        if possible.
+        """
+        date = datetime.date.today().isoformat()
+        # the header must not start with "solid" (this indicates the text format)
+        header = ("PyCAM binary STL \"%s\"; Produced by %s (v%s), %s"
+                  % (self.name, self.created_by, VERSION, date)).encode("utf-8")
+        stream.write(header[:HEADER_SIZE].ljust(HEADER_SIZE, b" "))
+        if (numpy is not None) and hasattr(self.model, "get_mesh"):
+            mesh = self.model.get_mesh()
+            stream.write(struct.pack("<I", len(mesh)))
+            for chunk in self._get_binary_chunks_vectorized(mesh):
+                stream.write(chunk)
+        else:
+            triangles = list(self.model.triangles())
+            stream.write(struct.pack("<I", len(triangles)))
+            for start in range(0, len(triangles), FACET_CHUNK_SIZE):
+                stream.write(b"".join(self._get_binary_facet(triangle)
+                                      for triangle in triangles[start:start + FACET_CHUNK_SIZE]))
+
+    @staticmethod
+    def _get_binary_facet(triangle):
+        norm = pnormalized(triangle.normal) or (0, 0, 0)
+        # see "get_output_lines" for the order of the vertices
+        return _FACET_STRUCT.pack(norm[0], norm[1], norm[2], *triangle.p1[:3], *triangle.p3[:3],
+                                  *triangle.p2[:3], 0)
+
+    @staticmethod
+    def _get_binary_chunks_vectorized(mesh):
+        vertices = numpy.frombuffer(mesh.vertices, dtype=float).reshape((-1, 3))
+        faces = numpy.frombuffer(mesh.faces, dtype=numpy.int64).reshape((-1, 3))
+        normals = numpy.frombuffer(mesh.get_normals(), dtype=float).reshape((-1, 3))
+        facet_type = numpy.dtype([("normal", "<f4", (3, )), ("vertices", "<f4", (3, 3)),
+                                  ("attribute", "<u2")])
+        for start in range(0, len(faces), FACET_CHUNK_SIZE):
+            chunk_faces = faces[start:start + FACET_CHUNK_SIZE]
+            chunk_normals = normals[start:start + FACET_CHUNK_SIZE]
+            lengths = numpy.sqrt((chunk_normals ** 2).sum(axis=1))[:, numpy.newaxis]
+            facets = numpy.zeros(len(chunk_faces), dtype=facet_type)
+            facets["normal"] = numpy.divide(chunk_normals, lengths,
+                                            out=numpy.zeros_like(chunk_normals),
+                                            where=(lengths > 0))
+            # see "get_output_lines" for the order of the vertices
+            facets["vertices"] = vertices[chunk_faces[:, (0, 2, 1)]]
+            yield facets.tobytes()
 
     def get_output_lines(self):
         date = datetime.date.today().isoformat()
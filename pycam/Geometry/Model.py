@@ -28,7 +28,8 @@ from pycam.Geometry.Plane import Plane
 from pycam.Geometry.Polygon import Polygon
 from pycam.Geometry.PointUtils import pcross, pdist, pmul, pnorm, pnormalized, psub
 from pycam.Geometry.Triangle import Triangle
-from pycam.Geometry.TriangleKdtree import TriangleKdtree
+from pycam.Geometry.TriangleBVH import TriangleBVH
+from pycam.Geometry.TriangleMesh import TriangleMesh
 from pycam.Toolpath import Bounds
 from pycam.Utils import ProgressCounter
 import pycam.Utils.log
@@ -223,14 +224,15 @@ class Model(BaseModel):
     def __init__(self, use_kdtree=True):
         import pycam.Exporters.STLExporter
         super().__init__()
-        self._triangles = []
+        # the triangles are stored in a compact mesh - "Triangle" objects are created on demand
+        self._triangles = TriangleMesh()
         self._item_groups.append(self._triangles)
         self._export_function = pycam.Exporters.STLExporter.STLExporter
-        # marker for state of kdtree and uuid
+        # marker for the state of the spatial index (it needs to be rebuilt)
         self._dirty = True
-        # enable/disable kdtree
+        # enable/disable the spatial index
         self._use_kdtree = use_kdtree
-        self._t_kdtree = None
+        self._t_index = None
         self.__uuid = None
 
     def __len__(self):
@@ -242,53 +244,233 @@ class Model(BaseModel):
     def __iter__(self):
         yield from self._triangles
 
+    def __add__(self, other_model):
+        """ combine two models """
+        if not isinstance(other_model, Model):
+            return super().__add__(other_model)
+        result = self.copy()
+        result._triangles.extend(other_model._triangles)
+        result.reset_cache()
+        return result
+
     def copy(self):
         result = self.__class__(use_kdtree=self._use_kdtree)
-        for triangle in self.triangles():
-            result.append(triangle.copy())
+        result._triangles.extend(self._triangles)
+        for key in ("minx", "miny", "minz", "maxx", "maxy", "maxz"):
+            setattr(result, key, getattr(self, key))
+        return result
+
+    def get_mesh(self):
+        """ return the compact representation of all triangles of this model """
+        return self._triangles
+
+    def set_mesh(self, mesh, spatial_index=None):
+        """ replace all triangles of the model (e.g. with data loaded from a file)
+
+        A given spatial index is expected to match the mesh - it is not rebuilt.
+        """
+        self._item_groups[self._item_groups.index(self._triangles)] = mesh
+        self._triangles = mesh
+        self.reset_cache()
+        if self._use_kdtree and (spatial_index is not None):
+            self._t_index = spatial_index
+            self._dirty = False
+
+    def get_spatial_index(self):
+        """ return the up-to-date spatial index or None (if it is disabled) """
+        if self._use_kdtree and self._dirty:
+            self._update_caches()
+        return self._t_index if self._use_kdtree else None
+
+    def get_shared_buffers(self):
+        """ return the settings and the arrays of the model (see pycam.Utils.threading)
+
+        The arrays can be published in shared memory instead of pickling the model for every
+        parallel task.
+        """
+        settings = {"uuid": self.uuid, "name": self.name, "use_kdtree": self._use_kdtree}
+        buffers = {"mesh_" + key: values
+                   for key, values in self._triangles.get_buffers().items()}
+        spatial_index = self.get_spatial_index()
+        if spatial_index is not None:
+            buffers.update({"index_" + key: values
+                            for key, values in spatial_index.get_buffers().items()})
+        return settings, buffers
+
+    @classmethod
+    def from_shared_buffers(cls, settings, buffers):
+        """ create a read-only model based on the result of "get_shared_buffers" """
+        result = cls(use_kdtree=settings["use_kdtree"])
+        result.name = settings["name"]
+        groups = {"mesh_": {}, "index_": {}}
+        for key, values in buffers.items():
+            for prefix, group in groups.items():
+                if key.startswith(prefix):
+                    group[key[len(prefix):]] = values
+        spatial_index = TriangleBVH.from_buffers(groups["index_"]) if groups["index_"] else None
+        result.set_mesh(TriangleMesh.from_buffers(groups["mesh_"]), spatial_index=spatial_index)
+        # keep the identity of the original model (e.g. for caches based on the uuid)
+        result.__uuid = settings["uuid"]
         return result
 
+    def get_children_count(self):
+        # see Triangle.get_children_count
+        return 7 * len(self._triangles)
+
     @property
     def uuid(self):
-        if (self.__uuid is None) or self._dirty:
-            self._update_caches()
+        # the uuid is reset whenever the model changes
+        if self.__uuid is None:
+            self.__uuid = str(uuid.uuid4())
         return self.__uuid
 
     def append(self, item):
         super().append(item)
         if isinstance(item, Triangle):
             self._triangles.append(item)
-            # we assume, that the kdtree needs to be rebuilt again
+            self._add_to_index(len(self._triangles) - 1)
+
+    def _add_to_index(self, face_index):
+        """ add a new face to the spatial index (if possible) instead of rebuilding it later """
+        self.__uuid = None
+        if self._dirty or (self._t_index is None):
+            return
+        bounds = self._triangles.get_bounds()
+        if self._t_index.insert(face_index, tuple(values[face_index] for values in bounds)):
+            if not self._t_index.is_balanced():
+                self._dirty = True
+        else:
             self._dirty = True
 
+    def add_triangle(self, p1, p2, p3, normal=None):
+        """ add a triangle (three points in clockwise order) without creating a "Triangle" """
+        mesh = self._triangles
+        mesh.add_face(mesh.add_vertex(p1), mesh.add_vertex(p2), mesh.add_vertex(p3),
+                      normal=normal)
+        for index, key in enumerate(("x", "y", "z")):
+            low = min(p1[index], p2[index], p3[index])
+            high = max(p1[index], p2[index], p3[index])
+            if getattr(self, "min" + key) is None:
+                setattr(self, "min" + key, low)
+                setattr(self, "max" + key, high)
+            else:
+                setattr(self, "min" + key, min(getattr(self, "min" + key), low))
+                setattr(self, "max" + key, max(getattr(self, "max" + key), high))
+        self._add_to_index(len(mesh) - 1)
+
+    def transform_by_matrix(self, matrix, transformed_list=None, callback=None):
+        # transform the arrays of the mesh instead of single triangles
+        self._triangles.transform_by_matrix(matrix, callback=callback)
+        self.reset_cache()
+
     def reset_cache(self):
-        super().reset_cache()
-        # the triangle kdtree needs to be reset after transforming the model
-        self._update_caches()
+        limits = self._triangles.get_limits()
+        if limits is None:
+            self.minx, self.miny, self.minz, self.maxx, self.maxy, self.maxz = (None, ) * 6
+        else:
+            self.minx, self.miny, self.minz, self.maxx, self.maxy, self.maxz = limits
+        # the spatial index needs to be rebuilt after transforming the model
+        self._dirty = True
+        self.__uuid = None
 
     def _update_caches(self):
         if self._use_kdtree:
-            self._t_kdtree = TriangleKdtree(self.triangles())
-        self.__uuid = str(uuid.uuid4())
-        # the kdtree is up-to-date again
+            self._t_index = TriangleBVH(self._triangles.get_bounds())
+        # the spatial index is up-to-date again
         self._dirty = False
 
     def triangles(self, minx=-INFINITE, miny=-INFINITE, minz=-INFINITE, maxx=+INFINITE,
                   maxy=+INFINITE, maxz=+INFINITE):
+        """ return all triangles with a bounding box overlapping the given box """
         if (minx == miny == minz == -INFINITE) and (maxx == maxy == maxz == +INFINITE):
             return self._triangles
         if self._use_kdtree:
-            # update the kdtree, if new triangles were added meanwhile
+            # update the spatial index, if new triangles were added meanwhile
             if self._dirty:
                 self._update_caches()
-            return self._t_kdtree.search(minx, maxx, miny, maxy)
+            get_triangle = self._triangles.get_triangle
+            return [get_triangle(index)
+                    for index in self._t_index.search(minx, maxx, miny, maxy, minz, maxz)]
         return self._triangles
 
+    def triangles_by_height(self, minx=-INFINITE, miny=-INFINITE, minz=-INFINITE,
+                            maxx=+INFINITE, maxy=+INFINITE, maxz=+INFINITE):
+        """ return the triangles overlapping the given box - the highest triangles come first
+
+        The triangles are sorted by their maximum height (see TriangleMesh.get_height_order).
+        """
+        get_triangle = self._triangles.get_triangle
+        if self._use_kdtree and not ((minx == miny == minz == -INFINITE)
+                                     and (maxx == maxy == maxz == +INFINITE)):
+            if self._dirty:
+                self._update_caches()
+            ranks = self._triangles.get_height_ranks()
+            indices = sorted(self._t_index.search(minx, maxx, miny, maxy, minz, maxz),
+                             key=ranks.__getitem__)
+        else:
+            indices = self._triangles.get_height_order()
+        return [get_triangle(index) for index in indices]
+
+    def triangles_in_boxes(self, boxes):
+        """ return the triangles for each of the given boxes (see "triangles")
+
+        Every box is a tuple of (minx, miny, minz, maxx, maxy, maxz).
+        All boxes are processed in a single pass through the spatial index.
+        """
+        if not self._use_kdtree:
+            return [self._triangles for _ in boxes]
+        if self._dirty:
+            self._update_caches()
+        get_triangle = self._triangles.get_triangle
+        index_boxes = [(minx, maxx, miny, maxy, minz, maxz)
+                       for minx, miny, minz, maxx, maxy, maxz in boxes]
+        return [[get_triangle(index) for index in indices]
+                for indices in self._t_index.search_many(index_boxes)]
+
     def get_waterline_contour(self, plane, callback=None):
+        contours = self.get_waterline_contours([plane], callback=callback)
+        return None if contours is None else contours[0]
+
+    def get_waterline_contours(self, planes, callback=None):
+        """ calculate the waterline contour for each of the given planes
+
+        Only the triangles spanning the height of a horizontal plane are checked for collisions.
+        These triangles are determined for all horizontal planes in a single sweep.
+        The result is a list of contour models (one for every plane) or None (cancelled).
+        """
+        planes = list(planes)
+        horizontal_indices = [index for index, plane in enumerate(planes)
+                              if plane.n[0] == plane.n[1] == 0]
+        # the tolerance exceeds the one of Plane.intersect_triangle
+        faces_at_heights = self._triangles.get_faces_at_heights(
+            [planes[index].p[2] for index in horizontal_indices], tolerance=2 * epsilon)
+        plane_faces = dict(zip(horizontal_indices, faces_at_heights))
+        contours = []
+        for index, plane in enumerate(planes):
+            if index in plane_faces:
+                get_triangle = self._triangles.get_triangle
+                triangles = [get_triangle(face_index) for face_index in plane_faces.pop(index)]
+            else:
+                triangles = self._triangles
+            if callback:
+                # combine the progress of all planes
+                def plane_callback(percent=None, index=index, **kwargs):
+                    if percent is not None:
+                        percent = (100.0 * index + percent) / len(planes)
+                    return callback(percent=percent, **kwargs)
+            else:
+                plane_callback = None
+            contour = self._get_waterline_contour(plane, triangles, callback=plane_callback)
+            if contour is None:
+                return None
+            contours.append(contour)
+        return contours
+
+    def _get_waterline_contour(self, plane, triangles, callback=None):
         collision_lines = []
-        progress_max = 2 * len(self._triangles)
+        progress_max = 2 * len(triangles)
         counter = 0
-        for t in self._triangles:
+        for t in triangles:
             if callback and callback(percent=100.0 * counter / progress_max):
                 return
             collision_line = plane.intersect_triangle(t, counter_clockwise=True)
@@ -0,0 +1,106 @@
+"""
+merge nearby points based on a hash grid of quantized coordinates
+
+This is a faster alternative to the nearest neighbour search of PointKdtree.  The points are
+sorted into cubic cells (a dictionary indexed by the quantized coordinates).  A point close to the
+border of its cell is also compared with the points of the adjacent cells.
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import array
+import math
+
+from pycam.Geometry import epsilon
+
+
+class PointHashGrid:
+    """ collect unique points - points closer than the tolerance are merged
+
+    Similar to PointKdtree the tolerance is compared with the squared distance of two points.
+    Without a tolerance (None) only identical points are merged.
+    The unique points are stored in "vertices" (three values per point).
+    """
+
+    def __init__(self, tolerance=epsilon):
+        self.tolerance = tolerance
+        self.vertices = array.array("d")
+        if tolerance is None:
+            self._exact = {}
+        else:
+            self._exact = None
+            self._distance = math.sqrt(tolerance)
+            # large cells: most points need to be compared with the points of one cell only
+            self._cell_size = 4 * self._distance
+            self._cells = {}
+
+    def __len__(self):
+        return len(self.vertices) // 3
+
+    def get_index(self, x, y, z):
+        """ return the index of the unique point matching the given point (it is added if new) """
+        if self._exact is not None:
+            key = (x, y, z)
+            try:
+                return self._exact[key]
+            except KeyError:
+                index = len(self.vertices) // 3
+                self.vertices.extend(key)
+                self._exact[key] = index
+                return index
+        cell_size = self._cell_size
+        cell_x, cell_y, cell_z = (math.floor(x / cell_size), math.floor(y / cell_size),
+                                  math.floor(z / cell_size))
+        home_cell = (cell_x, cell_y, cell_z)
+        # check the adjacent cells only for points close to the border
+        offsets = []
+        for value, cell in ((x, cell_x), (y, cell_y), (z, cell_z)):
+            axis_offsets = [0]
+            fraction = value - cell * cell_size
+            if fraction < self._distance:
+                axis_offsets.append(-1)
+            if fraction > cell_size - self._distance:
+                axis_offsets.append(1)
+            offsets.append(axis_offsets)
+        vertices = self.vertices
+        best_index = None
+        best_distance = self.tolerance
+        for offset_x in offsets[0]:
+            for offset_y in offsets[1]:
+                for offset_z in offsets[2]:
+                    cell = (cell_x + offset_x, cell_y + offset_y, cell_z + offset_z)
+                    for index in self._cells.get(cell, ()):
+                        offset = 3 * index
+                        dx = vertices[offset] - x
+                        dy = vertices[offset + 1] - y
+                        dz = vertices[offset + 2] - z
+                        distance = dx * dx + dy * dy + dz * dz
+                        if distance < best_distance:
+                            best_index = index
+                            best_distance = distance
+        if best_index is None:
+            best_index = len(vertices) // 3
+            vertices.extend((x, y, z))
+            self._cells.setdefault(home_cell, []).append(best_index)
+        return best_index
+
+    def get_point(self, index):
+        offset = 3 * index
+        return tuple(self.vertices[offset:offset + 3])
+
+    def point(self, x, y, z):
+        """ return the unique point matching the given point (see PointKdtree.point) """
+        return self.get_point(self.get_index(x, y, z))
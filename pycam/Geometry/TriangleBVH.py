@@ -0,0 +1,285 @@
+"""
+a flattened bounding volume hierarchy (BVH) for the faces of a triangle mesh
+
+The tree is stored in flat arrays (in depth-first order).  Every node knows the position of the
+node following its subtree ("skip" index).  Thus a search does not need recursion or a stack and
+no intermediate lists are allocated.
+
+Faces added later are attached to the most suitable leaf (see "insert").  The tree should be
+rebuilt as soon as it is not balanced anymore (see "is_balanced").
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import array
+
+from pycam.Geometry import INFINITE
+
+
+class TriangleBVH:
+    """ spatial index for the bounding boxes of faces
+
+    The bounding boxes are given as six sequences (minx, miny, minz, maxx, maxy, maxz) containing
+    one value per face (see TriangleMesh.get_bounds).
+    Searches return the indices of all faces with a bounding box overlapping the given box.
+    """
+
+    def __init__(self, bounds, leaf_size=8, max_inserted_ratio=0.25):
+        self._leaf_size = leaf_size
+        self._max_inserted_ratio = max_inserted_ratio
+        self._face_bounds = tuple(array.array("d", values) for values in bounds)
+        face_count = len(self._face_bounds[0])
+        # the face indices sorted by leaves
+        self._order = array.array("q", range(face_count))
+        # node data: bounding box (six values per node), the index of the node following the
+        # subtree and the range of faces (for leaves)
+        self._node_bounds = array.array("d")
+        self._node_skip = array.array("q")
+        self._node_start = array.array("q")
+        self._node_count = array.array("q")
+        # faces added after building the tree (by leaf node index)
+        self._inserted = {}
+        self._inserted_count = 0
+        self._max_inserted_per_leaf = 0
+        if face_count > 0:
+            self._build()
+
+    def __len__(self):
+        return len(self._order) + self._inserted_count
+
+    def get_buffers(self):
+        """ return the arrays defining the tree (e.g. for storing it in a file) """
+        # pairs of leaf node index and face index
+        inserted = array.array("q")
+        for leaf_index, faces in self._inserted.items():
+            for face_index in faces:
+                inserted.extend((leaf_index, face_index))
+        buffers = {"settings": array.array("d", (self._leaf_size, self._max_inserted_ratio)),
+                   "order": self._order, "node_bounds": self._node_bounds,
+                   "node_skip": self._node_skip, "node_start": self._node_start,
+                   "node_count": self._node_count, "inserted": inserted}
+        for key, values in zip(("minx", "miny", "minz", "maxx", "maxy", "maxz"),
+                               self._face_bounds):
+            buffers["face_" + key] = values
+        return buffers
+
+    @classmethod
+    def from_buffers(cls, buffers):
+        """ create a tree based on the arrays returned by "get_buffers" (without rebuilding it) """
+        leaf_size, max_inserted_ratio = buffers["settings"]
+        result = cls(tuple([] for _ in range(6)), leaf_size=int(leaf_size),
+                     max_inserted_ratio=max_inserted_ratio)
+        result._face_bounds = tuple(buffers["face_" + key]
+                                    for key in ("minx", "miny", "minz", "maxx", "maxy", "maxz"))
+        for key in ("order", "node_bounds", "node_skip", "node_start", "node_count"):
+            setattr(result, "_" + key, buffers[key])
+        inserted = buffers["inserted"]
+        for leaf_index, face_index in zip(inserted[::2], inserted[1::2]):
+            result._inserted.setdefault(leaf_index, []).append(face_index)
+            result._inserted_count += 1
+        result._max_inserted_per_leaf = max((len(faces) for faces in result._inserted.values()),
+                                            default=0)
+        return result
+
+    def is_balanced(self):
+        """ check if the inserted faces are still spread evenly enough """
+        return ((self._inserted_count <= self._max_inserted_ratio * len(self._order))
+                and (self._max_inserted_per_leaf <= 4 * self._leaf_size))
+
+    def insert(self, face_index, box):
+        """ add a face to the tree without rebuilding it
+
+        The face is attached to the leaf that requires the smallest enlargement of the bounding
+        boxes along the path from the root.  The bounding boxes of all nodes along this path are
+        enlarged accordingly.
+        The face index is expected to be the next one (following all existing faces).
+        The box is a tuple (minx, miny, minz, maxx, maxy, maxz).
+        Returns False, if the tree is empty (it needs to be rebuilt).
+        """
+        if not self._node_skip:
+            return False
+        for values, value in zip(self._face_bounds, box):
+            values.append(value)
+
+        def get_enlargement(node_index):
+            offset = 6 * node_index
+            node_box = self._node_bounds[offset:offset + 6]
+            # the increase of the sum of all edge lengths of the box
+            return sum(max(node_box[axis + 3], box[axis + 3]) - min(node_box[axis], box[axis])
+                       - (node_box[axis + 3] - node_box[axis]) for axis in range(3))
+
+        path = [0]
+        while self._node_count[path[-1]] == 0:
+            child1 = path[-1] + 1
+            child2 = self._node_skip[child1]
+            if get_enlargement(child1) <= get_enlargement(child2):
+                path.append(child1)
+            else:
+                path.append(child2)
+        for node_index in path:
+            offset = 6 * node_index
+            for axis in range(3):
+                self._node_bounds[offset + axis] = min(self._node_bounds[offset + axis],
+                                                       box[axis])
+                self._node_bounds[offset + axis + 3] = max(self._node_bounds[offset + axis + 3],
+                                                           box[axis + 3])
+        leaf_faces = self._inserted.setdefault(path[-1], [])
+        leaf_faces.append(face_index)
+        self._inserted_count += 1
+        self._max_inserted_per_leaf = max(self._max_inserted_per_leaf, len(leaf_faces))
+        return True
+
+    def _get_leaf_faces(self, node_index):
+        start = self._node_start[node_index]
+        faces = self._order[start:start + self._node_count[node_index]]
+        if node_index in self._inserted:
+            faces = faces.tolist() + self._inserted[node_index]
+        return faces
+
+    def _get_node_count(self, face_count, cache):
+        """ the number of nodes of a subtree containing the given number of faces """
+        if face_count <= self._leaf_size:
+            return 1
+        try:
+            return cache[face_count]
+        except KeyError:
+            half = face_count // 2
+            result = (1 + self._get_node_count(half, cache)
+                      + self._get_node_count(face_count - half, cache))
+            cache[face_count] = result
+            return result
+
+    def _build(self):
+        minx, miny, minz, maxx, maxy, maxz = self._face_bounds
+        # the center of the bounding box (doubled) of every face
+        centers = ([a + b for a, b in zip(minx, maxx)], [a + b for a, b in zip(miny, maxy)],
+                   [a + b for a, b in zip(minz, maxz)])
+        order = list(self._order)
+        node_counts_cache = {}
+        # The nodes are created in depth-first order. The second child of a node is put on the
+        # stack first - thus the first child is processed directly after its parent.
+        todo = [(0, len(order))]
+        while todo:
+            start, end = todo.pop()
+            node_index = len(self._node_skip)
+            self._node_skip.append(
+                node_index + self._get_node_count(end - start, node_counts_cache))
+            if end - start <= self._leaf_size:
+                self._node_start.append(start)
+                self._node_count.append(end - start)
+            else:
+                self._node_start.append(start)
+                self._node_count.append(0)
+                # split along the axis with the largest spread of face centers
+                spreads = []
+                for values in centers:
+                    axis_values = [values[index] for index in order[start:end]]
+                    spreads.append(max(axis_values) - min(axis_values))
+                axis_values = centers[spreads.index(max(spreads))]
+                order[start:end] = sorted(order[start:end], key=axis_values.__getitem__)
+                middle = start + (end - start) // 2
+                todo.append((middle, end))
+                todo.append((start, middle))
+        self._order = array.array("q", order)
+        # calculate the bounding boxes of the nodes (children are located behind their parent)
+        node_count = len(self._node_skip)
+        self._node_bounds = array.array("d", (0.0, ) * (6 * node_count))
+        for node_index in reversed(range(node_count)):
+            count = self._node_count[node_index]
+            if count > 0:
+                start = self._node_start[node_index]
+                faces = order[start:start + count]
+                box = [min(minx[index] for index in faces), min(miny[index] for index in faces),
+                       min(minz[index] for index in faces), max(maxx[index] for index in faces),
+                       max(maxy[index] for index in faces), max(maxz[index] for index in faces)]
+            else:
+                offset1 = 6 * (node_index + 1)
+                offset2 = 6 * self._node_skip[node_index + 1]
+                box1 = self._node_bounds[offset1:offset1 + 6]
+                box2 = self._node_bounds[offset2:offset2 + 6]
+                box = [min(box1[0], box2[0]), min(box1[1], box2[1]), min(box1[2], box2[2]),
+                       max(box1[3], box2[3]), max(box1[4], box2[4]), max(box1[5], box2[5])]
+            offset = 6 * node_index
+            self._node_bounds[offset:offset + 6] = array.array("d", box)
+
+    def search(self, minx, maxx, miny, maxy, minz=-INFINITE, maxz=INFINITE):
+        """ return the indices of all faces overlapping the given box """
+        result = []
+        node_bounds = self._node_bounds
+        node_skip = self._node_skip
+        node_count = self._node_count
+        face_minx, face_miny, face_minz, face_maxx, face_maxy, face_maxz = self._face_bounds
+        node_index = 0
+        while node_index < len(node_skip):
+            offset = 6 * node_index
+            if ((node_bounds[offset] > maxx) or (node_bounds[offset + 3] < minx)
+                    or (node_bounds[offset + 1] > maxy) or (node_bounds[offset + 4] < miny)
+                    or (node_bounds[offset + 2] > maxz) or (node_bounds[offset + 5] < minz)):
+                # skip the complete subtree
+                node_index = node_skip[node_index]
+                continue
+            if node_count[node_index] > 0:
+                for face_index in self._get_leaf_faces(node_index):
+                    if not ((face_minx[face_index] > maxx) or (face_maxx[face_index] < minx)
+                            or (face_miny[face_index] > maxy) or (face_maxy[face_index] < miny)
+                            or (face_minz[face_index] > maxz)
+                            or (face_maxz[face_index] < minz)):
+                        result.append(face_index)
+            node_index += 1
+        return result
+
+    def search_many(self, boxes):
+        """ search the faces overlapping each of the given boxes
+
+        The tree is traversed only once for all boxes: every node is checked against the boxes
+        that overlap its parent node.
+        Every box is a tuple (minx, maxx, miny, maxy, minz, maxz) - see "search".
+        The result is a list containing the face indices for every box.
+        """
+        boxes = list(boxes)
+        results = [[] for _ in boxes]
+        if not self._node_skip or not boxes:
+            return results
+        node_bounds = self._node_bounds
+        face_minx, face_miny, face_minz, face_maxx, face_maxy, face_maxz = self._face_bounds
+        todo = [(0, range(len(boxes)))]
+        while todo:
+            node_index, candidates = todo.pop()
+            offset = 6 * node_index
+            n_minx, n_miny, n_minz, n_maxx, n_maxy, n_maxz = node_bounds[offset:offset + 6]
+            active = [box_index for box_index in candidates
+                      if not ((n_minx > boxes[box_index][1]) or (n_maxx < boxes[box_index][0])
+                              or (n_miny > boxes[box_index][3])
+                              or (n_maxy < boxes[box_index][2])
+                              or (n_minz > boxes[box_index][5])
+                              or (n_maxz < boxes[box_index][4]))]
+            if not active:
+                continue
+            if self._node_count[node_index] > 0:
+                for face_index in self._get_leaf_faces(node_index):
+                    for box_index in active:
+                        minx, maxx, miny, maxy, minz, maxz = boxes[box_index]
+                        if not ((face_minx[face_index] > maxx) or (face_maxx[face_index] < minx)
+                                or (face_miny[face_index] > maxy)
+                                or (face_maxy[face_index] < miny)
+                                or (face_minz[face_index] > maxz)
+                                or (face_maxz[face_index] < minz)):
+                            results[box_index].append(face_index)
+            else:
+                # process the first child first
+                todo.append((self._node_skip[node_index + 1], active))
+                todo.append((node_index + 1, active))
+        return results
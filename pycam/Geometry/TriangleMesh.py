@@ -0,0 +1,325 @@
+"""
+compact storage of a triangle mesh
+
+The vertices and faces of a mesh are stored in contiguous arrays.  Derived per-face data (normals,
+bounding boxes and circumcircles) is calculated lazily.  "Triangle" objects are created only on
+request - they are cached afterwards in order to keep their identity stable.
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import array
+import heapq
+
+from pycam.Geometry.PointUtils import pcross, pdist, pdist_sq, pdot, pnorm, pnormalized, psub, \
+        ptransform_by_matrix
+from pycam.Geometry.Triangle import Triangle
+
+
+class TriangleMesh:
+    """ a sequence of triangles based on a vertex array and a face (vertex index) array
+
+    Every vertex consists of three consecutive values in "vertices".
+    Every face consists of three consecutive vertex indices in "faces".
+    """
+
+    def __init__(self):
+        self.vertices = array.array("d")
+        self.faces = array.array("q")
+        # the normals of all faces (three values per face) - explicitly given or calculated
+        self._normals = array.array("d")
+        # marker for faces with a known normal (explicitly given or already calculated)
+        self._normal_known = bytearray()
+        # lazily calculated face data - valid for the first "_face_data_count" faces
+        self._face_data_count = 0
+        self._bounds = tuple(array.array("d") for _ in range(6))
+        self._middles = array.array("d")
+        self._radii = array.array("d")
+        # face indices ordered by descending maximum height - created on demand
+        self._height_order = None
+        self._height_ranks = None
+        # face indices ordered by their lowest point - created on demand
+        self._bottom_order = None
+        # map a vertex (tuple) to its index - created on demand (see "add_vertex")
+        self._vertex_map = None
+        # cache of "Triangle" objects (by face index)
+        self._triangles = {}
+
+    def __getstate__(self):
+        # skip cached data for pickling (e.g. transfer to other processes)
+        return {"vertices": self.vertices, "faces": self.faces, "_normals": self._normals,
+                "_normal_known": self._normal_known}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
+    def get_buffers(self):
+        """ return the arrays defining the mesh (e.g. for storing it in a file)
+
+        All normals and the derived face data are calculated before.  Thus a mesh based on these
+        buffers does not need to modify them (see "from_buffers").
+        """
+        for index in range(len(self)):
+            self.get_normal(index)
+        self._update_face_data()
+        buffers = {"vertices": self.vertices, "faces": self.faces, "normals": self._normals,
+                   "normal_known": array.array("B", self._normal_known),
+                   "middles": self._middles, "radii": self._radii}
+        for key, values in zip(("minx", "miny", "minz", "maxx", "maxy", "maxz"), self._bounds):
+            buffers["bounds_" + key] = values
+        return buffers
+
+    @classmethod
+    def from_buffers(cls, buffers):
+        """ create a mesh based on the arrays returned by "get_buffers"
+
+        The buffers may also be read-only memoryviews (e.g. shared memory) instead of arrays.
+        Such a mesh cannot be changed.
+        """
+        result = cls()
+        result.vertices = buffers["vertices"]
+        result.faces = buffers["faces"]
+        result._normals = buffers["normals"]
+        result._normal_known = bytearray(buffers["normal_known"])
+        if "middles" in buffers:
+            result._bounds = tuple(buffers["bounds_" + key]
+                                   for key in ("minx", "miny", "minz", "maxx", "maxy", "maxz"))
+            result._middles = buffers["middles"]
+            result._radii = buffers["radii"]
+            result._face_data_count = len(result)
+        return result
+
+    def __len__(self):
+        return len(self.faces) // 3
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.get_triangle(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.get_triangle(one_index) for one_index in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Triangle index out of range: %d" % index)
+        return self.get_triangle(index)
+
+    def get_vertex(self, index):
+        offset = 3 * index
+        return tuple(self.vertices[offset:offset + 3])
+
+    def get_face_points(self, index):
+        offset = 3 * index
+        return tuple(self.get_vertex(vertex_index)
+                     for vertex_index in self.faces[offset:offset + 3])
+
+    def add_vertex(self, point):
+        """ add a vertex (if it does not exist yet) and return its index """
+        if self._vertex_map is None:
+            self._vertex_map = {self.get_vertex(index): index
+                                for index in range(len(self.vertices) // 3)}
+        point = (float(point[0]), float(point[1]), float(point[2]))
+        try:
+            return self._vertex_map[point]
+        except KeyError:
+            index = len(self.vertices) // 3
+            self.vertices.extend(point)
+            self._vertex_map[point] = index
+            return index
+
+    def add_face(self, index1, index2, index3, normal=None):
+        """ add a face based on the indices of three existing vertices
+
+        The normal is calculated lazily, if it is not given.
+        """
+        self.faces.extend((index1, index2, index3))
+        if normal is None:
+            self._normals.extend((0.0, 0.0, 0.0))
+            self._normal_known.append(0)
+        else:
+            self._normals.extend((normal[0], normal[1], normal[2]))
+            self._normal_known.append(1)
+        return len(self) - 1
+
+    def append(self, triangle):
+        """ add a "Triangle" object - it is returned later instead of a materialized copy """
+        index = self.add_face(self.add_vertex(triangle.p1), self.add_vertex(triangle.p2),
+                              self.add_vertex(triangle.p3), normal=triangle.normal)
+        self._triangles[index] = triangle
+
+    def extend(self, other):
+        """ append all faces of another mesh """
+        vertex_offset = len(self.vertices) // 3
+        self.vertices.extend(other.vertices)
+        self.faces.extend(vertex_index + vertex_offset for vertex_index in other.faces)
+        self._normals.extend(other._normals)
+        self._normal_known.extend(other._normal_known)
+        # the vertex map would contain duplicates - it is created again on demand
+        self._vertex_map = None
+
+    def copy(self):
+        result = self.__class__()
+        result.extend(self)
+        return result
+
+    def get_normal(self, index):
+        offset = 3 * index
+        if not self._normal_known[index]:
+            p1, p2, p3 = self.get_face_points(index)
+            # see Triangle.reset_cache
+            self._normals[offset:offset + 3] = array.array(
+                "d", pnormalized(pcross(psub(p3, p1), psub(p2, p1))))
+            self._normal_known[index] = 1
+        return tuple(self._normals[offset:offset + 3]) + ('v', )
+
+    def get_normals(self):
+        """ return the normals of all faces (three consecutive values per face)
+
+        Missing normals are calculated before (see "get_normal").
+        """
+        for index, known in enumerate(self._normal_known):
+            if not known:
+                self.get_normal(index)
+        return self._normals
+
+    def get_triangle(self, index):
+        try:
+            return self._triangles[index]
+        except KeyError:
+            p1, p2, p3 = self.get_face_points(index)
+            triangle = Triangle(p1, p2, p3, self.get_normal(index))
+            self._triangles[index] = triangle
+            return triangle
+
+    def _update_face_data(self):
+        """ calculate the bounding box and the circumcircle of all new faces """
+        minx, miny, minz, maxx, maxy, maxz = self._bounds
+        for index in range(self._face_data_count, len(self)):
+            p1, p2, p3 = self.get_face_points(index)
+            minx.append(min(p1[0], p2[0], p3[0]))
+            miny.append(min(p1[1], p2[1], p3[1]))
+            minz.append(min(p1[2], p2[2], p3[2]))
+            maxx.append(max(p1[0], p2[0], p3[0]))
+            maxy.append(max(p1[1], p2[1], p3[1]))
+            maxz.append(max(p1[2], p2[2], p3[2]))
+            # calculate circumcircle (see Triangle.reset_cache)
+            denom = pnorm(pcross(psub(p2, p1), psub(p3, p2)))
+            self._radii.append((pdist(p2, p1) * pdist(p3, p2) * pdist(p3, p1)) / (2 * denom))
+            denom2 = 2 * denom * denom
+            alpha = pdist_sq(p3, p2) * pdot(psub(p1, p2), psub(p1, p3)) / denom2
+            beta = pdist_sq(p1, p3) * pdot(psub(p2, p1), psub(p2, p3)) / denom2
+            gamma = pdist_sq(p1, p2) * pdot(psub(p3, p1), psub(p3, p2)) / denom2
+            self._middles.extend((p1[0] * alpha + p2[0] * beta + p3[0] * gamma,
+                                  p1[1] * alpha + p2[1] * beta + p3[1] * gamma,
+                                  p1[2] * alpha + p2[2] * beta + p3[2] * gamma))
+        self._face_data_count = len(self)
+
+    def get_bounds(self):
+        """ return six arrays (minx, miny, minz, maxx, maxy, maxz) containing a value per face """
+        self._update_face_data()
+        return self._bounds
+
+    def get_circumcircles(self):
+        """ return the middle points (three values per face) and the radius of each face """
+        self._update_face_data()
+        return self._middles, self._radii
+
+    def get_height_order(self):
+        """ return the face indices ordered by the maximum height of the faces (highest first) """
+        if (self._height_order is None) or (len(self._height_order) != len(self)):
+            maxz = self.get_bounds()[5]
+            self._height_order = array.array(
+                "q", sorted(range(len(self)), key=maxz.__getitem__, reverse=True))
+            # the position of every face within this order
+            self._height_ranks = array.array("q", bytes(8 * len(self)))
+            for rank, index in enumerate(self._height_order):
+                self._height_ranks[index] = rank
+        return self._height_order
+
+    def get_height_ranks(self):
+        """ return the position of every face within the order of "get_height_order" """
+        self.get_height_order()
+        return self._height_ranks
+
+    def get_faces_at_heights(self, heights, tolerance=0):
+        """ return the indices of the faces spanning each of the given heights
+
+        All heights are processed in a single sweep over the faces ordered by their lowest point.
+        The result contains a sorted list of face indices for every height.
+        """
+        minz, maxz = self.get_bounds()[2::3]
+        if (self._bottom_order is None) or (len(self._bottom_order) != len(self)):
+            self._bottom_order = array.array(
+                "q", sorted(range(len(self)), key=minz.__getitem__))
+        order = self._bottom_order
+        results = [None] * len(heights)
+        active = set()
+        # the faces of the active set ordered by their highest point
+        upper_ends = []
+        position = 0
+        for height_index in sorted(range(len(heights)), key=heights.__getitem__):
+            height = heights[height_index]
+            while (position < len(order)) and (minz[order[position]] <= height + tolerance):
+                face_index = order[position]
+                active.add(face_index)
+                heapq.heappush(upper_ends, (maxz[face_index], face_index))
+                position += 1
+            while upper_ends and (upper_ends[0][0] < height - tolerance):
+                active.discard(heapq.heappop(upper_ends)[1])
+            results[height_index] = sorted(active)
+        return results
+
+    def get_limits(self):
+        """ return the bounding box of the complete mesh or None for an empty mesh """
+        if not self:
+            return None
+        return tuple(min(values) for values in self.get_bounds()[:3]) \
+            + tuple(max(values) for values in self.get_bounds()[3:])
+
+    def transform_by_matrix(self, matrix, callback=None):
+        """ transform all vertices and normals
+
+        The normals are transformed (without normalization) just like the normals of "Triangle"
+        objects.  Thus all missing normals need to be calculated before.
+        """
+        for index in range(len(self)):
+            self.get_normal(index)
+        vertices = array.array("d")
+        for offset in range(0, len(self.vertices), 3):
+            vertices.extend(ptransform_by_matrix(tuple(self.vertices[offset:offset + 3]), matrix))
+        normals = array.array("d")
+        for index in range(len(self)):
+            normals.extend(ptransform_by_matrix(self.get_normal(index), matrix)[:3])
+            # run the callback - e.g. for a progress counter
+            if callback and callback():
+                # user requested abort: keep the previous state
+                return False
+        self.vertices = vertices
+        self._normals = normals
+        self.reset_cache()
+        return True
+
+    def reset_cache(self):
+        self._face_data_count = 0
+        self._bounds = tuple(array.array("d") for _ in range(6))
+        self._middles = array.array("d")
+        self._radii = array.array("d")
+        self._height_order = None
+        self._bottom_order = None
+        self._vertex_map = None
+        self._triangles = {}
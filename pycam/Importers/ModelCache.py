@@ -0,0 +1,183 @@
+"""
+persistent cache of imported models
+
+Parsing a model file and building its spatial index is repeated for every run of the command line
+interface.  The cache stores the result (the arrays of the triangle mesh and of its spatial index)
+in a binary file below a cache directory.  The name of the file is derived from the content of
+the model file (see "get_cache_key") - thus modified model files never use stale data.
+
+The cache file consists of a small header (including a JSON description of all arrays) followed
+by the raw content of the arrays.  Every array starts at an aligned offset.  The file is mapped
+into memory for loading and every array is copied in a single step.
+
+The cache is disabled by default (see "set_cache_directory").
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+from pycam.Geometry.Model import Model
+from pycam.Geometry.TriangleBVH import TriangleBVH
+from pycam.Geometry.TriangleMesh import TriangleMesh
+import pycam.Utils.log
+log = pycam.Utils.log.get_logger()
+
+
+MAGIC = b"PYCAMMDL"
+# increase the version whenever the layout of the stored arrays changes
+FORMAT_VERSION = 1
+FILENAME_SUFFIX = ".pycam-model"
+# magic, format version, length of the JSON header
+_PREFIX_FORMAT = "<8sII"
+_ALIGNMENT = 8
+
+_cache_directory = None
+
+
+def set_cache_directory(path):
+    """ enable the cache (storing its files in the given directory) or disable it (None) """
+    global _cache_directory
+    if path is not None:
+        # this may throw OSError
+        os.makedirs(path, exist_ok=True)
+    _cache_directory = path
+
+
+def get_cache_directory():
+    return _cache_directory
+
+
+def get_cache_key(content, importer_name, **parameters):
+    """ calculate a key based on the content of a model file and the import parameters """
+    digest = hashlib.sha256()
+    digest.update(content)
+    description = {"importer": importer_name, "format": FORMAT_VERSION, "parameters": parameters}
+    digest.update(json.dumps(description, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _get_cache_filename(key):
+    return os.path.join(_cache_directory, key + FILENAME_SUFFIX)
+
+
+def _align(offset):
+    return offset + (-offset) % _ALIGNMENT
+
+
+def store_model(key, model):
+    """ write the triangles and the spatial index of a model to the cache
+
+    Failures are not fatal - they are just reported.
+    """
+    if _cache_directory is None:
+        return False
+    groups = {"mesh": model.get_mesh().get_buffers()}
+    spatial_index = model.get_spatial_index()
+    if spatial_index is not None:
+        groups["index"] = spatial_index.get_buffers()
+    descriptions = []
+    buffers = []
+    offset = 0
+    for group_name, group in sorted(groups.items()):
+        for name, values in sorted(group.items()):
+            data = values.tobytes()
+            descriptions.append((group_name, name, values.typecode, values.itemsize, offset,
+                                 len(data)))
+            buffers.append((offset, data))
+            offset = _align(offset + len(data))
+    header = json.dumps({"byteorder": sys.byteorder, "name": model.name,
+                         "buffers": descriptions}).encode("utf-8")
+    data_start = _align(struct.calcsize(_PREFIX_FORMAT) + len(header))
+    try:
+        # write to a temporary file first - concurrent readers never see incomplete files
+        handle, temp_filename = tempfile.mkstemp(dir=_cache_directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as out_file:
+                out_file.write(struct.pack(_PREFIX_FORMAT, MAGIC, FORMAT_VERSION, len(header)))
+                out_file.write(header)
+                for buffer_offset, data in buffers:
+                    out_file.seek(data_start + buffer_offset)
+                    out_file.write(data)
+                # make sure that the file is complete (even for an empty last array)
+                out_file.truncate(data_start + offset)
+            os.replace(temp_filename, _get_cache_filename(key))
+        except OSError:
+            os.unlink(temp_filename)
+            raise
+    except OSError as exc:
+        log.warning("Failed to store model in cache directory (%s): %s", _cache_directory, exc)
+        return False
+    return True
+
+
+def _read_buffers(data):
+    """ parse the content of a cache file - returns None in case of an unsuitable file """
+    prefix_size = struct.calcsize(_PREFIX_FORMAT)
+    if len(data) < prefix_size:
+        return None
+    magic, version, header_length = struct.unpack_from(_PREFIX_FORMAT, data)
+    if (magic != MAGIC) or (version != FORMAT_VERSION):
+        return None
+    header = json.loads(bytes(data[prefix_size:prefix_size + header_length]).decode("utf-8"))
+    if header["byteorder"] != sys.byteorder:
+        return None
+    data_start = _align(prefix_size + header_length)
+    groups = {}
+    for group_name, name, typecode, itemsize, offset, length in header["buffers"]:
+        values = array.array(typecode)
+        if values.itemsize != itemsize:
+            # the file was created on a different platform
+            return None
+        start = data_start + offset
+        if start + length > len(data):
+            return None
+        values.frombytes(data[start:start + length])
+        groups.setdefault(group_name, {})[name] = values
+    return header, groups
+
+
+def load_model(key, use_kdtree=True):
+    """ return the cached model for the given key or None """
+    if _cache_directory is None:
+        return None
+    filename = _get_cache_filename(key)
+    try:
+        with open(filename, "rb") as cache_file:
+            with mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                result = _read_buffers(data)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        log.warning("Ignoring invalid model cache file (%s): %s", filename, exc)
+        return None
+    if result is None:
+        log.info("Ignoring incompatible model cache file: %s", filename)
+        return None
+    header, groups = result
+    model = Model(use_kdtree=use_kdtree)
+    model.name = header["name"]
+    spatial_index = TriangleBVH.from_buffers(groups["index"]) if "index" in groups else None
+    model.set_mesh(TriangleMesh.from_buffers(groups["mesh"]), spatial_index=spatial_index)
+    log.info("Loaded model from cache: %s", filename)
+    return model
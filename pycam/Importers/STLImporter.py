@@ -18,16 +18,19 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from io import BufferedReader, BytesIO, TextIOWrapper
+from io import BytesIO, TextIOWrapper
+import mmap
 import re
-from struct import unpack
+from struct import iter_unpack, unpack
 
 from pycam.errors import AbortOperationException, LoadFileError
 from pycam.Geometry import epsilon
 from pycam.Geometry.Model import Model
+from pycam.Geometry.PointHashGrid import PointHashGrid
 from pycam.Geometry.PointKdtree import PointKdtree
 from pycam.Geometry.PointUtils import pcross, pdot, pnormalized, psub
-from pycam.Geometry.Triangle import Triangle
+from pycam.Geometry.TriangleMesh import TriangleMesh
+import pycam.Importers.ModelCache
 import pycam.Utils.log
 import pycam.Utils
 log = pycam.Utils.log.get_logger()
@@ -36,6 +39,11 @@ log = pycam.Utils.log.get_logger()
 HEADER_SIZE = 80
 # The amount of bytes in the count field
 COUNT_SIZE = 4
+# normal, three vertices and the attribute field of a facet (binary format)
+FACET_FORMAT = "<12fH"
+FACET_SIZE = 50
+# the number of facets decoded in one step (binary format)
+FACET_CHUNK_SIZE = 16384
 
 vertices = 0
 edges = 0
@@ -69,8 +77,11 @@ def get_facet_count_if_binary_format(source):
     available for remote sources (e.g. via http). Thus we stick to the simple check.
     """
     # read data (without consuming it)
-    raw_header_data = source.peek(400)
+    return _get_facet_count_from_header(source.peek(400))
 
+
+def _get_facet_count_from_header(raw_header_data):
+    """ see "get_facet_count_if_binary_format" """
     facet_count = unpack(
         "<I", raw_header_data[HEADER_SIZE:HEADER_SIZE + COUNT_SIZE]
     )[0]
@@ -87,31 +98,129 @@ def get_facet_count_if_binary_format(source):
         return facet_count
 
 
+def _open_model_data(filename):
+    """ return the content of a local file (memory-mapped) or a remote file (as bytes) """
+    uri = pycam.Utils.URIHandler(filename)
+    try:
+        if uri.is_local():
+            with open(uri.get_local_path(), "rb") as local_file:
+                try:
+                    # the mapping stays valid after closing the file
+                    return mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # empty files cannot be mapped
+                    return b""
+        else:
+            url_file = uri.open()
+            try:
+                return url_file.read()
+            finally:
+                url_file.close()
+    except IOError as exc:
+        raise LoadFileError("STLImporter: Failed to read file ({}): {}".format(filename, exc))
+
+
+def _import_binary_facets(data, facet_count, model, use_kdtree, callback, filename):
+    """ decode the facets of a binary STL file in chunks and add them to the model
+
+    The input data may be memory-mapped: only one chunk of facets is decoded at a time.
+    Nearby vertices are merged (see PointHashGrid) - similar to the kdtree of the text format.
+    """
+    if len(data) < HEADER_SIZE + COUNT_SIZE + FACET_SIZE * facet_count:
+        raise LoadFileError("STLImporter: incomplete binary file ({}): {:d} facets expected"
+                            .format(filename, facet_count))
+    normal_conflict_warning_seen = False
+    grid = PointHashGrid(epsilon if use_kdtree else None)
+    get_index = grid.get_index
+    vertices = grid.vertices
+    mesh = TriangleMesh()
+    add_face = mesh.add_face
+    data_view = memoryview(data)
+    facet_index = 0
+    try:
+        for chunk_start in range(0, facet_count, FACET_CHUNK_SIZE):
+            if callback and callback():
+                raise AbortOperationException("STLImporter: load model operation cancelled")
+            chunk_end = min(facet_count, chunk_start + FACET_CHUNK_SIZE)
+            chunk = data_view[HEADER_SIZE + COUNT_SIZE + FACET_SIZE * chunk_start:
+                              HEADER_SIZE + COUNT_SIZE + FACET_SIZE * chunk_end]
+            for (a1, a2, a3, v11, v12, v13, v21, v22, v23, v31, v32, v33,
+                 _) in iter_unpack(FACET_FORMAT, chunk):
+                facet_index += 1
+                index1 = get_index(v11, v12, v13)
+                index2 = get_index(v21, v22, v23)
+                index3 = get_index(v31, v32, v33)
+                x1, y1, z1 = vertices[3 * index1:3 * index1 + 3]
+                x2, y2, z2 = vertices[3 * index2:3 * index2 + 3]
+                x3, y3, z3 = vertices[3 * index3:3 * index3 + 3]
+                # the cross product of (p2 - p1) and (p3 - p1)
+                cross_x = (y2 - y1) * (z3 - z1) - (z2 - z1) * (y3 - y1)
+                cross_y = (z2 - z1) * (x3 - x1) - (x2 - x1) * (z3 - z1)
+                cross_z = (x2 - x1) * (y3 - y1) - (y2 - y1) * (x3 - x1)
+                if a1 == a2 == a3 == 0:
+                    dotcross = cross_z
+                    normal = None
+                else:
+                    dotcross = a1 * cross_x + a2 * cross_y + a3 * cross_z
+                    normal = (a1, a2, a3)
+                if dotcross > 0:
+                    # Triangle expects the vertices in clockwise order
+                    add_face(index1, index3, index2, normal=normal)
+                elif dotcross < 0:
+                    if not normal_conflict_warning_seen:
+                        log.warn("Inconsistent normal/vertices found in facet definition %d of "
+                                 "'%s'. Please validate the STL file!", facet_index, filename)
+                        normal_conflict_warning_seen = True
+                    add_face(index1, index2, index3, normal=normal)
+                else:
+                    # the three points are in a line - or two points are identical
+                    # usually this is caused by points, that are too close together
+                    # check the tolerance value in pycam/Geometry/PointHashGrid.py
+                    log.warn("Skipping invalid triangle: %s / %s / %s (maybe the resolution of "
+                             "the model is too high?)", (x1, y1, z1), (x2, y2, z2), (x3, y3, z3))
+    finally:
+        # release the memory-mapped data
+        data_view.release()
+    mesh.vertices = vertices
+    model.set_mesh(mesh)
+
+
 def import_model(filename, use_kdtree=True, callback=None, **kwargs):
+    if hasattr(filename, "read"):
+        # streams are not cached
+        return _import_model_data(filename.read(), "input stream", use_kdtree, callback,
+                                  use_cache=False)
+    data = _open_model_data(filename)
+    try:
+        return _import_model_data(data, filename, use_kdtree, callback, use_cache=True)
+    finally:
+        # release the memory-mapped file (also in case of errors or cached models)
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def _import_model_data(data, filename, use_kdtree, callback, use_cache):
+    """ parse the content of an STL file
+
+    @param filename: the name of the file (used for error messages)
+    """
     global vertices, edges, kdtree
     vertices = 0
     edges = 0
     kdtree = None
 
     normal_conflict_warning_seen = False
+    cache_key = None
 
-    if hasattr(filename, "read"):
-        # make sure that the input stream can seek and has ".len"
-        f = BufferedReader(filename)
-        # useful for later error messages
-        filename = "input stream"
-    else:
-        try:
-            url_file = pycam.Utils.URIHandler(filename).open()
-            # urllib.urlopen objects do not support "seek" - so we need a buffered reader
-            # Is there a better approach than consuming the whole file at once?
-            f = BufferedReader(BytesIO(url_file.read()))
-            url_file.close()
-        except IOError as exc:
-            raise LoadFileError("STLImporter: Failed to read file ({}): {}".format(filename, exc))
+    if use_cache and (pycam.Importers.ModelCache.get_cache_directory() is not None):
+        cache_key = pycam.Importers.ModelCache.get_cache_key(data, "STL",
+                                                             use_kdtree=bool(use_kdtree))
+        model = pycam.Importers.ModelCache.load_model(cache_key, use_kdtree=use_kdtree)
+        if model:
+            return model
 
     # the facet count is only available for the binary format
-    facet_count = get_facet_count_if_binary_format(f)
+    facet_count = _get_facet_count_from_header(data[:400])
     is_binary = (facet_count is not None)
 
     if use_kdtree:
@@ -124,67 +233,10 @@ def import_model(filename, use_kdtree=True, callback=None, **kwargs):
     p3 = None
 
     if is_binary:
-        # Skip the header and count fields of binary stl file
-        f.seek(HEADER_SIZE + COUNT_SIZE)
-
-        for i in range(1, facet_count + 1):
-            if callback and callback():
-                raise AbortOperationException("STLImporter: load model operation cancelled")
-            a1 = unpack("<f", f.read(4))[0]
-            a2 = unpack("<f", f.read(4))[0]
-            a3 = unpack("<f", f.read(4))[0]
-
-            n = (float(a1), float(a2), float(a3), 'v')
-
-            v11 = unpack("<f", f.read(4))[0]
-            v12 = unpack("<f", f.read(4))[0]
-            v13 = unpack("<f", f.read(4))[0]
-
-            p1 = get_unique_vertex(float(v11), float(v12), float(v13))
-
-            v21 = unpack("<f", f.read(4))[0]
-            v22 = unpack("<f", f.read(4))[0]
-            v23 = unpack("<f", f.read(4))[0]
-
-            p2 = get_unique_vertex(float(v21), float(v22), float(v23))
-
-            v31 = unpack("<f", f.read(4))[0]
-            v32 = unpack("<f", f.read(4))[0]
-            v33 = unpack("<f", f.read(4))[0]
-
-            p3 = get_unique_vertex(float(v31), float(v32), float(v33))
-
-            # not used (additional attributes)
-            f.read(2)
-
-            dotcross = pdot(n, pcross(psub(p2, p1), psub(p3, p1)))
-            if a1 == a2 == a3 == 0:
-                dotcross = pcross(psub(p2, p1), psub(p3, p1))[2]
-                n = None
-
-            if dotcross > 0:
-                # Triangle expects the vertices in clockwise order
-                t = Triangle(p1, p3, p2)
-            elif dotcross < 0:
-                if not normal_conflict_warning_seen:
-                    log.warn("Inconsistent normal/vertices found in facet definition %d of '%s'. "
-                             "Please validate the STL file!", i, filename)
-                    normal_conflict_warning_seen = True
-                t = Triangle(p1, p2, p3)
-            else:
-                # the three points are in a line - or two points are identical
-                # usually this is caused by points, that are too close together
-                # check the tolerance value in pycam/Geometry/PointKdtree.py
-                log.warn("Skipping invalid triangle: %s / %s / %s (maybe the resolution of the "
-                         "model is too high?)", p1, p2, p3)
-                continue
-            if n:
-                t.normal = n
-
-            model.append(t)
+        _import_binary_facets(data, facet_count, model, use_kdtree, callback, filename)
     else:
         # from here on we want to use a text based input stream (not bytes)
-        f = TextIOWrapper(f, encoding="utf-8")
+        f = TextIOWrapper(BytesIO(data), encoding="utf-8")
         solid = re.compile(r"\s*solid\s+(\w+)\s+.*")
         endsolid = re.compile(r"\s*endsolid\s*")
         facet = re.compile(r"\s*facet\s*")
@@ -260,13 +312,13 @@ def import_model(filename, use_kdtree=True, callback=None, **kwargs):
                     dotcross = pdot(n, pcross(psub(p2, p1), psub(p3, p1)))
                 if dotcross > 0:
                     # Triangle expects the vertices in clockwise order
-                    t = Triangle(p1, p3, p2, n)
+                    t = (p1, p3, p2)
                 elif dotcross < 0:
                     if not normal_conflict_warning_seen:
                         log.warn("Inconsistent normal/vertices found in line %d of '%s'. Please "
                                  "validate the STL file!", current_line, filename)
                         normal_conflict_warning_seen = True
-                    t = Triangle(p1, p2, p3, n)
+                    t = (p1, p2, p3)
                 else:
                     # The three points are in a line - or two points are
                     # identical. Usually this is caused by points, that are too
@@ -276,8 +328,8 @@ def import_model(filename, use_kdtree=True, callback=None, **kwargs):
                              "the model is too high?)", p1, p2, p3)
                     n, p1, p2, p3 = (None, None, None, None)
                     continue
+                model.add_triangle(*t, normal=n)
                 n, p1, p2, p3 = (None, None, None, None)
-                model.append(t)
                 continue
             m = endsolid.match(line)
             if m:
@@ -293,4 +345,6 @@ def import_model(filename, use_kdtree=True, callback=None, **kwargs):
         # no valid items added to the model
         raise LoadFileError("Failed to load model from STL file: no elements found")
     else:
+        if cache_key is not None:
+            pycam.Importers.ModelCache.store_model(cache_key, model)
         return model
@@ -20,11 +20,18 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 
 import pycam.Geometry.Model
 from pycam.PathGenerators import get_max_height_dynamic
+from pycam.Toolpath.SegmentOrder import iterate_optimized_layers
 from pycam.Toolpath.Steps import MoveStraight, MoveSafety
 from pycam.Utils import ProgressCounter
 from pycam.Utils.threading import run_in_parallel
 import pycam.Utils.log
 
+try:
+    from pycam.PathGenerators.VectorizedDrop import get_max_heights, is_cutter_supported
+except ImportError:
+    # numpy is not available: use the (slower) calculation based on single triangles
+    get_max_heights = None
+
 log = pycam.Utils.log.get_logger()
 
 
@@ -35,35 +42,82 @@ def _process_one_grid_line(extra_args):
     Otherwise the dynamic over-sampling (in get_max_height_dynamic) is
     pointless.
     """
-    positions, minz, maxz, model, cutter = extra_args
-    return get_max_height_dynamic(model, cutter, positions, minz, maxz)
+    positions, minz, maxz, model, cutter, use_vectorized = extra_args
+    if use_vectorized and (get_max_heights is not None):
+        return get_max_height_dynamic(model, cutter, positions, minz, maxz,
+                                      get_max_heights=get_max_heights)
+    else:
+        return get_max_height_dynamic(model, cutter, positions, minz, maxz)
 
 
 class DropCutter:
 
+    def __init__(self, vectorized=None, optimize_travel=False):
+        """ the vectorized calculation (based on numpy) is used by default, if it is available
+
+        @param vectorized: enable (True) or disable (False) the vectorized calculation or
+            choose automatically (None)
+        @param optimize_travel: reorder the segments of every layer for short travel moves (see
+            pycam.Toolpath.SegmentOrder)
+        """
+        if vectorized and (get_max_heights is None):
+            log.warning("DropCutter: the vectorized calculation requires the python package "
+                        "'numpy' - falling back to the non-vectorized calculation")
+        self.vectorized = (vectorized is not False) and (get_max_heights is not None)
+        self.optimize_travel = optimize_travel
+
     def generate_toolpath(self, cutter, models, motion_grid, minz=None, maxz=None,
                           draw_callback=None):
         path = []
+        if draw_callback:
+            # visualize the partial toolpath
+            progress_callback = lambda **kwargs: draw_callback(toolpath=path, **kwargs)
+        else:
+            progress_callback = None
+        for step in self.iterate_toolpath(cutter, models, motion_grid, minz=minz, maxz=maxz,
+                                          draw_callback=progress_callback):
+            path.append(step)
+        return path
+
+    def iterate_toolpath(self, cutter, models, motion_grid, minz=None, maxz=None,
+                         draw_callback=None):
+        """ deliver the moves of the toolpath one by one (see "generate_toolpath")
+
+        The moves of a grid line are available as soon as the line is calculated.  Reordered
+        moves (see "optimize_travel") are available as soon as their layer is calculated.
+        """
+        moves = self._iterate_layer_moves(cutter, models, motion_grid, minz, maxz,
+                                          draw_callback)
+        if self.optimize_travel:
+            return iterate_optimized_layers(moves)
+        else:
+            return (step for step in moves if step is not None)
+
+    def _iterate_layer_moves(self, cutter, models, motion_grid, minz, maxz, draw_callback):
+        """ deliver the moves of the toolpath - the end of every layer is marked with None """
         quit_requested = False
         model = pycam.Geometry.Model.get_combined_model(models)
 
         # Transfer the grid (a generator) into a list of lists and count the
         # items.
         lines = []
+        layer_ends = set()
         # usually there is only one layer - but an xy-grid consists of two
         for layer in motion_grid:
             for line in layer:
                 lines.append(line)
+            layer_ends.add(len(lines))
 
         num_of_lines = len(lines)
         progress_counter = ProgressCounter(len(lines), draw_callback)
         current_line = 0
 
+        use_vectorized = self.vectorized and is_cutter_supported(cutter)
         args = []
         for one_grid_line in lines:
             # simplify the data (useful for remote processing)
             xy_coords = [(pos[0], pos[1]) for pos in one_grid_line]
-            args.append((xy_coords, minz, maxz, model, cutter))
+            args.append((xy_coords, minz, maxz, model, cutter, use_vectorized))
         for points in run_in_parallel(_process_one_grid_line, args,
                                       callback=progress_counter.update):
             if draw_callback and draw_callback(
@@ -74,18 +128,19 @@ class DropCutter:
             for point in points:
                 if point is None:
                     # exceeded maxz - the cutter has to skip this point
-                    path.append(MoveSafety())
+                    yield MoveSafety()
                 else:
-                    path.append(MoveStraight(point))
+                    yield MoveStraight(point)
                 # The progress counter may return True, if cancel was requested.
-                if draw_callback and draw_callback(tool_position=point, toolpath=path):
+                if draw_callback and draw_callback(tool_position=point):
                     quit_requested = True
                     break
             # add a move to safety height after each line of moves
-            path.append(MoveSafety())
+            yield MoveSafety()
             progress_counter.increment()
             # update progress
             current_line += 1
+            if current_line in layer_ends:
+                yield None
             if quit_requested:
                 break
-        return path
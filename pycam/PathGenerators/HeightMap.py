@@ -0,0 +1,355 @@
+"""
+approximate drop-cutter calculation based on a rasterized height field
+
+The model is rasterized once into a grid of square cells (a z-buffer).  The cutter location at a
+position is the morphological dilation of the height field with the profile of the tool.  This is
+much faster than dropping the cutter onto single triangles - but it is only an approximation.
+
+Two height fields are collected for every cell:
+    * upper: no point of the surface within the cell is higher
+    * lower: the height of the surface at the center of the cell (if covered by a triangle)
+
+The dilation of "upper" (using the smallest distance between the position and a cell) never lifts
+the cutter less than the exact calculation.  Thus the resulting toolpath never cuts into the
+model.  The dilation of "lower" (using the distance to the center of a cell) never lifts it more
+than the exact calculation.  The difference of both is reported as the approximation error: the
+exact height of the cutter lies between both.  Large deviations occur only close to steep flanks
+of the model, since the horizontal position of a contact is known only up to the size of a cell.
+
+This module requires numpy.  Callers are supposed to catch the ImportError.
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+# this import requires numpy (optional) - see the module documentation above
+import numpy
+
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+import pycam.Geometry.Model
+from pycam.Geometry import epsilon
+from pycam.PathGenerators import _check_deviance_of_adjacent_points
+from pycam.Toolpath.SegmentOrder import iterate_optimized_layers
+from pycam.Toolpath.Steps import MoveStraight, MoveSafety
+from pycam.Utils import ProgressCounter
+import pycam.Utils.log
+
+log = pycam.Utils.log.get_logger()
+
+
+# the default resolution of the height field (relative to the radius of the tool)
+DEFAULT_RESOLUTION_FACTOR = 0.125
+# maximum number of pairs of triangles and cells processed at once during rasterization
+RASTER_BLOCK_SIZE = 2 ** 20
+
+
+def _get_profile_radii(cutter):
+    """ return the major and the minor radius of the tool (every tool is treated as a torus) """
+    if isinstance(cutter, ToroidalCutter):
+        return cutter.majorradius, cutter.minorradius
+    elif isinstance(cutter, SphericalCutter):
+        return 0, cutter.radius
+    elif isinstance(cutter, CylindricalCutter):
+        return cutter.radius, 0
+    else:
+        return None
+
+
+def is_cutter_supported(cutter):
+    return _get_profile_radii(cutter) is not None
+
+
+def get_profile_heights(cutter, distances):
+    """ calculate the height of the tool's lower surface at the given distances from its axis
+
+    The height is relative to the cutter location.  The required distance (e.g. material
+    allowance) of the cutter is included.  Distances beyond the radius of the tool are not
+    handled.
+    """
+    majorradius, minorradius = _get_profile_radii(cutter)
+    distance = cutter.get_required_distance()
+    outer = numpy.maximum(numpy.asarray(distances, dtype=float) - majorradius, 0)
+    return minorradius - numpy.sqrt(numpy.maximum((minorradius + distance) ** 2 - outer ** 2, 0))
+
+
+def _remove_straight_points(points):
+    """ remove all points that are in line with their neighbours (see get_max_height_dynamic)
+
+    Unreachable positions (None) are kept.
+    """
+    result = []
+    for point in points:
+        if (point is not None) and (len(result) > 1) and (result[-1] is not None) \
+                and (result[-2] is not None) \
+                and _check_deviance_of_adjacent_points(result[-2], result[-1], point, 0):
+            result[-1] = point
+        else:
+            result.append(point)
+    return result
+
+
+def _expand_ranges(starts, counts):
+    """ enumerate consecutive ranges of integers
+
+    Returns the index of the range and the value for every item of all ranges.
+    """
+    owners = numpy.repeat(numpy.arange(len(counts)), counts)
+    offsets = numpy.arange(len(owners)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    return owners, starts[owners] + offsets
+
+
+def _get_strip_ranges(points, lows, highs):
+    """ calculate the y range of triangles (three points each) within vertical strips
+
+    The strip of every triangle is given by the x values "lows" and "highs".  Triangles outside
+    of their strip get an empty range (the low value exceeds the high value).
+    """
+    result_low = numpy.full(len(points), numpy.inf)
+    result_high = numpy.full(len(points), -numpy.inf)
+    for index in range(3):
+        start_x, start_y = points[:, index, 0], points[:, index, 1]
+        end_x, end_y = points[:, (index + 1) % 3, 0], points[:, (index + 1) % 3, 1]
+        candidates = [((start_x >= lows) & (start_x <= highs), start_y)]
+        # the intersections of the edge with both borders of the strip
+        with numpy.errstate(all="ignore"):
+            for border in (lows, highs):
+                crossing = (numpy.minimum(start_x, end_x) <= border) \
+                    & (border <= numpy.maximum(start_x, end_x)) & (start_x != end_x)
+                candidates.append((crossing, start_y + (border - start_x) * (end_y - start_y)
+                                   / (end_x - start_x)))
+        for valid, values in candidates:
+            result_low = numpy.where(valid, numpy.minimum(result_low, values), result_low)
+            result_high = numpy.where(valid, numpy.maximum(result_high, values), result_high)
+    return result_low, result_high
+
+
+class HeightField:
+    """ the rasterized heights of a model within a rectangular area
+
+    The cell (i, j) covers the area starting at (minx + i * resolution, miny + j * resolution).
+    Cells without a triangle contain negative infinity.
+    """
+
+    def __init__(self, minx, miny, maxx, maxy, resolution):
+        self.minx = minx
+        self.miny = miny
+        self.resolution = resolution
+        shape = (max(1, int(numpy.ceil((maxx - minx) / resolution))),
+                 max(1, int(numpy.ceil((maxy - miny) / resolution))))
+        self.upper = numpy.full(shape, -numpy.inf)
+        self.lower = numpy.full(shape, -numpy.inf)
+
+    def get_cell_indices(self, xs, ys):
+        """ return the (clipped) cell indices of the given coordinates """
+        xs = numpy.floor((numpy.asarray(xs, dtype=float) - self.minx) / self.resolution)
+        ys = numpy.floor((numpy.asarray(ys, dtype=float) - self.miny) / self.resolution)
+        return (numpy.clip(xs, 0, self.upper.shape[0] - 1).astype(int),
+                numpy.clip(ys, 0, self.upper.shape[1] - 1).astype(int))
+
+    def add_mesh(self, mesh):
+        """ rasterize all triangles of a mesh (see pycam.Geometry.TriangleMesh)
+
+        Every triangle is split into the columns of cells covered by its bounding box.  The
+        range of cells within a column is calculated from the part of the triangle within the
+        column.
+        """
+        if not len(mesh):
+            return
+        buffers = mesh.get_buffers()
+        vertices = numpy.frombuffer(buffers["vertices"], dtype=float).reshape((-1, 3))
+        faces = numpy.frombuffer(buffers["faces"], dtype=buffers["faces"].typecode)
+        points = vertices[faces.reshape((-1, 3))]
+        # the plane of every triangle: z = base + slope_x * x + slope_y * y
+        normals = numpy.cross(points[:, 1] - points[:, 0], points[:, 2] - points[:, 0])
+        flat = numpy.abs(normals[:, 2]) > epsilon * numpy.sqrt((normals ** 2).sum(axis=1))
+        slopes = numpy.zeros((len(points), 2))
+        slopes[flat] = -normals[flat, :2] / normals[flat, 2:]
+        bases = points[:, 0, 2] - (slopes * points[:, 0, :2]).sum(axis=1)
+        # the highest point of the plane within a cell is one of its corners
+        corner_offsets = numpy.abs(slopes).sum(axis=1) * (self.resolution / 2)
+        maxz = points[:, :, 2].max(axis=1)
+        # the drop calculation of the cutters ignores the back side of triangles
+        use_lower = flat & (numpy.frombuffer(buffers["normals"], dtype=float)[2::3] > 0)
+        # split the triangles into columns
+        first_columns = self.get_cell_indices(points[:, :, 0].min(axis=1), 0)[0]
+        last_columns = self.get_cell_indices(points[:, :, 0].max(axis=1), 0)[0]
+        column_triangles, columns = _expand_ranges(first_columns,
+                                                   last_columns - first_columns + 1)
+        column_points = points[column_triangles]
+        column_starts = self.minx + columns * self.resolution
+        lows, highs = _get_strip_ranges(column_points, column_starts,
+                                        column_starts + self.resolution)
+        center_lows, center_highs = _get_strip_ranges(
+            column_points, column_starts + self.resolution / 2,
+            column_starts + self.resolution / 2)
+        first_rows = self.get_cell_indices(0, lows)[1]
+        row_counts = numpy.where(lows <= highs,
+                                 self.get_cell_indices(0, highs)[1] - first_rows + 1, 0)
+        # process the cells in blocks
+        column_start = 0
+        while column_start < len(columns):
+            column_end = column_start + 1 + int(numpy.searchsorted(
+                numpy.cumsum(row_counts[column_start + 1:]),
+                RASTER_BLOCK_SIZE - row_counts[column_start], side="right"))
+            block = slice(column_start, column_end)
+            owners, rows = _expand_ranges(first_rows[block], row_counts[block])
+            owners += column_start
+            cells = (columns[owners], rows)
+            triangles = column_triangles[owners]
+            centers_x = self.minx + (cells[0] + 0.5) * self.resolution
+            centers_y = self.miny + (rows + 0.5) * self.resolution
+            center_heights = bases[triangles] + slopes[triangles, 0] * centers_x \
+                + slopes[triangles, 1] * centers_y
+            upper = numpy.where(flat[triangles],
+                                numpy.minimum(center_heights + corner_offsets[triangles],
+                                              maxz[triangles]),
+                                maxz[triangles])
+            numpy.maximum.at(self.upper, cells, upper)
+            # the center of the cell needs to be inside of the triangle
+            lower = use_lower[triangles] & (centers_y >= center_lows[owners]) \
+                & (centers_y <= center_highs[owners])
+            numpy.maximum.at(self.lower, (cells[0][lower], rows[lower]), center_heights[lower])
+            column_start = column_end
+
+    def get_cutter_heights(self, cutter, xs, ys):
+        """ calculate the range of the cutter location heights at the given positions
+
+        Returns two arrays: the upper limit (safe) and the lower limit of the exact height.
+        Positions without any triangle within reach of the cutter get negative infinity.
+        """
+        reach = cutter.distance_radius
+        xs = numpy.asarray(xs, dtype=float)
+        ys = numpy.asarray(ys, dtype=float)
+        cells_x, cells_y = self.get_cell_indices(xs, ys)
+        offset_limit = int(numpy.ceil(reach / self.resolution)) + 1
+        offsets_x, offsets_y = (values.ravel() for values in numpy.meshgrid(
+            numpy.arange(-offset_limit, offset_limit + 1),
+            numpy.arange(-offset_limit, offset_limit + 1), indexing="ij"))
+        # skip neighbour cells that are out of reach for every point within a cell
+        gaps = self.resolution * numpy.hypot(numpy.maximum(numpy.abs(offsets_x) - 1, 0),
+                                             numpy.maximum(numpy.abs(offsets_y) - 1, 0))
+        padded_upper = numpy.pad(self.upper, offset_limit, constant_values=-numpy.inf)
+        padded_lower = numpy.pad(self.lower, offset_limit, constant_values=-numpy.inf)
+        upper = numpy.full(len(xs), -numpy.inf)
+        lower = numpy.full(len(xs), -numpy.inf)
+        # the position relative to the lower left corner of its cell
+        local_x = xs - (self.minx + cells_x * self.resolution)
+        local_y = ys - (self.miny + cells_y * self.resolution)
+        for offset_x, offset_y in zip(offsets_x[gaps <= reach], offsets_y[gaps <= reach]):
+            # the distances to the neighbour cell (upper) and to its center (lower)
+            start_x = offset_x * self.resolution - local_x
+            start_y = offset_y * self.resolution - local_y
+            gap_distances = numpy.hypot(
+                numpy.maximum(numpy.maximum(start_x, 0), -(start_x + self.resolution)),
+                numpy.maximum(numpy.maximum(start_y, 0), -(start_y + self.resolution)))
+            center_distances = numpy.hypot(start_x + self.resolution / 2,
+                                           start_y + self.resolution / 2)
+            neighbours = (cells_x + offset_limit + offset_x, cells_y + offset_limit + offset_y)
+            for heights, padded, distances in ((upper, padded_upper, gap_distances),
+                                               (lower, padded_lower, center_distances)):
+                candidates = padded[neighbours] - get_profile_heights(cutter, distances)
+                numpy.maximum(heights, numpy.where(distances <= reach, candidates, -numpy.inf),
+                              out=heights)
+        return upper, lower
+
+
+class HeightMapCutter:
+
+    def __init__(self, resolution=None, optimize_travel=False):
+        """ the height field is rasterized with the given size of cells
+
+        @param resolution: the width of a cell or None (relative to the size of the tool)
+        @param optimize_travel: reorder the segments of every layer for short travel moves (see
+            pycam.Toolpath.SegmentOrder)
+        """
+        self.resolution = resolution
+        self.optimize_travel = optimize_travel
+        # the maximum deviation from the exact cutter height during the last calculation
+        self.error_bound = None
+
+    def get_height_field(self, cutter, model, minx, miny, maxx, maxy):
+        """ rasterize the model for all cutter positions within the given rectangle """
+        if self.resolution is None:
+            resolution = cutter.radius * DEFAULT_RESOLUTION_FACTOR
+        else:
+            resolution = self.resolution
+        reach = cutter.distance_radius + resolution
+        height_field = HeightField(minx - reach, miny - reach, maxx + reach, maxy + reach,
+                                   resolution)
+        if model is not None:
+            height_field.add_mesh(model.get_mesh())
+        return height_field
+
+    def generate_toolpath(self, cutter, models, motion_grid, minz=None, maxz=None,
+                          draw_callback=None):
+        if not is_cutter_supported(cutter):
+            raise TypeError("Unsupported cutter type for height maps: %s" % type(cutter))
+        moves = self._get_layer_moves(cutter, models, motion_grid, minz, maxz, draw_callback)
+        if self.optimize_travel:
+            return list(iterate_optimized_layers(moves))
+        else:
+            return [step for step in moves if step is not None]
+
+    def _get_layer_moves(self, cutter, models, motion_grid, minz, maxz, draw_callback):
+        """ return the moves of the toolpath - the end of every layer is marked with None """
+        path = []
+        model = pycam.Geometry.Model.get_combined_model(models)
+        lines = []
+        layer_ends = set()
+        # usually there is only one layer - but an xy-grid consists of two
+        for layer in motion_grid:
+            lines.extend([(pos[0], pos[1]) for pos in line] for line in layer)
+            layer_ends.add(len(lines))
+        progress_counter = ProgressCounter(len(lines) + 1, draw_callback)
+        positions = [pos for line in lines for pos in line]
+        if not positions:
+            return path
+        xs = numpy.array([pos[0] for pos in positions], dtype=float)
+        ys = numpy.array([pos[1] for pos in positions], dtype=float)
+        if draw_callback and draw_callback(text="HeightMap: rasterizing model"):
+            return path
+        height_field = self.get_height_field(cutter, model, xs.min(), ys.min(), xs.max(),
+                                             ys.max())
+        upper, lower = height_field.get_cutter_heights(cutter, xs, ys)
+        upper = numpy.maximum(upper, minz)
+        lower = numpy.maximum(lower, minz)
+        reachable = upper <= maxz + epsilon
+        self.error_bound = float((upper - lower)[reachable].max(initial=0))
+        log.info("HeightMap: the cutter locations deviate up to %g vertically from the exact "
+                 "surface (resolution: %g)", self.error_bound, height_field.resolution)
+        if progress_counter.increment():
+            return path
+        heights = iter(zip(upper.tolist(), reachable.tolist()))
+        for line_index, line in enumerate(lines):
+            if draw_callback and draw_callback(
+                    text="HeightMap: processing line %d/%d" % (line_index + 1, len(lines))):
+                break
+            points = [(x, y, height) if is_reachable else None
+                      for (x, y), (height, is_reachable) in zip(line, heights)]
+            for point in _remove_straight_points(points):
+                if point is None:
+                    # exceeded maxz - the cutter has to skip this point
+                    path.append(MoveSafety())
+                else:
+                    path.append(MoveStraight(point))
+            # add a move to safety height after each line of moves
+            path.append(MoveSafety())
+            if line_index + 1 in layer_ends:
+                path.append(None)
+            if progress_counter.increment():
+                break
+        return path
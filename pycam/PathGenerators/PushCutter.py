@@ -18,11 +18,13 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from pycam.PathGenerators import get_free_paths_triangles
+from pycam.PathGenerators import get_free_paths_triangles, ScanlineCache
 import pycam.PathProcessors.ContourCutter
 from pycam.Utils.threading import run_in_parallel
 from pycam.Utils import ProgressCounter
 import pycam.Utils.log
+from pycam.Toolpath import MOVE_SAFETY
+from pycam.Toolpath.SegmentOrder import iterate_optimized_layers
 from pycam.Toolpath.Steps import MoveStraight, MoveSafety
 
 
@@ -32,19 +34,100 @@ log = pycam.Utils.log.get_logger()
 # We need to use a global function here - otherwise it does not work with
 # the multiprocessing Pool.
 def _process_one_line(extra_args):
-    p1, p2, models, cutter = extra_args
-    points = get_free_paths_triangles(models, cutter, p1, p2)
+    p1, p2, models, cutter, scanline_cache = extra_args
+    points = get_free_paths_triangles(models, cutter, p1, p2, scanline_cache=scanline_cache)
     return points
 
 
+def _process_waterline_layer(extra_args):
+    """ calculate the waterlines of a single layer (see "_get_waterline_paths") """
+    layer_grid, models, cutter, scanline_cache = extra_args
+    # the ContourCutter pathprocessor does not work with combined models
+    scanlines = [get_free_paths_triangles(models[:1], cutter, p1, p2,
+                                          scanline_cache=scanline_cache)
+                 for p1, p2 in layer_grid]
+    return _get_waterline_paths(scanlines, models, cutter, scanline_cache=scanline_cache)
+
+
+def _get_waterline_paths(scanlines, models, cutter, scanline_cache=None):
+    """ turn the collision points of the scanlines of one layer into cutting segments
+
+    The result is a list containing the height and the segments (pairs of points) of every
+    waterline path.
+    """
+    path_processor = pycam.PathProcessors.ContourCutter.ContourCutter()
+    path_processor.new_direction(0)
+    for points in scanlines:
+        if points:
+            path_processor.new_scanline()
+            for point in points:
+                path_processor.append(point)
+            path_processor.end_scanline()
+    path_processor.end_direction()
+    path_processor.finish()
+    result = []
+    for path in path_processor.paths:
+        # plain tuples can be transferred to other processes
+        points = [tuple(point) for point in path.points]
+        pairs = []
+        for index in range(len(points) - 1):
+            pairs.append((points[index], points[index + 1]))
+        if len(models) > 1:
+            # We assume that the first model is used for the waterline and all
+            # other models are obstacles (e.g. a support grid).
+            other_models = models[1:]
+            segments = []
+            for p1, p2 in pairs:
+                free_points = get_free_paths_triangles(other_models, cutter, p1, p2,
+                                                       scanline_cache=scanline_cache)
+                for index in range(len(free_points) // 2):
+                    segments.append((free_points[2 * index], free_points[2 * index + 1]))
+        else:
+            segments = pairs
+        result.append((points[0][2], segments))
+    return result
+
+
 class PushCutter:
 
-    def __init__(self, waterlines=False):
+    def __init__(self, waterlines=False, optimize_travel=False):
+        """
+        @param optimize_travel: reorder the segments of every layer for short travel moves (see
+            pycam.Toolpath.SegmentOrder)
+        """
         log.debug("Starting PushCutter")
         self.waterlines = waterlines
+        self.optimize_travel = optimize_travel
 
     def generate_toolpath(self, cutter, models, motion_grid, minz=None, maxz=None,
                           draw_callback=None):
+        path = []
+        if draw_callback:
+            # visualize the partial toolpath
+            progress_callback = lambda **kwargs: draw_callback(toolpath=path, **kwargs)
+        else:
+            progress_callback = None
+        for step in self.iterate_toolpath(cutter, models, motion_grid, minz=minz, maxz=maxz,
+                                          draw_callback=progress_callback):
+            path.append(step)
+        return path
+
+    def iterate_toolpath(self, cutter, models, motion_grid, minz=None, maxz=None,
+                         draw_callback=None):
+        """ deliver the moves of the toolpath one by one (see "generate_toolpath")
+
+        The moves of a slice are available as soon as its scanline is calculated.  Waterlines
+        are delivered after all layers are finished (they need to be sorted).  Reordered moves
+        (see "optimize_travel") are available as soon as their layer is calculated.
+        """
+        moves = self._iterate_layer_moves(cutter, models, motion_grid, draw_callback)
+        if self.optimize_travel:
+            return iterate_optimized_layers(moves)
+        else:
+            return (step for step in moves if step is not None)
+
+    def _iterate_layer_moves(self, cutter, models, motion_grid, draw_callback):
+        """ deliver the moves of the toolpath - the end of every layer is marked with None """
         # Transfer the grid (a generator) into a list of lists and count the items.
         grid = []
         num_of_grid_positions = 0
@@ -59,12 +142,23 @@ class PushCutter:
         num_of_layers = len(grid)
 
         progress_counter = ProgressCounter(num_of_grid_positions, draw_callback)
+        # the triangles of a scanline are reused by the following layers
+        scanline_cache = ScanlineCache()
 
-        current_layer = 0
         if self.waterlines:
-            self.pa = pycam.PathProcessors.ContourCutter.ContourCutter()
-        else:
-            path = []
+            previous_height = None
+            for step in self.generate_waterlines(cutter, models, grid, draw_callback,
+                                                 progress_counter, scanline_cache=scanline_cache):
+                # every height is a separate layer
+                if (previous_height is not None) and (step.action != MOVE_SAFETY) \
+                        and (step.position[2] != previous_height):
+                    yield None
+                if step.action != MOVE_SAFETY:
+                    previous_height = step.position[2]
+                yield step
+            return
+
+        current_layer = 0
         for layer_grid in grid:
             # update the progress bar and check, if we should cancel the process
             if draw_callback and draw_callback(text=("PushCutter: processing layer %d/%d"
@@ -72,80 +166,72 @@ class PushCutter:
                 # cancel immediately
                 break
 
-            if self.waterlines:
-                self.pa.new_direction(0)
-            result = self.generate_toolpath_slice(cutter, models, layer_grid, draw_callback,
-                                                  progress_counter)
-            if self.waterlines:
-                self.pa.end_direction()
-                self.pa.finish()
-            else:
-                path.extend(result)
+            yield from self.iterate_toolpath_slice(cutter, models, layer_grid, draw_callback,
+                                                   progress_counter,
+                                                   scanline_cache=scanline_cache)
+            yield None
 
             current_layer += 1
 
-        if self.waterlines:
-            # TODO: this is complicated and hacky :(
-            # we don't use parallelism (for the sake of simplicity)
-            result = []
-            # turn the waterline points into cutting segments
-            for path in self.pa.paths:
-                pairs = []
-                for index in range(len(path.points) - 1):
-                    pairs.append((path.points[index], path.points[index + 1]))
-                if len(models) > 1:
-                    # We assume that the first model is used for the waterline and all
-                    # other models are obstacles (e.g. a support grid).
-                    other_models = models[1:]
-                    for p1, p2 in pairs:
-                        free_points = get_free_paths_triangles(other_models, cutter, p1, p2)
-                        for index in range(len(free_points) // 2):
-                            result.append(MoveStraight(free_points[2 * index]))
-                            result.append(MoveStraight(free_points[2 * index + 1]))
-                            result.append(MoveSafety())
-                else:
-                    for p1, p2 in pairs:
-                        result.append(MoveStraight(p1))
-                        result.append(MoveStraight(p2))
-                        result.append(MoveSafety())
-            return result
-        else:
-            return path
-
-    def generate_toolpath_slice(self, cutter, models, layer_grid, draw_callback=None,
-                                progress_counter=None):
-        path = []
-        # the ContourCutter pathprocessor does not work with combined models
-        if self.waterlines:
-            models = models[:1]
+    def generate_waterlines(self, cutter, models, grid, draw_callback=None,
+                            progress_counter=None, scanline_cache=None):
+        """ calculate the waterlines of all layers
+
+        The layers are processed in parallel (every layer is a separate task).  A single layer is
+        split into parallel tasks for its scanlines instead.
+        """
+        progress_callback = progress_counter.update if progress_counter else None
+        layer_paths = []
+        if len(grid) == 1:
+            args = [(p1, p2, models[:1], cutter, scanline_cache) for p1, p2 in grid[0]]
+            scanlines = []
+            for points in run_in_parallel(_process_one_line, args, callback=progress_callback):
+                scanlines.append(points)
+                if points and draw_callback:
+                    draw_callback(tool_position=points[-1])
+                if progress_counter and progress_counter.increment():
+                    # quit requested
+                    break
+            layer_paths.extend(_get_waterline_paths(scanlines, models, cutter,
+                                                    scanline_cache=scanline_cache))
         else:
-            models = models
+            args = [(layer_grid, models, cutter, scanline_cache) for layer_grid in grid]
+            results = run_in_parallel(_process_waterline_layer, args, callback=progress_callback)
+            for current_layer, (layer_grid, paths) in enumerate(zip(grid, results)):
+                layer_paths.extend(paths)
+                # update the progress bar and check, if we should cancel the process
+                if draw_callback and draw_callback(text=("PushCutter: processing layer %d/%d"
+                                                         % (current_layer + 1, len(grid)))):
+                    break
+                if progress_counter and progress_counter.increment(len(layer_grid)):
+                    break
+        # Merge the layers: the upper paths come first - this is a stable sort (just like
+        # ContourCutter.sort_layered).
+        layer_paths.sort(key=lambda item: item[0], reverse=True)
+        # turn the waterline segments into cutting moves
+        result = []
+        for height, segments in layer_paths:
+            for p1, p2 in segments:
+                result.append(MoveStraight(p1))
+                result.append(MoveStraight(p2))
+                result.append(MoveSafety())
+        return result
+
+    def iterate_toolpath_slice(self, cutter, models, layer_grid, draw_callback=None,
+                               progress_counter=None, scanline_cache=None):
         args = []
         for line in layer_grid:
             p1, p2 = line
-            args.append((p1, p2, models, cutter))
+            args.append((p1, p2, models, cutter, scanline_cache))
         for points in run_in_parallel(_process_one_line, args, callback=progress_counter.update):
             if points:
-                if self.waterlines:
-                    self.pa.new_scanline()
-                    for point in points:
-                        self.pa.append(point)
-                else:
-                    for index in range(len(points) // 2):
-                        path.append(MoveStraight(points[2 * index]))
-                        path.append(MoveStraight(points[2 * index + 1]))
-                        path.append(MoveSafety())
-                if self.waterlines:
-                    if draw_callback:
-                        draw_callback(tool_position=points[-1])
-                    self.pa.end_scanline()
-                else:
-                    if draw_callback:
-                        draw_callback(tool_position=points[-1], toolpath=path)
+                for index in range(len(points) // 2):
+                    yield MoveStraight(points[2 * index])
+                    yield MoveStraight(points[2 * index + 1])
+                    yield MoveSafety()
+                if draw_callback:
+                    draw_callback(tool_position=points[-1])
             # update the progress counter
             if progress_counter and progress_counter.increment():
                 # quit requested
                 break
-
-        if not self.waterlines:
-            return path
@@ -0,0 +1,635 @@
+"""
+vectorized drop-cutter calculation based on numpy
+
+The functions below calculate the vertical "drop" of a cutter onto a model for many grid
+positions at once.  Instead of calling "cutter.drop" for every single pair of position and
+triangle, all pairs of a block of grid positions and their candidate triangles are evaluated via
+array operations.
+
+The calculations mirror the scalar implementations of "BaseCutter.drop" and the "intersect"
+methods of the cylindrical, spherical and toroidal cutters step by step (restricted to the
+vertical direction).  Thus the results are identical to the ones of
+"pycam.PathGenerators.get_max_height_triangles".
+
+This module requires numpy.  Callers are supposed to catch the ImportError and to fall back to
+the scalar implementation.
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+import weakref
+
+# this import requires numpy (optional) - see the module documentation above
+import numpy
+
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Geometry import epsilon, INFINITE
+
+
+# number of grid positions that are combined with all their candidate triangles at once
+POSITION_BLOCK_SIZE = 64
+
+# the triangle arrays of every mesh and the uuid of their model (changed along with the model)
+_mesh_arrays_cache = weakref.WeakKeyDictionary()
+
+
+# The vector helpers below operate on tuples of three numpy arrays (x, y and z components).
+# Their sequence of floating point operations equals the one of pycam.Geometry.PointUtils.
+
+def _add(a, b):
+    return (a[0] + b[0], a[1] + b[1], a[2] + b[2])
+
+
+def _sub(a, b):
+    return (a[0] - b[0], a[1] - b[1], a[2] - b[2])
+
+
+def _mul(a, c):
+    return (a[0] * c, a[1] * c, a[2] * c)
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - b[1] * a[2], b[0] * a[2] - a[0] * b[2], a[0] * b[1] - b[0] * a[1])
+
+
+def _sqrt(value):
+    """ see pycam.Geometry.sqrt: tiny negative values (rounding errors) are treated as zero """
+    return numpy.sqrt(numpy.where((value < -epsilon) | (value > 0), value, 0))
+
+
+def _norm(a):
+    return _sqrt(_dot(a, a))
+
+
+def _normalized(a):
+    n = _norm(a)
+    return (a[0] / n, a[1] / n, a[2] / n)
+
+
+def _take(vector, indices):
+    return (vector[0][indices], vector[1][indices], vector[2][indices])
+
+
+def _where(condition, a, b):
+    return (numpy.where(condition, a[0], b[0]), numpy.where(condition, a[1], b[1]),
+            numpy.where(condition, a[2], b[2]))
+
+
+# the direction of every drop operation
+_DOWN = (0.0, 0.0, -1.0)
+_AXIS = (0.0, 0.0, 1.0)
+
+
+class TriangleArrays:
+    """ the geometrical properties of all triangles of a model stored in numpy arrays """
+
+    def __init__(self, triangles=()):
+        triangles = list(triangles)
+
+        def get_vector(get_value):
+            values = numpy.array([get_value(t) for t in triangles],
+                                 dtype=float).reshape((len(triangles), 3))
+            return (values[:, 0], values[:, 1], values[:, 2])
+
+        def get_scalar(get_value):
+            return numpy.array([get_value(t) for t in triangles], dtype=float)
+
+        self.p1 = get_vector(lambda t: t.p1[:3])
+        self.p2 = get_vector(lambda t: t.p2[:3])
+        self.p3 = get_vector(lambda t: t.p3[:3])
+        self.normal = get_vector(lambda t: t.normal[:3])
+        # the reference point and the normal of the triangle's plane
+        self.center = get_vector(lambda t: t.plane.p[:3])
+        self.plane_normal = get_vector(lambda t: t.plane.n[:3])
+        self.middle = get_vector(lambda t: t.middle[:3])
+        self.radius = get_scalar(lambda t: t.radius)
+        self.radiussq = get_scalar(lambda t: t.radiussq)
+        self.minx = get_scalar(lambda t: t.minx)
+        self.maxx = get_scalar(lambda t: t.maxx)
+        self.miny = get_scalar(lambda t: t.miny)
+        self.maxy = get_scalar(lambda t: t.maxy)
+        self._update_edges()
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """ create the arrays based on the buffers of a TriangleMesh (without Triangle objects)
+
+        The values are equal to the properties of the mesh's Triangle objects (see
+        "TriangleMesh._update_face_data" and "Triangle.reset_cache").
+        """
+        result = cls()
+        if not len(mesh):
+            return result
+        buffers = mesh.get_buffers()
+
+        def get_array(name, dtype=float):
+            # copy the values - the buffers of the mesh may grow later
+            return numpy.frombuffer(buffers[name], dtype=dtype).copy()
+
+        def split_vector(values):
+            values = values.reshape((-1, 3))
+            return (values[:, 0], values[:, 1], values[:, 2])
+
+        vertices = get_array("vertices").reshape((-1, 3))
+        faces = get_array("faces", dtype=numpy.int64).reshape((-1, 3))
+        result.p1, result.p2, result.p3 = (split_vector(vertices[faces[:, column]])
+                                           for column in range(3))
+        result.normal = split_vector(get_array("normals"))
+        # see pycam.Geometry.PointUtils.pdiv
+        result.center = tuple(value / 3 for value in _add(_add(result.p1, result.p2), result.p3))
+        result.plane_normal = result.normal
+        result.middle = split_vector(get_array("middles"))
+        result.radius = get_array("radii")
+        result.radiussq = result.radius ** 2
+        result.minx = get_array("bounds_minx")
+        result.maxx = get_array("bounds_maxx")
+        result.miny = get_array("bounds_miny")
+        result.maxy = get_array("bounds_maxy")
+        result._update_edges()
+        return result
+
+    def _update_edges(self):
+        # the three edges (e1, e2, e3) of every triangle
+        self.edges = []
+        for start, end in ((self.p1, self.p2), (self.p2, self.p3), (self.p3, self.p1)):
+            vector = _sub(end, start)
+            length = _norm(vector)
+            direction = (vector[0] / length, vector[1] / length, vector[2] / length)
+            self.edges.append(_EdgeArrays(start, end, direction, length))
+
+    def __len__(self):
+        return len(self.minx)
+
+    def take(self, indices):
+        """ return a new instance containing only a subset of the triangles """
+        result = self.__class__()
+        for key in ("p1", "p2", "p3", "normal", "center", "plane_normal", "middle"):
+            setattr(result, key, _take(getattr(self, key), indices))
+        for key in ("radius", "radiussq", "minx", "maxx", "miny", "maxy"):
+            setattr(result, key, getattr(self, key)[indices])
+        result.edges = [_EdgeArrays(_take(edge.p1, indices), _take(edge.p2, indices),
+                                    _take(edge.dir, indices), edge.len[indices])
+                        for edge in self.edges]
+        return result
+
+
+_EdgeArrays = collections.namedtuple("_EdgeArrays", ("p1", "p2", "dir", "len"))
+
+
+def get_triangle_arrays(model):
+    """ retrieve the (cached) array representation of all triangles of a model
+
+    The arrays are kept as long as the mesh of the model exists and the model is not changed.
+    """
+    mesh = model.get_mesh()
+    try:
+        model_uuid, arrays = _mesh_arrays_cache[mesh]
+    except KeyError:
+        model_uuid = None
+    if model_uuid != model.uuid:
+        arrays = TriangleArrays.from_mesh(mesh)
+        _mesh_arrays_cache[mesh] = (model.uuid, arrays)
+    return arrays
+
+
+class _Hits:
+    """ collect the hit with the lowest distance for every pair of position and triangle
+
+    Just like the scalar "intersect" methods only a strictly lower distance replaces a previous
+    hit.
+    """
+
+    def __init__(self, count):
+        self.distance = numpy.full(count, float(INFINITE))
+        self.height = numpy.full(count, numpy.nan)
+
+    def add(self, valid, distance, height):
+        better = valid & (distance < self.distance)
+        self.distance = numpy.where(better, distance, self.distance)
+        self.height = numpy.where(better, height, self.height)
+
+    def found(self):
+        return ~numpy.isnan(self.height)
+
+
+def _is_point_inside(triangles, p):
+    """ see pycam.Geometry.Triangle.is_point_inside """
+    v0 = _sub(triangles.p3, triangles.p1)
+    v1 = _sub(triangles.p2, triangles.p1)
+    v2 = _sub(p, triangles.p1)
+    dot00 = _dot(v0, v0)
+    dot01 = _dot(v0, v1)
+    dot02 = _dot(v0, v2)
+    dot11 = _dot(v1, v1)
+    dot12 = _dot(v1, v2)
+    denom = dot00 * dot11 - dot01 * dot01
+    inv_denom = 1.0 / denom
+    u = (dot11 * dot02 - dot01 * dot12) * inv_denom
+    v = (dot00 * dot12 - dot01 * dot02) * inv_denom
+    return (denom != 0) & (u > 0) & (v > 0) & (u + v < 1)
+
+
+def _intersect_plane_point(plane_point, plane_normal, direction, point):
+    """ see pycam.Geometry.Plane.intersect_point
+
+    The direction is expected to be normalized.
+    Returns the collision point and the distance.  Invalid results are marked by a zero
+    denominator.
+    """
+    denom = _dot(plane_normal, direction)
+    l_len = -(_dot(plane_normal, point) - _dot(plane_normal, plane_point)) / denom
+    cp = _add(point, _mul(direction, l_len))
+    return (denom != 0), cp, l_len
+
+
+def _normalize_direction(direction):
+    """ Plane.intersect_point normalizes directions that are not exactly of unit length """
+    length = _norm(direction)
+    normalized = _normalized(direction)
+    return _where(length != 1, normalized, direction)
+
+
+def _drop_circle_plane(triangles, center, radius, start):
+    """ see pycam.Geometry.intersection.intersect_circle_plane and BaseCutter's
+    intersect_circle_triangle
+
+    Returns the validity, the distance and the height of the cutter location.
+    """
+    n = triangles.normal
+    valid = _dot(n, _DOWN) != 0
+    n2 = (n[0], n[1], 0 * n[2])
+    n2_norm = _norm(n2)
+    is_flat = (n2_norm == 0)
+    # non-flat triangles: the cutter contact point is on the circle, where the surface normal is n
+    n2 = (n2[0] / n2_norm, n2[1] / n2_norm, n2[2] / n2_norm)
+    ccp_tilted = _add(center, _mul(n2, -radius))
+    plane_valid_tilted, cp_tilted, d_tilted = _intersect_plane_point(
+        triangles.center, triangles.plane_normal, _DOWN, ccp_tilted)
+    # flat triangles: the contact point is just below the center
+    plane_valid_flat, cp_flat, d_flat = _intersect_plane_point(
+        triangles.center, triangles.plane_normal, _DOWN, center)
+    ccp_flat = _sub(cp_flat, _mul(_DOWN, d_flat))
+    ccp = _where(is_flat, ccp_flat, ccp_tilted)
+    cp = _where(is_flat, cp_flat, cp_tilted)
+    distance = numpy.where(is_flat, d_flat, d_tilted)
+    valid &= numpy.where(is_flat, plane_valid_flat, plane_valid_tilted)
+    valid &= _is_point_inside(triangles, cp)
+    height = cp[2] + (start[2] - ccp[2])
+    return valid, distance, height
+
+
+def _drop_circle_vertex(center, radiussq, point, start):
+    """ see pycam.Geometry.intersection.intersect_circle_point """
+    plane_valid, ccp, l_len = _intersect_plane_point(center, _AXIS, _DOWN, point)
+    diff = _sub(center, ccp)
+    valid = plane_valid & (_dot(diff, diff) < radiussq - epsilon)
+    height = point[2] + (start[2] - ccp[2])
+    return valid, -l_len, height
+
+
+def _drop_circle_edge(edge, center, radius, radiussq, start):
+    """ see pycam.Geometry.intersection.intersect_circle_line and BaseCutter's
+    intersect_circle_edge
+    """
+    d = edge.dir
+    is_horizontal = (_dot(d, _AXIS) == 0)
+    # horizontal edges: project the edge onto the plane of the circle
+    valid_h1, p1, l_len = _intersect_plane_point(center, _AXIS, _DOWN, edge.p1)
+    valid_h2, p2, l_len = _intersect_plane_point(center, _AXIS, _DOWN, edge.p2)
+    # closest point of the projected line (see pycam.Geometry.Line.closest_point)
+    v = _normalized(_sub(p2, p1))
+    dist = _dot(p1, v) - _dot(center, v)
+    pc = _sub(p1, _mul(v, dist))
+    pc = _where(_norm(_sub(p2, p1)) == 0, p1, pc)
+    diff = _sub(pc, center)
+    d_sq = _dot(diff, diff)
+    a = _sqrt(radiussq - d_sq)
+    d1 = _dot(_sub(p1, pc), d)
+    d2 = _dot(_sub(p2, pc), d)
+    use_p1 = numpy.abs(d1) < a - epsilon
+    use_p2 = ~use_p1 & (numpy.abs(d2) < a - epsilon)
+    use_pc = ~use_p1 & ~use_p2 & (((d1 < -a + epsilon) & (d2 > a - epsilon))
+                                  | ((d2 < -a + epsilon) & (d1 > a - epsilon)))
+    ccp_h = _where(use_p1, p1, _where(use_p2, p2, pc))
+    cp_h = _sub(ccp_h, _mul(_DOWN, l_len))
+    valid_h = valid_h1 & valid_h2 & (d_sq < radiussq) & (use_p1 | use_p2 | use_pc)
+    distance_h = -l_len
+    # all other edges: slide the line along the direction
+    n = _cross(d, _DOWN)
+    n_norm = _norm(n)
+    n = (n[0] / n_norm, n[1] / n_norm, n[2] / n_norm)
+    valid_lp, lp, l_len = _intersect_plane_point(center, _AXIS, _normalize_direction(d), edge.p1)
+    v = _cross(_AXIS, n)
+    v_norm = _norm(v)
+    v = (v[0] / v_norm, v[1] / v_norm, v[2] / v_norm)
+    n2 = _cross(v, _AXIS)
+    n2_norm = _norm(n2)
+    n2 = (n2[0] / n2_norm, n2[1] / n2_norm, n2[2] / n2_norm)
+    dist = _dot(n2, center) - _dot(n2, lp)
+    distsq = dist * dist
+    dist2 = _sqrt(radiussq - distsq)
+    dist2 = numpy.where(_dot(d, _AXIS) < 0, -dist2, dist2)
+    ccp_s = _sub(center, _sub(_mul(n2, dist), _mul(v, dist2)))
+    valid_cp, cp_s, distance_s = _intersect_plane_point(
+        edge.p1, _cross(_cross(d, _DOWN), d), _DOWN, ccp_s)
+    valid_s = ((n_norm != 0) & valid_lp & (v_norm != 0) & (n2_norm != 0)
+               & ~(distsq > radiussq - epsilon) & valid_cp)
+    # combine both cases
+    valid = numpy.where(is_horizontal, valid_h, valid_s)
+    ccp = _where(is_horizontal, ccp_h, ccp_s)
+    cp = _where(is_horizontal, cp_h, cp_s)
+    distance = numpy.where(is_horizontal, distance_h, distance_s)
+    # check if the contact point is between the endpoints
+    m = _dot(_sub(cp, edge.p1), d)
+    valid &= ~((m < -epsilon) | (m > edge.len + epsilon))
+    height = cp[2] + (start[2] - ccp[2])
+    return valid, distance, height
+
+
+def _drop_sphere_plane(triangles, center, radius, start):
+    """ see pycam.Geometry.intersection.intersect_sphere_plane """
+    n = triangles.normal
+    n_dot_dir = _dot(n, _DOWN)
+    ccp = _where(n_dot_dir < 0, _sub(center, _mul(n, radius)), _add(center, _mul(n, radius)))
+    plane_valid, cp, distance = _intersect_plane_point(
+        triangles.center, triangles.plane_normal, _DOWN, ccp)
+    valid = (n_dot_dir != 0) & plane_valid & _is_point_inside(triangles, cp)
+    height = cp[2] + (start[2] - ccp[2])
+    return valid, distance, height
+
+
+def _drop_sphere_edge(edge, center, radius, radiussq, start):
+    """ see pycam.Geometry.intersection.intersect_sphere_line and
+    SphericalCutter.intersect_sphere_edge
+    """
+    d = edge.dir
+    n = _cross(d, _DOWN)
+    n_norm = _norm(n)
+    n = (n[0] / n_norm, n[1] / n_norm, n[2] / n_norm)
+    dist = - _dot(center, n) + _dot(edge.p1, n)
+    n2 = _normalized(_cross(n, d))
+    dist2 = _sqrt(radiussq - dist * dist)
+    ccp = _add(center, _add(_mul(n, dist), _mul(n2, dist2)))
+    plane_valid, cp, distance = _intersect_plane_point(edge.p1, n2, _DOWN, ccp)
+    valid = (n_norm != 0) & ~(numpy.abs(dist) > radius - epsilon) & plane_valid
+    # check if the contact point is between the endpoints
+    vector = _sub(edge.p2, edge.p1)
+    m = _dot(_sub(cp, edge.p1), vector)
+    valid &= ~((m < -epsilon) | (m > _dot(vector, vector) + epsilon))
+    height = cp[2] - (ccp[2] - start[2])
+    return valid, distance, height
+
+
+def _drop_sphere_vertex(center, radiussq, point, start):
+    """ see pycam.Geometry.intersection.intersect_sphere_point """
+    p0_x0 = _sub(center, point)
+    a = _dot(_DOWN, _DOWN)
+    b = 2 * _dot(p0_x0, _DOWN)
+    c = _dot(p0_x0, p0_x0) - radiussq
+    d = b * b - 4 * a * c
+    distance = (-b - _sqrt(d)) / (2 * a)
+    height = start[2] + _DOWN[2] * distance
+    return ~(d < 0), distance, height
+
+
+def _drop_torus_point(cutter, center, point, start):
+    """ see pycam.Geometry.intersection.intersect_torus_point (the "drop" case) """
+    majorradius = cutter.distance_majorradius
+    minorradius = cutter.distance_minorradius
+    minlsq = (majorradius - minorradius) ** 2
+    maxlsq = (majorradius + minorradius) ** 2
+    l_sq = (point[0] - center[0]) ** 2 + (point[1] - center[1]) ** 2
+    l_len = _sqrt(l_sq)
+    z_sq = cutter.distance_minorradiussq - (majorradius - l_len) ** 2
+    ccp_z = center[2] - _sqrt(z_sq)
+    distance = ccp_z - point[2]
+    valid = ~((l_sq < minlsq + epsilon) | (l_sq > maxlsq - epsilon)) & ~(z_sq < 0)
+    height = point[2] + (start[2] - ccp_z)
+    return valid, distance, height
+
+
+def _drop_torus_plane(triangles, cutter, center, start):
+    """ see pycam.Geometry.intersection.intersect_torus_plane """
+    n = triangles.normal
+    b = _mul(n, -1.0)
+    z_dot_b = _dot(_AXIS, b)
+    a = _sub(b, _mul(_AXIS, z_dot_b))
+    a_sq = _dot(a, a)
+    a_len = _sqrt(a_sq)
+    a = (a[0] / a_len, a[1] / a_len, a[2] / a_len)
+    ccp = _add(_add(center, _mul(a, cutter.distance_majorradius)),
+               _mul(b, cutter.distance_minorradius))
+    plane_valid, cp, distance = _intersect_plane_point(
+        triangles.center, triangles.plane_normal, _DOWN, ccp)
+    valid = ((_dot(n, _DOWN) != 0) & (_dot(n, _AXIS) != 1) & ~(a_sq <= 0) & plane_valid
+             & _is_point_inside(triangles, cp))
+    height = cp[2] + (start[2] - ccp[2])
+    return valid, distance, height
+
+
+def _drop_torus_edge(edge, cutter, center, start):
+    """ see ToroidalCutter.intersect_torus_edge
+
+    The edge is sampled at discrete positions ("brute force") - exactly like the scalar
+    implementation does it.
+    """
+    count = len(edge.len)
+    scale = numpy.maximum(3, (edge.len / cutter.distance_minorradius * 2).astype(int))
+    min_m = numpy.zeros(count)
+    min_distance = numpy.full(count, float(INFINITE))
+    min_height = numpy.full(count, numpy.nan)
+
+    def evaluate(m, relevant):
+        p = _add(edge.p1, _mul(edge.dir, m * edge.len))
+        valid, distance, height = _drop_torus_point(cutter, center, p, start)
+        better = relevant & valid & (distance < min_distance)
+        return better, distance, height
+
+    for index in range(int(scale.max()) + 1 if count else 0):
+        m = index / scale
+        better, distance, height = evaluate(m, index <= scale)
+        min_m = numpy.where(better, m, min_m)
+        min_distance = numpy.where(better, distance, min_distance)
+        min_height = numpy.where(better, height, min_height)
+    found = min_distance != INFINITE
+    scale2 = 10
+    for index in range(1, scale2 + 1):
+        m = min_m + ((float(index) / scale2) * 2 - 1) / scale
+        better, distance, height = evaluate(m, found & ~((m < -epsilon) | (m > 1 + epsilon)))
+        min_distance = numpy.where(better, distance, min_distance)
+        min_height = numpy.where(better, height, min_height)
+    return found, min_distance, min_height
+
+
+def _get_cutter_center(cutter, start):
+    """ the center of the cutter relative to the start position (as used by the cutters) """
+    return tuple(s - location + center
+                 for s, location, center in zip(start, cutter.location, cutter.center))
+
+
+def _drop_cylindrical(cutter, triangles, start):
+    center = _get_cutter_center(cutter, start)
+    radius, radiussq = cutter.distance_radius, cutter.distance_radiussq
+    count = len(triangles.minx)
+    # the contact with the plane of the triangle takes precedence
+    hits = _Hits(count)
+    hits.add(*_drop_circle_plane(triangles, center, radius, start))
+    done = hits.found()
+    edge_hits = _Hits(count)
+    for edge in triangles.edges:
+        edge_hits.add(*_drop_circle_edge(edge, center, radius, radiussq, start))
+    hits.add(~done & edge_hits.found(), edge_hits.distance, edge_hits.height)
+    done = hits.found()
+    for point in (triangles.p1, triangles.p2, triangles.p3):
+        valid, distance, height = _drop_circle_vertex(center, radiussq, point, start)
+        hits.add(~done & valid, distance, height)
+    return hits.height
+
+
+def _drop_spherical(cutter, triangles, start):
+    center = _get_cutter_center(cutter, start)
+    radius, radiussq = cutter.distance_radius, cutter.distance_radiussq
+    count = len(triangles.minx)
+    hits = _Hits(count)
+    hits.add(*_drop_sphere_plane(triangles, center, radius, start))
+    done = hits.found()
+    other_hits = _Hits(count)
+    for edge in triangles.edges:
+        other_hits.add(*_drop_sphere_edge(edge, center, radius, radiussq, start))
+    for point in (triangles.p1, triangles.p2, triangles.p3):
+        other_hits.add(*_drop_sphere_vertex(center, radiussq, point, start))
+    hits.add(~done & other_hits.found(), other_hits.distance, other_hits.height)
+    return hits.height
+
+
+def _drop_toroidal(cutter, triangles, start):
+    center = _get_cutter_center(cutter, start)
+    radius, radiussq = cutter.distance_majorradius, cutter.distance_majorradiussq
+    hits = _Hits(len(triangles.minx))
+    hits.add(*_drop_torus_plane(triangles, cutter, center, start))
+    for edge in triangles.edges:
+        hits.add(*_drop_torus_edge(edge, cutter, center, start))
+    for point in (triangles.p1, triangles.p2, triangles.p3):
+        hits.add(*_drop_torus_point(cutter, center, point, start))
+    # the flat bottom of the torus: a circle around the start position
+    hits.add(*_drop_circle_plane(triangles, start, radius, start))
+    for point in (triangles.p1, triangles.p2, triangles.p3):
+        hits.add(*_drop_circle_vertex(start, radiussq, point, start))
+    for edge in triangles.edges:
+        hits.add(*_drop_circle_edge(edge, start, radius, radiussq, start))
+    return hits.height
+
+
+def _get_drop_function(cutter):
+    # check the most specific classes first
+    if isinstance(cutter, ToroidalCutter):
+        return _drop_toroidal
+    elif isinstance(cutter, SphericalCutter):
+        return _drop_spherical
+    elif isinstance(cutter, CylindricalCutter):
+        return _drop_cylindrical
+    else:
+        return None
+
+
+def is_cutter_supported(cutter):
+    return _get_drop_function(cutter) is not None
+
+
+def _get_candidate_pairs(cutter, triangles, xs, ys):
+    """ combine every position with all triangles that pass the cheap checks of BaseCutter.drop
+
+    Returns the indices of positions and triangles for all remaining pairs.
+    """
+    radius = cutter.distance_radius
+    minx = (xs - radius)[:, numpy.newaxis]
+    maxx = (xs + radius)[:, numpy.newaxis]
+    miny = (ys - radius)[:, numpy.newaxis]
+    maxy = (ys + radius)[:, numpy.newaxis]
+    xs = xs[:, numpy.newaxis]
+    ys = ys[:, numpy.newaxis]
+    # the triangles returned by the model's kdtree for the bounding box of the cutter
+    mask = ~((triangles.minx > maxx) | (triangles.maxx < minx)
+             | (triangles.miny > maxy) | (triangles.maxy < miny))
+    # check bounding box collision (see BaseCutter.drop)
+    mask &= ~((minx > triangles.maxx + epsilon) | (maxx < triangles.minx - epsilon)
+              | (miny > triangles.maxy + epsilon) | (maxy < triangles.miny - epsilon))
+    position_indices, triangle_indices = numpy.nonzero(mask)
+    # check bounding circle collision
+    middle = _take(triangles.middle, triangle_indices)
+    dist_sq = ((middle[0] - xs[position_indices, 0]) ** 2
+               + (middle[1] - ys[position_indices, 0]) ** 2)
+    limit = (cutter.distance_radiussq + 2 * radius * triangles.radius[triangle_indices]
+             + triangles.radiussq[triangle_indices]) + epsilon
+    inside = ~(dist_sq > limit)
+    return position_indices[inside], triangle_indices[inside]
+
+
+def get_max_heights(model, cutter, positions, minz, maxz):
+    """ calculate the highest possible cutter location for every given xy position
+
+    The result is equivalent to calling "get_max_height_triangles" for each position: a list
+    containing a tuple (x, y, z) or None (the cutter exceeds "maxz") for every position.
+    """
+    positions = [(pos[0], pos[1]) for pos in positions]
+    if model is None:
+        return [(x, y, minz) for x, y in positions]
+    drop_function = _get_drop_function(cutter)
+    if drop_function is None:
+        raise TypeError("Unsupported cutter type for vectorized drop: %s" % type(cutter))
+    xs = numpy.array([pos[0] for pos in positions], dtype=float)
+    ys = numpy.array([pos[1] for pos in positions], dtype=float)
+    heights = numpy.full(len(positions), numpy.nan)
+    arrays = get_triangle_arrays(model)
+    if positions and len(arrays):
+        # reduce the number of triangles to a strip around all positions
+        radius = cutter.distance_radius
+        strip = numpy.nonzero((arrays.maxx + epsilon >= xs.min() - radius)
+                              & (arrays.minx - epsilon <= xs.max() + radius)
+                              & (arrays.maxy + epsilon >= ys.min() - radius)
+                              & (arrays.miny - epsilon <= ys.max() + radius))[0]
+        strip_arrays = arrays.take(strip)
+        for block_start in range(0, len(positions), POSITION_BLOCK_SIZE):
+            block = slice(block_start, block_start + POSITION_BLOCK_SIZE)
+            position_indices, triangle_indices = _get_candidate_pairs(
+                cutter, strip_arrays, xs[block], ys[block])
+            if len(position_indices) == 0:
+                continue
+            start = (xs[block][position_indices], ys[block][position_indices],
+                     numpy.full(len(position_indices), float(maxz)))
+            with numpy.errstate(all="ignore"):
+                pair_heights = drop_function(cutter, strip_arrays.take(triangle_indices), start)
+            block_heights = numpy.full(len(xs[block]), -numpy.inf)
+            numpy.fmax.at(block_heights, position_indices, pair_heights)
+            block_heights[numpy.isneginf(block_heights)] = numpy.nan
+            heights[block] = block_heights
+    result = []
+    for (x, y), height_max in zip(positions, heights.tolist()):
+        # see get_max_height_triangles
+        if numpy.isnan(height_max) or (height_max < minz + epsilon):
+            height_max = minz
+        if height_max > maxz + epsilon:
+            result.append(None)
+        else:
+            result.append((x, y, height_max))
+    return result
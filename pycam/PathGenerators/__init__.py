@@ -18,12 +18,20 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import collections
 import time
+import uuid
 
 from pycam.Geometry import epsilon, INFINITE
 from pycam.Geometry.PointUtils import pdist, pnorm, pnormalized, psub
 from pycam.Utils.events import get_event_handler
 
+# number of scanlines with cached triangles (see "ScanlineCache")
+SCANLINE_CACHE_SIZE = 4096
+
+# the content of the most recent ScanlineCache received by this process (see "__setstate__")
+_received_scanline_caches = {}
+
 
 class Hit:
     def __init__(self, cl, cp, t, d, direction):
@@ -38,7 +46,70 @@ class Hit:
         return "%s - %s - %s - %s" % (self.d, self.cl, self.dir, self.cp)
 
 
-def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False):
+class ScanlineCache:
+    """ the triangles and collisions of recently used scanlines (see "get_free_paths_triangles")
+
+    Layers sharing the same scanline at different heights just filter the cached triangles.
+    A cache belongs to a single toolpath calculation (e.g. a call of PushCutter) - it is released
+    together with the calculation.
+    Worker processes receive a copy without content.  Every process keeps only the content of the
+    most recently received cache, thus old models are not referenced by the workers anymore.
+    """
+
+    def __init__(self, max_size=SCANLINE_CACHE_SIZE):
+        # "uuid" would cause the cache to be shared as a whole (see pycam.Utils.threading)
+        self.cache_id = uuid.uuid4()
+        self.max_size = max_size
+        self._items = collections.OrderedDict()
+
+    def __getstate__(self):
+        return {"cache_id": self.cache_id, "max_size": self.max_size}
+
+    def __setstate__(self, state):
+        self.cache_id = state["cache_id"]
+        self.max_size = state["max_size"]
+        if self.cache_id not in _received_scanline_caches:
+            # drop the content of previous calculations
+            _received_scanline_caches.clear()
+            _received_scanline_caches[self.cache_id] = collections.OrderedDict()
+        self._items = _received_scanline_caches[self.cache_id]
+
+    def __len__(self):
+        return len(self._items)
+
+    def get_collisions(self, model, cutter, p1, p2):
+        """ return the cached data of the scanline from p1 to p2 (regardless of its height)
+
+        The result is a list of all triangles next to the scanline and a dictionary for
+        collisions that do not depend on the height of the scanline.  The order of the triangles
+        is the same as for a direct query of the model.
+        """
+        key = (model.uuid, cutter.uuid, p1[0], p1[1], p2[0], p2[1])
+        try:
+            result = self._items[key]
+            self._items.move_to_end(key)
+        except KeyError:
+            result = (_get_scanline_triangles(model, cutter, p1, p2), {})
+            self._items[key] = result
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return result
+
+
+def _get_scanline_triangles(model, cutter, p1, p2):
+    return model.triangles(
+        min(p1[0], p2[0]) - cutter.distance_radius, min(p1[1], p2[1]) - cutter.distance_radius,
+        -INFINITE, max(p1[0], p2[0]) + cutter.distance_radius,
+        max(p1[1], p2[1]) + cutter.distance_radius, INFINITE)
+
+
+def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False,
+                             scanline_cache=None):
+    """ return the collision points of the cutter moving along the scanline from p1 to p2
+
+    The optional "scanline_cache" (ScanlineCache) is used for reusing the triangles and the shaft
+    collisions of previous calls with the same scanline at a different height.
+    """
     if (len(models) == 0) or ((len(models) == 1) and (models[0] is None)):
         return (p1, p2)
     elif len(models) == 1:
@@ -46,7 +117,8 @@ def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False):
         model = models[0]
     else:
         # multiple models were given - process them in layers
-        result = get_free_paths_triangles(models[:1], cutter, p1, p2, return_triangles)
+        result = get_free_paths_triangles(models[:1], cutter, p1, p2, return_triangles,
+                                          scanline_cache=scanline_cache)
         # group the result into pairs of two points (start/end)
         point_pairs = []
         while result:
@@ -56,7 +128,7 @@ def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False):
         all_results = []
         for pair in point_pairs:
             one_result = get_free_paths_triangles(models[1:], cutter, pair[0], pair[1],
-                                                  return_triangles)
+                                                  return_triangles, scanline_cache=scanline_cache)
             all_results.extend(one_result)
         return all_results
 
@@ -64,25 +136,44 @@ def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False):
     forward = pnormalized(psub(p2, p1))
     xyz_dist = pdist(p2, p1)
 
-    minx = min(p1[0], p2[0])
-    maxx = max(p1[0], p2[0])
-    miny = min(p1[1], p2[1])
-    maxy = max(p1[1], p2[1])
-    minz = min(p1[2], p2[2])
-
     # find all hits along scan line
     hits = []
 
-    triangles = model.triangles(minx - cutter.distance_radius, miny - cutter.distance_radius, minz,
-                                maxx + cutter.distance_radius, maxy + cutter.distance_radius,
-                                INFINITE)
-
-    for t in triangles:
-        (cl1, d1, cp1) = cutter.intersect(backward, t, start=p1)
-        if cl1:
+    if scanline_cache is None:
+        triangles, shaft_collisions = _get_scanline_triangles(model, cutter, p1, p2), {}
+    else:
+        triangles, shaft_collisions = scanline_cache.get_collisions(model, cutter, p1, p2)
+    # the lower end of the cutter may reach below its location (see "get_required_distance")
+    lower_limit = min(p1[2], p2[2]) - cutter.get_required_distance() - epsilon
+    shaft_height = cutter.get_shaft_height()
+    if (p1[2] == p2[2]) and (shaft_height is not None):
+        # Triangles above the lower end (e.g. the ball) of the cutter can only collide with its
+        # cylindrical shaft.  These collisions do not depend on the height of the scanline.
+        shaft_limit = p1[2] + shaft_height + epsilon
+    else:
+        shaft_limit = INFINITE
+    for index, t in enumerate(triangles):
+        if t.maxz < lower_limit:
+            continue
+        if t.minz > shaft_limit:
+            try:
+                (cl1, d1, cp1), (cl2, d2, cp2) = shaft_collisions[index]
+            except KeyError:
+                shaft_collisions[index] = (cutter.intersect(backward, t, start=p1),
+                                           cutter.intersect(forward, t, start=p1))
+                (cl1, d1, cp1), (cl2, d2, cp2) = shaft_collisions[index]
+            else:
+                # move the cached collisions to the height of this scanline
+                cl1 = cl1 and (cl1[0], cl1[1], p1[2])
+                cl2 = cl2 and (cl2[0], cl2[1], p1[2])
+        else:
+            (cl1, d1, cp1) = cutter.intersect(backward, t, start=p1)
+            (cl2, d2, cp2) = cutter.intersect(forward, t, start=p1)
+        # Contact points below the lower end of the cutter are impossible for a horizontal move.
+        # ToroidalCutter reports these for some triangles below the cutter.
+        if cl1 and (cp1[2] >= lower_limit):
             hits.append(Hit(cl1, cp1, t, -d1, backward))
-        (cl2, d2, cp2) = cutter.intersect(forward, t, start=p1)
-        if cl2:
+        if cl2 and (cp2[2] >= lower_limit):
             hits.append(Hit(cl2, cp2, t, d2, forward))
 
     # sort along the scan direction
@@ -130,19 +221,43 @@ def get_free_paths_triangles(models, cutter, p1, p2, return_triangles=False):
         return [cut_info[0] for cut_info in points]
 
 
-def get_max_height_triangles(model, cutter, x, y, minz, maxz):
+def _get_drop_box(cutter, x, y, minz):
+    """ return the box containing all triangles that may affect the drop of the cutter
+
+    Triangles below "minz" (reduced by the lower extension of the cutter) cannot raise the
+    cutter above "minz".  Triangles above "maxz" are relevant, since they prevent the drop.
+    """
+    p = (x, y, minz)
+    return (cutter.get_minx(p), cutter.get_miny(p),
+            minz - cutter.get_required_distance() - epsilon,
+            cutter.get_maxx(p), cutter.get_maxy(p), INFINITE)
+
+
+def _get_triangle_height(triangle):
+    return triangle.maxz
+
+
+def get_max_height_triangles(model, cutter, x, y, minz, maxz, triangles=None):
+    """ drop the cutter onto the model at the given position
+
+    The optional "triangles" (retrieved via the box returned by "_get_drop_box") are used instead
+    of querying the model.
+    The triangles are processed in the order of descending height.  The calculation stops as soon
+    as none of the remaining triangles is high enough for raising the cutter any further.
+    """
     if model is None:
         return (x, y, minz)
     p = (x, y, maxz)
     height_max = None
-    box_x_min = cutter.get_minx(p)
-    box_x_max = cutter.get_maxx(p)
-    box_y_min = cutter.get_miny(p)
-    box_y_max = cutter.get_maxy(p)
-    box_z_min = minz
-    box_z_max = maxz
-    triangles = model.triangles(box_x_min, box_y_min, box_z_min, box_x_max, box_y_max, box_z_max)
+    if triangles is None:
+        triangles = model.triangles_by_height(*_get_drop_box(cutter, x, y, minz))
+    else:
+        triangles = sorted(triangles, key=_get_triangle_height, reverse=True)
+    # the cutter cannot be lifted above the highest point of a triangle (plus the distance)
+    height_offset = cutter.get_required_distance() + epsilon
     for t in triangles:
+        if (height_max is not None) and (height_max > t.maxz + height_offset):
+            break
         cut = cutter.drop(t, start=p)
         if cut and ((height_max is None) or (cut[2] > height_max)):
             height_max = cut[2]
@@ -168,15 +283,87 @@ def _check_deviance_of_adjacent_points(p1, p2, p3, min_distance):
         return (added / pnorm(straight)) < 1.001
 
 
-def get_max_height_dynamic(model, cutter, positions, minz, maxz):
+class _LineTriangles:
+    """ provide the triangles that may affect drops at positions along a line
+
+    The triangles within a strip around all positions are retrieved from the model only once.
+    They are sorted into consecutive buckets along the main direction of the line.  The
+    triangles for a position (see "_get_drop_box") are collected from the few buckets covered by
+    its drop box.  This is also suitable for positions inserted later between the original ones.
+    """
+
+    def __init__(self, model, cutter, positions, minz):
+        self.cutter = cutter
+        self.minz = minz
+        boxes = [_get_drop_box(cutter, p[0], p[1], minz) for p in positions]
+        strip = (min(box[0] for box in boxes), min(box[1] for box in boxes), boxes[0][2],
+                 max(box[3] for box in boxes), max(box[4] for box in boxes), INFINITE)
+        # use the axis with the largest extent of the strip
+        self._axis = 0 if (strip[3] - strip[0] >= strip[4] - strip[1]) else 1
+        self._start = strip[self._axis]
+        length = strip[self._axis + 3] - self._start
+        # a drop box covers at most three buckets - limit the number of buckets for tiny cutters
+        self._bucket_size = max(boxes[0][self._axis + 3] - boxes[0][self._axis],
+                                length / (2 * len(boxes)), epsilon)
+        self._bucket_count = int(length / self._bucket_size) + 1
+        self._buckets = [[] for _ in range(self._bucket_count)]
+        # the triangles of every bucket are ordered by height (see "get_max_height_triangles")
+        for triangle in model.triangles_by_height(*strip):
+            if self._axis == 0:
+                first, last = self._get_bucket(triangle.minx), self._get_bucket(triangle.maxx)
+            else:
+                first, last = self._get_bucket(triangle.miny), self._get_bucket(triangle.maxy)
+            for bucket in self._buckets[first:last + 1]:
+                bucket.append((triangle, first))
+
+    def _get_bucket(self, value):
+        index = int((value - self._start) / self._bucket_size)
+        return min(max(index, 0), self._bucket_count - 1)
+
+    def get_triangles(self, x, y):
+        """ return the triangles overlapping the drop box at the given position """
+        minx, miny, minz, maxx, maxy, maxz = _get_drop_box(self.cutter, x, y, self.minz)
+        if self._axis == 0:
+            first, last = self._get_bucket(minx), self._get_bucket(maxx)
+        else:
+            first, last = self._get_bucket(miny), self._get_bucket(maxy)
+        result = []
+        for index in range(first, last + 1):
+            for triangle, triangle_first in self._buckets[index]:
+                # a triangle spanning multiple buckets is checked only in the first covered one
+                if (triangle_first == index) or ((index == first) and (triangle_first < first)):
+                    if not ((triangle.minx > maxx) or (triangle.maxx < minx)
+                            or (triangle.miny > maxy) or (triangle.maxy < miny)
+                            or (triangle.minz > maxz) or (triangle.maxz < minz)):
+                        result.append(triangle)
+        return result
+
+
+def get_max_height_dynamic(model, cutter, positions, minz, maxz, get_max_heights=None):
+    """ calculate the cutter locations for a line of positions and refine it where necessary
+
+    The optional function "get_max_heights" calculates the heights for all given positions at
+    once (e.g. pycam.PathGenerators.VectorizedDrop.get_max_heights).  Its results are expected to
+    be equal to the ones of "get_max_height_triangles".
+    """
     max_depth = 8
     # the points don't need to get closer than 1/1000 of the cutter radius
     min_distance = cutter.distance_radius / 1000
-    points = []
-    get_max_height = lambda x, y: get_max_height_triangles(model, cutter, x, y, minz, maxz)
-    # add one point between all existing points
-    for index, p in enumerate(positions):
-        points.append(get_max_height(p[0], p[1]))
+    # the triangles along the line are retrieved once (on demand) - also for inserted points
+    line_triangles = []
+
+    def get_max_height(x, y):
+        if (model is not None) and not line_triangles:
+            line_triangles.append(_LineTriangles(model, cutter, positions, minz))
+        triangles = line_triangles[0].get_triangles(x, y) if line_triangles else None
+        return get_max_height_triangles(model, cutter, x, y, minz, maxz, triangles=triangles)
+
+    if not positions:
+        points = []
+    elif get_max_heights is None:
+        points = [get_max_height(p[0], p[1]) for p in positions]
+    else:
+        points = list(get_max_heights(model, cutter, positions, minz, maxz))
     # Check if three consecutive points are "flat".
     # Add additional points if necessary.
     index = 0
@@ -0,0 +1,136 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+
+import pytest
+
+import pycam.Test
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Geometry.Model import Model
+from pycam.Geometry.Triangle import Triangle
+from pycam.PathGenerators import get_max_height_triangles
+from pycam.Geometry.PointUtils import pdist
+from pycam.Toolpath import MOVE_SAFETY, MOVE_STRAIGHT
+
+try:
+    from pycam.PathGenerators.HeightMap import HeightMapCutter
+except ImportError:
+    HeightMapCutter = None
+
+
+def _get_surface_model(size=6):
+    model = Model()
+
+    def get_height(x, y):
+        return 2 + round(math.sin(x) * math.cos(y / 2), 1)
+
+    for x in range(size):
+        for y in range(size):
+            p1 = (x, y, get_height(x, y))
+            p2 = (x + 1, y, get_height(x + 1, y))
+            p3 = (x + 1, y + 1, get_height(x + 1, y + 1))
+            p4 = (x, y + 1, get_height(x, y + 1))
+            model.append(Triangle(p1, p3, p2))
+            model.append(Triangle(p1, p4, p3))
+    return model
+
+
+@pytest.mark.skipif(HeightMapCutter is None, reason="numpy is not available")
+class TestHeightMap(pycam.Test.PycamTestCase):
+
+    def test_bounds(self):
+        model = _get_surface_model()
+        positions = [(x * 0.25 + 0.13, y * 0.5 + 0.07) for x in range(24) for y in range(12)]
+        xs = [x for x, y in positions]
+        ys = [y for x, y in positions]
+        for cutter in (SphericalCutter(1), ToroidalCutter(1, 0.25)):
+            previous_errors = None
+            for resolution in (0.2, 0.05):
+                height_field = HeightMapCutter(resolution).get_height_field(
+                    cutter, model, min(xs), min(ys), max(xs), max(ys))
+                upper, lower = height_field.get_cutter_heights(cutter, xs, ys)
+                errors = []
+                for (x, y), high, low in zip(positions, upper, lower):
+                    exact = get_max_height_triangles(model, cutter, x, y, 0, 10)[2]
+                    self.assertLessEqual(exact, high + 1e-9)
+                    self.assertLessEqual(low, exact + 1e-9)
+                    errors.append(high - low)
+                # a finer resolution reduces the error
+                if previous_errors is not None:
+                    self.assertLess(max(errors), max(previous_errors) / 2)
+                previous_errors = errors
+
+    def test_toolpath(self):
+        model = _get_surface_model()
+        model.append(Triangle((2, 2, 12), (3, 2, 12), (2, 3, 12)))
+        lines = [[(x * 0.25 + 0.13, y * 0.5 + 0.07, 0) for x in range(24)] for y in range(12)]
+        cutter = SphericalCutter(0.5)
+        generator = HeightMapCutter(0.05)
+        path = generator.generate_toolpath(cutter, [model], [lines], minz=0, maxz=10)
+        moves = [move for move in path if move.action == MOVE_STRAIGHT]
+        # the points below the floating triangle exceed "maxz"
+        self.assertLess(len(moves), 24 * 12)
+        self.assertGreater(generator.error_bound, 0)
+        self.assertLess(generator.error_bound, 0.2)
+        for move in moves:
+            x, y, z = move.position
+            exact = get_max_height_triangles(model, cutter, x, y, 0, 10)
+            self.assertIsNotNone(exact)
+            self.assertLessEqual(exact[2], z + 1e-9)
+            self.assertLessEqual(z, exact[2] + generator.error_bound + 1e-9)
+
+    def test_optimized_travel(self):
+        model = _get_surface_model()
+        model.append(Triangle((2, 2, 12), (3, 2, 12), (2, 3, 12)))
+        lines = [[(x * 0.25 + 0.13, y * 0.5 + 0.07, 0) for x in range(24)] for y in range(12)]
+        results = []
+        for optimize_travel in (False, True):
+            generator = HeightMapCutter(0.1, optimize_travel=optimize_travel)
+            path = generator.generate_toolpath(SphericalCutter(0.5), [model], [lines], minz=0,
+                                               maxz=10)
+            self.assertNotIn(None, path)
+            travel = 0
+            last_position = None
+            for previous, move in zip([None] + path, path):
+                if move.action == MOVE_STRAIGHT:
+                    if (previous is not None) and (previous.action == MOVE_SAFETY) \
+                            and (last_position is not None):
+                        travel += pdist(last_position, move.position)
+                    last_position = move.position
+            results.append(({move.position for move in path if move.action == MOVE_STRAIGHT},
+                            travel))
+        self.assertEqual(results[0][0], results[1][0])
+        # the segments are reordered for shorter travel moves
+        self.assertLess(results[1][1], results[0][1])
+
+    def test_flat_cutter(self):
+        model = Model()
+        model.append(Triangle((0, 0, 1), (4, 0, 1), (4, 4, 1)))
+        model.append(Triangle((0, 0, 1), (4, 4, 1), (0, 4, 1)))
+        cutter = CylindricalCutter(1)
+        generator = HeightMapCutter(0.1)
+        line = [(x * 0.5 - 2, 2, 0) for x in range(17)]
+        path = generator.generate_toolpath(cutter, [model], [[line]], minz=0, maxz=10)
+        positions = [move.position for move in path if move.action == MOVE_STRAIGHT]
+        # the cutter touches the plateau within its radius - the straight moves are merged
+        self.assertEqual(positions, [(-2, 2, 0), (-1.5, 2, 0), (-1, 2, 1), (5, 2, 1),
+                                     (5.5, 2, 0), (6, 2, 0)])
+        # the exact height at the border of the cutter's reach is unknown
+        self.assertEqual(generator.error_bound, 1)
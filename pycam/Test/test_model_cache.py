@@ -0,0 +1,72 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import tempfile
+
+import pycam.Test
+from pycam.Geometry.Model import Model
+from pycam.Geometry.Triangle import Triangle
+import pycam.Importers.ModelCache as ModelCache
+
+
+class TestModelCache(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        ModelCache.set_cache_directory(self._temp_dir.name)
+        self.model = Model()
+        for x in range(30):
+            self.model.append(Triangle((x, 0, 0), (x, 1, 0), (x + 1, 0, x % 3)))
+        # a face attached to the existing spatial index
+        self.model.triangles(0, 0, 0, 1, 1, 1)
+        self.model.append(Triangle((3, 0, 0), (3, 2, 0), (4, 0, 5)))
+
+    def tearDown(self):
+        ModelCache.set_cache_directory(None)
+        self._temp_dir.cleanup()
+
+    def test_store_and_load(self):
+        key = ModelCache.get_cache_key(b"content", "STL", use_kdtree=True)
+        self.assertIsNone(ModelCache.load_model(key))
+        self.assertTrue(ModelCache.store_model(key, self.model))
+        loaded = ModelCache.load_model(key)
+        self.assertEqual(len(loaded), len(self.model))
+        self.assertEqual((loaded.minx, loaded.maxx, loaded.maxz), (0, 30, 5))
+        for triangle, expected in zip(loaded.triangles(), self.model.triangles()):
+            for key in ("p1", "p2", "p3", "normal"):
+                self.assert_vector_equal(getattr(triangle, key), getattr(expected, key))
+        # the spatial index is used without rebuilding it
+        self.assertFalse(loaded._dirty)
+        self.assertEqual(len(loaded.get_spatial_index()), len(self.model))
+        for box in ((2, 0, 0, 3.5, 1, 1), (-1, -1, 4, 40, 3, 6)):
+            self.assertEqual(sorted(t.p3 for t in loaded.triangles(*box)),
+                             sorted(t.p3 for t in self.model.triangles(*box)))
+
+    def test_keys(self):
+        key = ModelCache.get_cache_key(b"content", "STL", use_kdtree=True)
+        self.assertEqual(key, ModelCache.get_cache_key(b"content", "STL", use_kdtree=True))
+        self.assertNotEqual(key, ModelCache.get_cache_key(b"content2", "STL", use_kdtree=True))
+        self.assertNotEqual(key, ModelCache.get_cache_key(b"content", "STL", use_kdtree=False))
+
+    def test_invalid_file(self):
+        key = ModelCache.get_cache_key(b"content", "STL")
+        filename = os.path.join(self._temp_dir.name, key + ModelCache.FILENAME_SUFFIX)
+        for content in (b"", b"foo", ModelCache.MAGIC + b"\xff" * 20):
+            with open(filename, "wb") as cache_file:
+                cache_file.write(content)
+            self.assertIsNone(ModelCache.load_model(key))
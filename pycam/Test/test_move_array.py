@@ -0,0 +1,97 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+import pickle
+
+import pycam.Test
+from pycam.Toolpath import Toolpath
+from pycam.Toolpath.Filters import TimeLimit
+import pycam.Toolpath.MoveArray
+from pycam.Toolpath.MoveArray import MoveArray
+from pycam.Toolpath.Steps import MoveStraight, MoveStraightRapid, MoveSafety, MachineSetting, \
+        Comment, MoveClass
+
+
+def _get_steps():
+    return [Comment("start"), MoveStraightRapid((0, 0, 5)), MachineSetting("feedrate", 100),
+            MoveStraight((0, 0, 1)), MoveStraight((3, 4, 1)), MoveSafety(),
+            MachineSetting("feedrate", 0.5), MoveStraight((3, 4, -2.5)),
+            MachineSetting("corner_style", ("exact_path", 0, 0))]
+
+
+class TestMoveArray(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        self._numpy = pycam.Toolpath.MoveArray.numpy
+
+    def tearDown(self):
+        pycam.Toolpath.MoveArray.numpy = self._numpy
+
+    def test_steps(self):
+        steps = _get_steps()
+        moves = MoveArray(steps)
+        self.assertEqual(len(moves), len(steps))
+        self.assertEqual(list(moves), steps)
+        self.assertEqual(moves[-2], steps[-2])
+        self.assertEqual(moves[1:4], tuple(steps[1:4]))
+        self.assertEqual(moves, MoveArray(steps))
+        self.assertEqual(hash(moves), hash(MoveArray(steps)))
+        self.assertNotEqual(moves, MoveArray(steps[:-1]))
+        self.assertEqual(pickle.loads(pickle.dumps(moves)), moves)
+        # moves with more than three axes are kept in the side table
+        unusual = MoveClass(steps[3].action, (1, 2, 3, 4))
+        self.assertEqual(list(MoveArray([unusual])), [unusual])
+
+    def test_bounds_and_time(self):
+        for numpy_module in (self._numpy, None):
+            pycam.Toolpath.MoveArray.numpy = numpy_module
+            toolpath = Toolpath(toolpath_path=_get_steps())
+            self.assertEqual((toolpath.minx, toolpath.miny, toolpath.minz), (0, 0, -2.5))
+            self.assertEqual((toolpath.maxx, toolpath.maxy, toolpath.maxz), (3, 4, 5))
+            distance, duration = toolpath.get_machine_move_distance_and_time()
+            self.assertAlmostEqual(distance, 4 + 5 + 3.5)
+            # the low feedrate of the last move is raised to the minimum
+            self.assertAlmostEqual(duration, 4 / 100 + 5 / 100 + 3.5 / 1)
+            self.assertRaises(ValueError, lambda: Toolpath(toolpath_path=[MoveSafety()]).minx)
+            self.assertEqual(MoveArray([MoveStraight((1, 1, 1))]).get_machine_distance_and_time(),
+                             (0, 0))
+        self.assertTrue(math.isnan(MoveArray([MoveSafety()]).positions[0]))
+
+    def test_time_index(self):
+        steps = _get_steps()
+        for numpy_module in (self._numpy, None):
+            pycam.Toolpath.MoveArray.numpy = numpy_module
+            moves = MoveArray(steps)
+            distances, times = moves.get_time_index()
+            self.assertEqual(list(distances), [0, 0, 0, 4, 9, 9, 9, 12.5, 12.5])
+            for max_time in (-1, 0, 0.01, 0.04, 0.05, 0.09, 1, 3.59, 10):
+                partial = moves.get_partial_moves(max_time)
+                expected = steps | TimeLimit(max_time)
+                self.assertEqual([step.action for step in partial],
+                                 [step.action for step in expected])
+                for step, expected_step in zip(partial, expected):
+                    self._assert_position(step.position, expected_step.position)
+            self._assert_position(moves.get_position_at_time(0.065), (1.5, 2, 1))
+            self._assert_position(moves.get_position_at_time(0.09 + 1.75), (3, 4, -0.75))
+            self.assertEqual(moves.get_position_at_time(10), (3, 4, -2.5))
+            self.assertIsNone(MoveArray([MoveSafety()]).get_position_at_time(1))
+
+    def _assert_position(self, position, expected):
+        self.assertEqual(len(position), len(expected))
+        for value, expected_value in zip(position, expected):
+            self.assertAlmostEqual(value, expected_value)
@@ -0,0 +1,131 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pickle
+
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Geometry import Box3D, Point3D
+from pycam.Geometry.Model import Model
+from pycam.Importers.STLImporter import import_model
+import pycam.PathGenerators
+from pycam.PathGenerators import ScanlineCache
+from pycam.PathGenerators.PushCutter import PushCutter
+import pycam.Test
+from pycam.Toolpath import MOVE_SAFETY
+import pycam.Toolpath.MotionGrid as MotionGrid
+import pycam.Utils.threading
+
+
+ASSET_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets",
+                              "cube_binary.stl")
+
+
+class TestScanlines(pycam.Test.PycamTestCase):
+
+    def test_layer_reuse(self):
+        model = import_model(ASSET_FILENAME)
+        # a tilted face crossing all layers and a floating face
+        model.add_triangle((12, 4, 0), (12, 6, 0), (14, 5, 10))
+        model.add_triangle((-2, 2, 7.8), (-2, 8, 7.8), (-1, 5, 8.5))
+        cutters = []
+        for distance in (0, 0.3):
+            for cutter in (CylindricalCutter(1), SphericalCutter(1), ToroidalCutter(2, 0.5)):
+                cutter.set_required_distance(distance)
+                cutters.append(cutter)
+        get_free_paths = pycam.PathGenerators.get_free_paths_triangles
+        scanline_cache = ScanlineCache()
+        for cutter in cutters:
+            for line in (((-8, 5.5), (16, 5.5)), ((16, 4.5), (-8, 4.5)), ((-1.5, -5), (3, 15))):
+                for z in (9.5, 7.5, 7, 5, 0.5):
+                    p1, p2 = ((x, y, z) for x, y in line)
+                    result = get_free_paths([model], cutter, p1, p2,
+                                            scanline_cache=scanline_cache)
+                    # the same calculation without cached collisions of other layers
+                    self.assertEqual(result, get_free_paths([model], cutter, p1, p2))
+        self.assertEqual(len(scanline_cache), 3 * len(cutters))
+
+    def test_toroidal_contact_below(self):
+        # the scanline passes above a vertex - far below the lower end of the torus
+        model = Model()
+        model.add_triangle((2.5, -5.5, 2.25), (2.5, -2.5, 4.5), (5.5, -4, 0))
+        for distance in (0, 0.3):
+            cutter = ToroidalCutter(2, 0.5)
+            cutter.set_required_distance(distance)
+            p1, p2 = (-10, -5.5, 4.4), (10, -5.5, 4.4)
+            self.assertEqual(pycam.PathGenerators.get_free_paths_triangles([model], cutter,
+                                                                           p1, p2), [p1, p2])
+
+    def test_cache_transfer(self):
+        model = import_model(ASSET_FILENAME)
+        cutter = CylindricalCutter(1)
+        scanline_cache = ScanlineCache()
+        scanline_cache.get_collisions(model, cutter, (-8, 5, 1), (16, 5, 1))
+        # copies (e.g. for worker processes) are transferred without content
+        first_copy = pickle.loads(pickle.dumps(scanline_cache))
+        self.assertEqual(len(first_copy), 0)
+        first_copy.get_collisions(model, cutter, (-8, 5, 1), (16, 5, 1))
+        # further copies of the same cache share the content within a process
+        self.assertEqual(len(pickle.loads(pickle.dumps(scanline_cache))), 1)
+        # the content of a previous calculation is dropped
+        pickle.loads(pickle.dumps(ScanlineCache()))
+        self.assertEqual(len(pickle.loads(pickle.dumps(scanline_cache))), 0)
+
+
+class TestWaterlines(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        self.model = import_model(ASSET_FILENAME)
+
+    def tearDown(self):
+        pycam.Utils.threading.cleanup()
+
+    def _get_waterlines(self, minz=1, number_of_processes=1, optimize_travel=False):
+        pycam.Utils.threading.init_threading(number_of_processes=number_of_processes)
+        box = Box3D(Point3D(-3, -3, minz), Point3D(13, 13, 9))
+        grid = MotionGrid.get_fixed_grid(box, 2, line_distance=1,
+                                         milling_style=MotionGrid.MillingStyle.CONVENTIONAL,
+                                         use_fixed_start_position=True)
+        generator = PushCutter(waterlines=True, optimize_travel=optimize_travel)
+        return generator.generate_toolpath(CylindricalCutter(1), [self.model], grid)
+
+    def test_layer_order(self):
+        moves = self._get_waterlines()
+        heights = [move.position[2] for move in moves if move.position]
+        self.assertEqual(heights, sorted(heights, reverse=True))
+        self.assertEqual(sorted(set(heights)), [1, 3, 5, 7, 9])
+        # a single layer
+        single_layer = self._get_waterlines(minz=9)
+        self.assertEqual({move.position[2] for move in single_layer if move.position}, {9})
+
+    def test_parallel_layers(self):
+        if not pycam.Utils.threading.is_multiprocessing_available():
+            self.skipTest("multiprocessing is not available")
+        self.assertEqual(self._get_waterlines(number_of_processes=2), self._get_waterlines())
+
+    def test_optimized_travel(self):
+        moves = self._get_waterlines()
+        optimized = self._get_waterlines(optimize_travel=True)
+        heights = [move.position[2] for move in optimized if move.position]
+        self.assertEqual(heights, sorted(heights, reverse=True))
+        self.assertEqual({move.position for move in optimized},
+                         {move.position for move in moves})
+        # the segments of a waterline are connected: fewer retracts are necessary
+        self.assertLess(sum(1 for move in optimized if move.action == MOVE_SAFETY),
+                        sum(1 for move in moves if move.action == MOVE_SAFETY) / 2)
@@ -0,0 +1,112 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+import random
+
+import pycam.Test
+from pycam.Toolpath import MOVE_SAFETY
+from pycam.Toolpath.SegmentOrder import get_optimized_layer, iterate_optimized_layers
+from pycam.Toolpath.Steps import MoveStraight, MoveSafety
+
+
+def _get_moves(segments):
+    moves = []
+    for segment in segments:
+        moves.extend(MoveStraight(point) for point in segment)
+        moves.append(MoveSafety())
+    return moves
+
+
+def _get_segments(moves):
+    segments = []
+    current = []
+    for step in moves:
+        if step.action == MOVE_SAFETY:
+            if current:
+                segments.append(tuple(current))
+            current = []
+        else:
+            current.append(step.position)
+    return segments
+
+
+def _get_travel(moves):
+    segments = _get_segments(moves)
+    return sum(math.hypot(second[0][0] - first[-1][0], second[0][1] - first[-1][1])
+               for first, second in zip(segments, segments[1:]))
+
+
+def _get_square(x, y, size, z=0):
+    return [(x, y, z), (x + size, y, z), (x + size, y + size, z), (x, y + size, z), (x, y, z)]
+
+
+class TestSegmentOrder(pycam.Test.PycamTestCase):
+
+    def test_travel(self):
+        rand = random.Random(17)
+        segments = []
+        for _ in range(200):
+            x, y = rand.uniform(0, 50), rand.uniform(0, 50)
+            segments.append(((x, y, 0), (x + rand.uniform(-2, 2), y + rand.uniform(-2, 2), 0)))
+        moves = _get_moves(segments)
+        optimized = get_optimized_layer(moves)
+        # every segment is kept (including its direction)
+        self.assertEqual(sorted(_get_segments(optimized)), sorted(segments))
+        self.assertLess(_get_travel(optimized), _get_travel(moves) / 3)
+
+    def test_merge(self):
+        # the second line continues the first one: no retract is necessary
+        segments = [((0, 0, 0), (1, 0, 0)), ((5, 5, 0), (6, 5, 0)), ((1, 0, 0), (2, 0, 0))]
+        optimized = get_optimized_layer(_get_moves(segments))
+        self.assertEqual(_get_segments(optimized),
+                         [((0, 0, 0), (1, 0, 0), (2, 0, 0)), ((5, 5, 0), (6, 5, 0))])
+        self.assertEqual(optimized[-1], MoveSafety())
+
+    def test_inner_first(self):
+        outer = _get_square(0, 0, 10)
+        inner = _get_square(4, 4, 2)
+        # the inner square is far away from the start position - but it needs to come first
+        for start_position in (None, (0, 0, 0), (20, 20, 0)):
+            optimized = get_optimized_layer(_get_moves([outer, inner]),
+                                            start_position=start_position)
+            self.assertEqual(_get_segments(optimized), [tuple(inner), tuple(outer)])
+        # separate squares: the nearest comes first
+        other = _get_square(20, 20, 2)
+        optimized = get_optimized_layer(_get_moves([outer, other]), start_position=(21, 21, 0))
+        self.assertEqual(_get_segments(optimized), [tuple(other), tuple(outer)])
+
+    def test_degenerate_starts(self):
+        # all segments start at the same point - far away from the start position
+        for count in (1, 40):
+            segments = [((0, 0, 0), (math.cos(index), math.sin(index), 0))
+                        for index in range(count)]
+            optimized = get_optimized_layer(_get_moves(segments), start_position=(5000, 3000, 0))
+            self.assertEqual(sorted(_get_segments(optimized)), sorted(segments))
+        # starts along a line
+        segments = [((index * 1e-3, 0, 0), (index * 1e-3, 5, 0)) for index in range(40)]
+        optimized = get_optimized_layer(_get_moves(segments), start_position=(-900, 0, 0))
+        self.assertEqual(_get_segments(optimized), segments)
+
+    def test_layers(self):
+        upper = [((5, 0, 2), (6, 0, 2)), ((0, 0, 2), (1, 0, 2))]
+        lower = [((0, 0, 1), (1, 0, 1)), ((5, 0, 1), (6, 0, 1))]
+        moves = _get_moves(upper) + [None] + _get_moves(lower)
+        result = list(iterate_optimized_layers(iter(moves)))
+        self.assertNotIn(None, result)
+        # the layers keep their order - the second one starts close to the end of the first
+        self.assertEqual(_get_segments(result), [upper[1], upper[0], lower[1], lower[0]])
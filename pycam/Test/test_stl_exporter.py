@@ -0,0 +1,66 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+from io import BytesIO, StringIO
+import os
+
+import pycam.Exporters.STLExporter
+from pycam.Exporters.STLExporter import STLExporter
+from pycam.Importers.STLImporter import import_model
+import pycam.Test
+
+
+ASSET_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets",
+                              "cube_ascii.stl")
+
+
+def _get_facets(model):
+    return sorted((triangle.p1, triangle.p2, triangle.p3, triangle.normal[:3])
+                  for triangle in model.triangles())
+
+
+class TestSTLExporter(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        self._numpy = pycam.Exporters.STLExporter.numpy
+
+    def tearDown(self):
+        pycam.Exporters.STLExporter.numpy = self._numpy
+
+    def test_binary(self):
+        model = import_model(ASSET_FILENAME)
+        results = []
+        for numpy_module in (self._numpy, None):
+            pycam.Exporters.STLExporter.numpy = numpy_module
+            stream = BytesIO()
+            STLExporter(model, binary=True).write(stream)
+            data = stream.getvalue()
+            # header, facet count and 50 bytes for every facet
+            self.assertEqual(len(data), 84 + 50 * 12)
+            self.assertFalse(data.startswith(b"solid"))
+            stream.seek(0)
+            self.assertEqual(_get_facets(import_model(stream)), _get_facets(model))
+            results.append(data)
+        self.assertEqual(results[0], results[1])
+
+    def test_ascii(self):
+        model = import_model(ASSET_FILENAME)
+        stream = StringIO()
+        STLExporter(model, linesep="\n").write(stream)
+        self.assertEqual(len(stream.getvalue().splitlines()), 2 + 7 * 12)
+        self.assertEqual(_get_facets(import_model(BytesIO(stream.getvalue().encode()))),
+                         _get_facets(model))
@@ -17,9 +17,13 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+from io import BytesIO
 import os
+import struct
 
+from pycam.errors import AbortOperationException, LoadFileError
 import pycam.Test
+import pycam.Importers.STLImporter
 from pycam.Importers.STLImporter import import_model
 
 cwd = os.path.dirname(os.path.abspath(__file__))
@@ -48,3 +52,37 @@ class TestSTLLoader(pycam.Test.PycamTestCase):
     def test_load_binary_file(self):
         model = import_model(path_to_asset('cube_binary.stl'))
         self.assertEqual(len(model), 12)
+
+    def _get_binary_stream(self, facets, facet_count=None):
+        data = [b"\0" * 80, struct.pack("<I", len(facets) if facet_count is None else facet_count)]
+        for normal, p1, p2, p3 in facets:
+            data.append(struct.pack("<12fH", *(normal + p1 + p2 + p3), 0))
+        return BytesIO(b"".join(data))
+
+    def test_binary_vertex_welding(self):
+        # a square made of two triangles - the shared vertices differ slightly
+        facets = [((0, 0, 1), (0, 0, 0), (1, 0, 0), (1, 1, 0)),
+                  ((0, 0, 1), (0.0001, 0, 0), (1, 1.0001, 0), (0, 1, 0))]
+        model = import_model(self._get_binary_stream(facets))
+        self.assertEqual(len(model), 2)
+        self.assertEqual(len(model.get_mesh().vertices), 3 * 4)
+        self.assertEqual(model.get_mesh().get_face_points(1)[0], (0, 0, 0))
+        # no welding without the kdtree
+        model = import_model(self._get_binary_stream(facets), use_kdtree=False)
+        self.assertEqual(len(model.get_mesh().vertices), 3 * 6)
+
+    def test_binary_chunks(self):
+        facets = [((0, 0, 1), (x, 0, 0), (x + 1, 0, 0), (x + 1, 1, 0)) for x in range(10)]
+        calls = []
+        original_chunk_size = pycam.Importers.STLImporter.FACET_CHUNK_SIZE
+        pycam.Importers.STLImporter.FACET_CHUNK_SIZE = 3
+        try:
+            model = import_model(self._get_binary_stream(facets), callback=lambda: calls.append(1))
+            self.assertEqual(len(model), 10)
+            self.assertEqual(len(calls), 4)
+            self.assertRaises(AbortOperationException, import_model,
+                              self._get_binary_stream(facets), callback=lambda: True)
+        finally:
+            pycam.Importers.STLImporter.FACET_CHUNK_SIZE = original_chunk_size
+        self.assertRaises(LoadFileError, import_model,
+                          self._get_binary_stream(facets, facet_count=11))
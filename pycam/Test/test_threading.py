@@ -0,0 +1,123 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import queue
+import unittest
+
+import pycam.Test
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Geometry.Model import Model
+from pycam.Geometry.Triangle import Triangle
+import pycam.Utils.threading
+
+
+def _get_model_summary(args):
+    index, models = args
+    model = models[0]
+    return (index, model.__class__.__name__, model.uuid, len(model),
+            len(model.triangles(-1, -1, -1, 2.5, 2, 2)))
+
+
+def _get_square(args):
+    return args[0] ** 2
+
+
+def _get_worker_state(args):
+    model, cutter = args
+    return os.getpid(), id(model), id(cutter), cutter.radius
+
+
+@unittest.skipUnless(pycam.Utils.threading.is_multiprocessing_available(),
+                     "multiprocessing is not available")
+class TestParallelProcessing(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        pycam.Utils.threading.init_threading(number_of_processes=2)
+        self.model = Model()
+        for x in range(20):
+            self.model.append(Triangle((x, 0, 0), (x, 1, 0), (x + 1, 0, 1)))
+
+    def tearDown(self):
+        pycam.Utils.threading.cleanup()
+
+    def test_shared_model(self):
+        args = [(index, [self.model]) for index in range(10)]
+        results = list(pycam.Utils.threading.run_in_parallel_local(_get_model_summary, args))
+        self.assertEqual(results, [(index, "Model", self.model.uuid, 20, 3)
+                                   for index in range(10)])
+
+    def test_persistent_pool(self):
+        cutter = SphericalCutter(2)
+        args = [(self.model, cutter)] * 20
+        run = pycam.Utils.threading.run_in_parallel_local
+        first_states = {pid: rest for pid, *rest in run(_get_worker_state, args)}
+        second_states = {pid: rest for pid, *rest in run(_get_worker_state, args)}
+        # the workers are reused - along with their cached model and cutter
+        self.assertTrue(set(second_states).issubset(first_states))
+        for pid, state in second_states.items():
+            self.assertEqual(state, first_states[pid])
+        # a cancelled job stops the workers
+        results = run(_get_worker_state, args, callback=lambda: True)
+        self.assertEqual(list(results), [])
+        third_states = {pid: rest for pid, *rest in run(_get_worker_state, args)}
+        self.assertFalse(set(third_states).intersection(first_states))
+
+    def test_batches(self):
+        args = [(index, ) for index in range(500)]
+        run = pycam.Utils.threading.run_in_parallel_local
+        expected = [index ** 2 for index in range(500)]
+        for _ in range(2):
+            self.assertEqual(list(run(_get_square, args)), expected)
+        self.assertEqual(sorted(run(_get_square, args, unordered=True)), expected)
+        calls = []
+
+        def cancel_after_ten_results():
+            calls.append(None)
+            return len(calls) > 10
+
+        self.assertEqual(list(run(_get_square, args, callback=cancel_after_ten_results)),
+                         expected[:10])
+
+    def test_batch_sizes(self):
+        sizer = pycam.Utils.threading._BatchSizer(0.1)
+        self.assertEqual(sizer.get_size(100, 2), 1)
+        self.assertEqual(sizer.get_size(100, 2, unknown_size=None), 25)
+        sizer.add_measurement(10, 0.01)
+        self.assertEqual(sizer.get_size(1000, 2), 100)
+        # keep enough batches for all workers
+        self.assertEqual(sizer.get_size(100, 2), 25)
+        self.assertEqual(sizer.get_size(3, 2), 1)
+
+
+class TestJobResultChannels(pycam.Test.PycamTestCase):
+
+    def test_channels(self):
+        channels = pycam.Utils.threading.JobResultChannels()
+        channels.open("job1")
+        channels.open("job2")
+        channels.put(("job2", 0, "foo"))
+        channels.put(("job1", 3, "bar"))
+        # results of unknown jobs are discarded
+        channels.put(("job3", 0, "baz"))
+        self.assertEqual(channels.qsize(), 2)
+        self.assertEqual(channels.get("job1", timeout=0), ("job1", 3, "bar"))
+        self.assertRaises(queue.Empty, channels.get, "job1", timeout=0)
+        channels.close("job2")
+        self.assertEqual(channels.qsize(), 0)
+        channels.put(("job2", 1, "foo"))
+        self.assertEqual(channels.qsize(), 0)
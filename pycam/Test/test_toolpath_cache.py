@@ -0,0 +1,134 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+import pycam.Test
+from pycam.Toolpath.MoveArray import MoveArray
+from pycam.Toolpath.Steps import MoveStraight, MoveSafety, MachineSetting, Comment
+import pycam.Toolpath.ToolpathCache as ToolpathCache
+from pycam.workspace.data_models import ContentDigest, Model, Source
+
+
+_DIGEST_SCRIPT = """
+from pycam.workspace.data_models import ContentDigest
+digest = ContentDigest()
+digest.update({"tool": {"shape": "flat_bottom", "radius": 1.5}, "models": ["foo", None, True]})
+print(digest.hexdigest())
+"""
+
+
+def _get_digest(value):
+    digest = ContentDigest()
+    digest.update(value)
+    return digest
+
+
+class TestToolpathCache(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        ToolpathCache.set_cache_directory(self._temp_dir.name)
+        self.moves = MoveArray([MachineSetting("feedrate", 200), MoveStraight((0, 0, 0)),
+                                MoveStraight((1, 2, 3)), Comment("foo"), MoveSafety(),
+                                MoveStraight((4, 5, 6)), MoveStraight((1, 2, 3, 4))])
+
+    def tearDown(self):
+        ToolpathCache.set_cache_directory(None)
+        self._temp_dir.cleanup()
+
+    def test_store_and_load(self):
+        self.assertIsNone(ToolpathCache.load_moves("key"))
+        self.assertTrue(ToolpathCache.store_moves("key", self.moves))
+        self.assertEqual(ToolpathCache.load_moves("key"), self.moves)
+        self.assertIsNone(ToolpathCache.load_moves("other"))
+        ToolpathCache.set_cache_directory(None)
+        self.assertIsNone(ToolpathCache.load_moves("key"))
+        self.assertFalse(ToolpathCache.store_moves("key", self.moves))
+
+    def test_invalid_file(self):
+        filename = os.path.join(self._temp_dir.name, "key" + ToolpathCache.FILENAME_SUFFIX)
+        for content in (b"", b"foo", ToolpathCache.MAGIC + b"\xff" * 20):
+            with open(filename, "wb") as cache_file:
+                cache_file.write(content)
+            self.assertIsNone(ToolpathCache.load_moves("key"))
+
+
+class TestContentDigest(pycam.Test.PycamTestCase):
+
+    def test_values(self):
+        key = _get_digest({"a": [1, 2.0], "b": None}).hexdigest()
+        self.assertEqual(key, _get_digest({"b": None, "a": [1, 2.0]}).hexdigest())
+        for other in ({"a": [1, 2.5], "b": None}, {"a": [1, 2.0], "b": False},
+                      {"a": ["1", 2.0], "b": None}, {"a": [1, 2.0]}, {"a": [[1], 2.0], "b": None}):
+            self.assertNotEqual(key, _get_digest(other).hexdigest())
+        self.assertTrue(_get_digest({"a": [1, 2.0]}).is_persistent)
+        self.assertFalse(_get_digest({"a": MoveArray()}).is_persistent)
+
+    def test_independent_of_process(self):
+        results = set()
+        for hash_seed in ("1", "2"):
+            env = dict(os.environ, PYTHONHASHSEED=hash_seed)
+            output = subprocess.check_output([sys.executable, "-c", _DIGEST_SCRIPT], env=env)
+            results.add(output.strip().decode())
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results.pop(), _get_digest(
+            {"tool": {"shape": "flat_bottom", "radius": 1.5},
+             "models": ["foo", None, True]}).hexdigest())
+
+    def test_source_file_content(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "model.stl")
+            source = Source({"type": "file", "location": filename})
+            keys = []
+            for content in (b"solid foo", b"solid bar", b"solid bar"):
+                with open(filename, "wb") as model_file:
+                    model_file.write(content)
+                # the modification time may be unchanged - force a recalculation
+                os.utime(filename, ns=(len(keys), len(keys)))
+                digest = _get_digest(source)
+                self.assertTrue(digest.is_persistent)
+                keys.append(digest.hexdigest())
+            self.assertNotEqual(keys[0], keys[1])
+            self.assertEqual(keys[1], keys[2])
+        # the content of remote files is unknown
+        source = Source({"type": "url", "location": "http://example.org/model.stl"})
+        self.assertFalse(_get_digest(source).is_persistent)
+
+    def test_source_copy_content(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "model.stl")
+            models = [Model("test_original", {"source": {"type": "file", "location": filename}}),
+                      Model("test_copy", {"source": {"type": "copy",
+                                                     "original": "test_original"}}),
+                      Model("test_copy2", {"source": {"type": "copy", "original": "test_copy"}})]
+            try:
+                keys = []
+                for content in (b"solid foo", b"solid bar"):
+                    with open(filename, "wb") as model_file:
+                        model_file.write(content)
+                    os.utime(filename, ns=(len(keys), len(keys)))
+                    keys.append([_get_digest(model).hexdigest() for model in models[1:]])
+            finally:
+                for model in models:
+                    Model.get_collection().remove(model)
+        # a modified original file invalidates all (chained) copies
+        for old_key, new_key in zip(*keys):
+            self.assertNotEqual(old_key, new_key)
@@ -0,0 +1,203 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import io
+import math
+
+from pycam.Exporters.GCode.LinuxCNC import LinuxCNC
+from pycam.Geometry.Line import Line
+from pycam.Geometry.Polygon import Polygon
+import pycam.Test
+import pycam.Toolpath.Filters as Filters
+from pycam.Toolpath import MOVE_ARC, MOVE_SAFETY, MOVE_STRAIGHT, MOVES_LIST
+from pycam.Toolpath.Steps import MoveStraight, MoveSafety, MachineSetting
+from pycam.workspace import LengthUnit
+from pycam.workspace.data_models import ExportSettings
+
+
+def _get_moves():
+    path = [MachineSetting("feedrate", 200)]
+    for line in range(4):
+        for x in range(6):
+            path.append(MoveStraight((x, line * 0.5, 2 - 0.3 * x * (line % 2))))
+        path.append(MoveSafety())
+    return path
+
+
+def _get_filters():
+    corners = ((3.5, -1, 0), (7.5, -1, 0), (7.5, 2, 0), (3.5, 2, 0))
+    square = Polygon()
+    for index, corner in enumerate(corners):
+        square.append(Line(corner, corners[(index + 1) % len(corners)]))
+    return [Filters.SelectTool(1), Filters.MachineSetting("unit", LengthUnit.METRIC_MM),
+            Filters.SpindleSpeed(1000), Filters.TriggerSpindle(2),
+            Filters.SafetyHeight(5), Filters.PlungeFeedrate(50),
+            Filters.StepWidth({"x": 0.1, "y": 0.1, "z": 0.1}),
+            Filters.TransformPosition(((1, 0, 0, 3), (0, 1, 0, 0), (0, 0, 1, 0))),
+            Filters.Crop([square]), Filters.TimeLimit(0.05)]
+
+
+class TestStreamingFilters(pycam.Test.PycamTestCase):
+
+    def test_filter_chain(self):
+        moves = _get_moves()
+        expected = list(moves)
+        for one_filter in sorted(_get_filters()):
+            expected = one_filter.filter_toolpath(list(expected))
+        # the moves are consumed one by one
+        self.assertEqual(list(Filters.iterate_filtered_moves(iter(moves), _get_filters())),
+                         expected)
+        self.assertEqual(Filters.get_filtered_moves(moves, _get_filters()), expected)
+
+    def test_late_tool_selection(self):
+        first, second = MoveStraight((0, 0, 0)), MoveStraight((1, 0, 0))
+        moves = [first, MachineSetting("select_tool", 2), second, MoveSafety()]
+        self.assertEqual(moves | Filters.SpindleSpeed(1000),
+                         [first, moves[1], MachineSetting("spindle_speed", 1000), second,
+                          MoveSafety()])
+        self.assertEqual(moves | Filters.TriggerSpindle(0),
+                         [first, MachineSetting("spindle_enabled", False), moves[1],
+                          MachineSetting("spindle_enabled", True), second,
+                          MachineSetting("spindle_enabled", False), MoveSafety()])
+        # without a tool selection
+        self.assertEqual(moves[2:] | Filters.TriggerSpindle(3),
+                         [MachineSetting("spindle_enabled", True), MachineSetting("delay", 3),
+                          second, MachineSetting("spindle_enabled", False), MoveSafety()])
+
+    def test_gcode_export(self):
+        filters = _get_filters()[:-1]
+        results = []
+        for streaming in (True, False):
+            destination = io.StringIO()
+            generator = LinuxCNC(destination)
+            if streaming:
+                generator.add_filters(filters)
+                generator.add_moves(iter(_get_moves()))
+            else:
+                generator.add_moves(_get_moves(), filters)
+            generator.finish()
+            results.append(destination.getvalue())
+        self.assertEqual(results[0], results[1])
+        self.assertIn("M3", results[0])
+        # the precision of the coordinates is based on the step width
+        self.assertIn("G1 X3.5 Y0.0 Z2.0", results[0].splitlines())
+
+
+class TestArcFit(pycam.Test.PycamTestCase):
+
+    def _get_circle_moves(self, radius=5, count=40, sweep=math.pi, clockwise=False):
+        direction = -1 if clockwise else 1
+        positions = [(3 + radius * math.cos(direction * sweep * index / count),
+                      2 + radius * math.sin(direction * sweep * index / count), 1)
+                     for index in range(count + 1)]
+        return [MoveStraight(position) for position in positions]
+
+    def test_arcs(self):
+        for clockwise in (False, True):
+            moves = self._get_circle_moves(clockwise=clockwise)
+            # a straight line follows the arc
+            moves.extend([MoveStraight((-10, 2, 1)), MoveStraight((-10, 0, 1)), MoveSafety()])
+            result = moves | Filters.ArcFit(0.01)
+            self.assertEqual([step.action for step in result],
+                             [MOVE_STRAIGHT, MOVE_ARC, MOVE_STRAIGHT, MOVE_STRAIGHT, MOVE_SAFETY])
+            arc = result[1]
+            self.assertEqual(arc.position, moves[40].position)
+            self.assertAlmostEqual(arc.center[0], 3)
+            self.assertAlmostEqual(arc.center[1], 2)
+            self.assertEqual(arc.clockwise, clockwise)
+
+    def test_tolerance(self):
+        # the segments of a coarse polygon deviate too much from the arc
+        moves = self._get_circle_moves(count=6)
+        self.assertEqual(moves | Filters.ArcFit(0.01), moves)
+        self.assertEqual(len(moves | Filters.ArcFit(0.5)), 2)
+        # straight lines and full circles are not replaced
+        line = [MoveStraight((x, 0, 0)) for x in range(10)]
+        self.assertEqual(line | Filters.ArcFit(0.01), line)
+        circle = self._get_circle_moves(sweep=2 * math.pi)
+        result = circle | Filters.ArcFit(0.01)
+        self.assertGreater(len(result), 2)
+        self.assertEqual(result[-1].position, circle[-1].position)
+
+    def test_step_width(self):
+        # the filters of the export settings: the arcs are fitted after the step width limitation
+        settings = ExportSettings(None, {"gcode": {"step_width": {"x": 0.1, "y": 0.1, "z": 0.1},
+                                                   "arc_fitting": 0.05}}, add_to_collection=False)
+        filters = settings.get_toolpath_filters()
+        step_width = [one_filter for one_filter in filters
+                      if isinstance(one_filter, Filters.StepWidth)]
+        self.assertEqual(len(step_width), 1)
+        moves = self._get_circle_moves(radius=2, count=100, sweep=math.pi / 2, clockwise=True)
+        positions = [step.position
+                     for step in Filters.iterate_filtered_moves(moves, step_width)]
+        result = [step for step in Filters.iterate_filtered_moves(moves, filters)
+                  if step.action in MOVES_LIST]
+        self.assertIn(MOVE_ARC, [step.action for step in result])
+        # every arc ends at a remaining position - all positions in between are close to the arc
+        index = 0
+        for step in result:
+            end = positions.index(step.position, index)
+            if step.action == MOVE_ARC:
+                start = positions[index - 1]
+                radius = math.hypot(start[0] - step.center[0], start[1] - step.center[1])
+                for position in positions[index:end + 1]:
+                    distance = math.hypot(position[0] - step.center[0],
+                                          position[1] - step.center[1])
+                    self.assertLessEqual(abs(distance - radius), 0.05 + 1e-9)
+            else:
+                self.assertEqual(end, index)
+            index = end + 1
+        self.assertEqual(index, len(positions))
+
+    def test_gcode_export(self):
+        destination = io.StringIO()
+        generator = LinuxCNC(destination)
+        generator.add_filters([Filters.ArcFit(0.001)])
+        moves = self._get_circle_moves(radius=2, count=100, sweep=math.pi / 2, clockwise=True)
+        generator.add_moves(moves + [MoveStraight((0, 0, 0))])
+        generator.finish()
+        # a hundred straight moves are replaced by a single arc
+        lines = destination.getvalue().splitlines()
+        self.assertEqual(lines[-4:], ["G1 X5.000000 Y2.000000 Z1.000000",
+                                      "G2 X3.000000 Y0.000000 I-2.000000 J0.000000",
+                                      "G1 X0.000000 Z0.000000", "M2\t; end program"])
+
+    def test_gcode_export_step_width(self):
+        # the ends of the arcs are rounded to the precision of the step width
+        arc_count = 0
+        for radius in (2, 2.03, 7.7):
+            destination = io.StringIO()
+            generator = LinuxCNC(destination)
+            generator.add_filters([Filters.StepWidth({"x": 0.1, "y": 0.1, "z": 0.1}),
+                                   Filters.ArcFit(0.05)])
+            moves = self._get_circle_moves(radius=radius, count=100, sweep=math.pi / 2,
+                                           clockwise=True)
+            generator.add_moves(moves + [MoveStraight((0, 0, 0))])
+            generator.finish()
+            position = {}
+            for line in destination.getvalue().splitlines():
+                words = {word[0]: float(word[1:]) for word in line.split()
+                         if word[0] in "XYZIJ"}
+                if line.startswith(("G2", "G3")):
+                    arc_count += 1
+                    center = (position["X"] + words["I"], position["Y"] + words["J"])
+                    end = (words.get("X", position["X"]), words.get("Y", position["Y"]))
+                    self.assertAlmostEqual(
+                        math.hypot(position["X"] - center[0], position["Y"] - center[1]),
+                        math.hypot(end[0] - center[0], end[1] - center[1]), places=5)
+                position.update({key: value for key, value in words.items() if key in "XYZ"})
+        self.assertGreater(arc_count, 0)
@@ -0,0 +1,102 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import random
+
+import pycam.Test
+from pycam.Geometry.Model import Model
+from pycam.Geometry.Triangle import Triangle
+from pycam.Geometry.TriangleBVH import TriangleBVH
+
+
+def _get_random_bounds(count, seed=3):
+    rand = random.Random(seed)
+    bounds = tuple([] for _ in range(6))
+    for _ in range(count):
+        for axis in range(3):
+            low = rand.uniform(-50, 50)
+            bounds[axis].append(low)
+            bounds[axis + 3].append(low + rand.uniform(0, 5))
+    return bounds
+
+
+class TestTriangleBVH(pycam.Test.PycamTestCase):
+
+    def setUp(self):
+        self.bounds = _get_random_bounds(500)
+        self.index = TriangleBVH(self.bounds, leaf_size=4)
+        rand = random.Random(7)
+        self.boxes = []
+        for _ in range(40):
+            minx, miny, minz = (rand.uniform(-60, 50) for _ in range(3))
+            self.boxes.append((minx, minx + rand.uniform(0, 20), miny, miny + rand.uniform(0, 20),
+                               minz, minz + rand.uniform(0, 40)))
+
+    def _search_brute_force(self, minx, maxx, miny, maxy, minz, maxz):
+        b_minx, b_miny, b_minz, b_maxx, b_maxy, b_maxz = self.bounds
+        return [index for index in range(len(b_minx))
+                if not ((b_minx[index] > maxx) or (b_maxx[index] < minx)
+                        or (b_miny[index] > maxy) or (b_maxy[index] < miny)
+                        or (b_minz[index] > maxz) or (b_maxz[index] < minz))]
+
+    def test_search(self):
+        for box in self.boxes:
+            self.assertEqual(sorted(self.index.search(*box)), self._search_brute_force(*box))
+        self.assertEqual(len(self.index.search(-100, 100, -100, 100)), 500)
+
+    def test_search_many(self):
+        results = self.index.search_many(self.boxes)
+        self.assertEqual(len(results), len(self.boxes))
+        for box, result in zip(self.boxes, results):
+            self.assertEqual(sorted(result), self._search_brute_force(*box))
+
+    def test_empty(self):
+        index = TriangleBVH(tuple([] for _ in range(6)))
+        self.assertEqual(index.search(0, 1, 0, 1), [])
+        self.assertEqual(index.search_many([(0, 1, 0, 1, 0, 1)]), [[]])
+
+    def test_insert(self):
+        more_bounds = _get_random_bounds(100, seed=5)
+        for index in range(100):
+            box = tuple(values[index] for values in more_bounds)
+            self.assertTrue(self.index.insert(500 + index, box))
+            for values, value in zip(self.bounds, box):
+                values.append(value)
+        self.assertEqual(len(self.index), 600)
+        self.assertTrue(self.index.is_balanced())
+        for box, result in zip(self.boxes, self.index.search_many(self.boxes)):
+            self.assertEqual(sorted(self.index.search(*box)), self._search_brute_force(*box))
+            self.assertEqual(sorted(result), self._search_brute_force(*box))
+        # too many inserted faces
+        for index in range(100):
+            self.index.insert(600 + index, (0, 0, 0, 1, 1, 1))
+        self.assertFalse(self.index.is_balanced())
+
+    def test_model_append(self):
+        model = Model()
+        for x in range(20):
+            model.append(Triangle((x, 0, 0), (x, 1, 0), (x + 1, 0, 1)))
+        self.assertEqual(len(model.triangles(-1, -1, -1, 2.5, 2, 2)), 3)
+        index = model._t_index
+        uuid = model.uuid
+        self.assertEqual(model.uuid, uuid)
+        new_triangle = Triangle((1, 0, 0), (1, 1, 0), (2, 0, 1))
+        model.append(new_triangle)
+        self.assertIn(new_triangle, model.triangles(-1, -1, -1, 2.5, 2, 2))
+        # the index was updated instead of being replaced
+        self.assertIs(model._t_index, index)
+        self.assertNotEqual(model.uuid, uuid)
@@ -0,0 +1,124 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import pickle
+
+import pycam.Test
+from pycam.Geometry.Model import Model
+from pycam.Geometry.Plane import Plane
+from pycam.Geometry.Triangle import Triangle
+from pycam.Geometry.TriangleMesh import TriangleMesh
+
+
+def _get_triangles():
+    return [Triangle((0, 0, 0), (0, 2, 0), (3, 0, 1)),
+            Triangle((0, 2, 0), (3, 2, 2), (3, 0, 1)),
+            Triangle((3, 0, 1), (3, 2, 2), (5, 1, 4), (0.1, 0.2, 0.9, 'v'))]
+
+
+class TestTriangleMesh(pycam.Test.PycamTestCase):
+
+    def _assert_triangles_equal(self, t1, t2):
+        for key in ("p1", "p2", "p3"):
+            self.assert_vector_equal(getattr(t1, key), getattr(t2, key))
+        self.assert_vector_equal(t1.normal, t2.normal)
+        self.assertEqual(t1.normal[3:], t2.normal[3:])
+        self.assertAlmostEqual(t1.radius, t2.radius)
+        self.assert_vector_equal(t1.middle, t2.middle)
+
+    def test_shared_vertices(self):
+        mesh = TriangleMesh()
+        for triangle in _get_triangles():
+            mesh.append(triangle)
+        self.assertEqual(len(mesh), 3)
+        self.assertEqual(len(mesh.vertices), 3 * 5)
+        self.assertEqual(list(mesh.faces[3:6]), [1, 3, 2])
+
+    def test_materialize(self):
+        mesh = TriangleMesh()
+        for p1, p2, p3 in ((t.p1, t.p2, t.p3) for t in _get_triangles()):
+            mesh.add_face(mesh.add_vertex(p1), mesh.add_vertex(p2), mesh.add_vertex(p3))
+        for index, expected in enumerate(_get_triangles()):
+            triangle = mesh[index]
+            # the same object is returned for subsequent requests
+            self.assertIs(mesh[index], triangle)
+            if index < 2:
+                self._assert_triangles_equal(triangle, expected)
+        middles, radii = mesh.get_circumcircles()
+        self.assertAlmostEqual(radii[1], mesh[1].radius)
+        self.assertEqual(mesh.get_limits(), (0, 0, 0, 5, 2, 4))
+
+    def test_transform(self):
+        matrix = ((0, -1, 0, 2), (1, 0, 0, 3), (0, 0, -2, 1))
+        model = Model()
+        for triangle in _get_triangles():
+            model.append(triangle)
+        model.transform_by_matrix(matrix)
+        for triangle, expected in zip(model.triangles(), _get_triangles()):
+            expected.transform_by_matrix(matrix)
+            self._assert_triangles_equal(triangle, expected)
+        self.assertEqual((model.minx, model.maxx, model.minz, model.maxz), (0, 2, -7, 1))
+
+    def test_copy_and_combine(self):
+        model = Model()
+        for triangle in _get_triangles():
+            model.append(triangle)
+        copied = pickle.loads(pickle.dumps(model.copy()))
+        combined = model + copied
+        self.assertEqual(len(combined), 6)
+        self.assertEqual((combined.minx, combined.maxy, combined.maxz), (0, 2, 4))
+        for triangle, expected in zip(combined.triangles()[3:], _get_triangles()):
+            self.assertIsNot(triangle, expected)
+            self._assert_triangles_equal(triangle, expected)
+
+    def test_height_order(self):
+        model = Model()
+        for triangle in _get_triangles():
+            model.append(triangle)
+        mesh = model.get_mesh()
+        self.assertEqual(list(mesh.get_height_order()), [2, 1, 0])
+        self.assertEqual(list(mesh.get_height_ranks()), [2, 1, 0])
+        model.append(Triangle((0, 0, 3), (0, 2, 3), (1, 1, 3)))
+        self.assertEqual(list(mesh.get_height_order()), [2, 3, 1, 0])
+        self.assertEqual([t.maxz for t in model.triangles_by_height(0, 0, 0, 1, 1, 5)],
+                         [3, 2, 1])
+
+    def test_faces_at_heights(self):
+        mesh = TriangleMesh()
+        for triangle in _get_triangles():
+            mesh.append(triangle)
+        self.assertEqual(mesh.get_faces_at_heights([3, -1, 0.5, 1, 5]),
+                         [[2], [], [0, 1], [0, 1, 2], []])
+        self.assertEqual(mesh.get_faces_at_heights([4.1, -0.1], tolerance=0.2), [[2], [0, 1]])
+
+    def test_waterline_contours(self):
+        model = Model()
+        for triangle in _get_triangles():
+            model.append(triangle)
+
+        def get_lines(contour):
+            return [(line.p1, line.p2) for polygon in contour.get_polygons()
+                    for line in polygon.get_lines()]
+
+        planes = [Plane((0, 0, z), (0, 0, 1)) for z in (1.5, 0.5, 8)]
+        contours = model.get_waterline_contours(planes)
+        self.assertEqual(len(contours), 3)
+        for plane, contour in zip(planes, contours):
+            expected = model._get_waterline_contour(plane, model.get_mesh())
+            self.assertEqual(get_lines(contour), get_lines(expected))
+        self.assertEqual(len(get_lines(contours[1])), 2)
+        self.assertEqual(get_lines(contours[2]), [])
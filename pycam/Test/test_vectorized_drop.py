@@ -0,0 +1,155 @@
+"""
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+import random
+
+import pytest
+
+import pycam.Test
+from pycam.Cutters.CylindricalCutter import CylindricalCutter
+from pycam.Cutters.SphericalCutter import SphericalCutter
+from pycam.Cutters.ToroidalCutter import ToroidalCutter
+from pycam.Geometry.Model import Model
+from pycam.Geometry.Triangle import Triangle
+from pycam.PathGenerators import get_max_height_dynamic, get_max_height_triangles, \
+        _get_drop_box, _LineTriangles
+
+try:
+    from pycam.PathGenerators.VectorizedDrop import get_max_heights
+except ImportError:
+    get_max_heights = None
+
+
+def _get_wavy_model(size=6, seed=1):
+    """ a surface consisting of slopes, flat areas and a few randomly placed triangles """
+    rand = random.Random(seed)
+    model = Model()
+
+    def get_height(x, y):
+        return 2 + round(math.sin(x) * math.cos(y / 2), 1)
+
+    for x in range(size):
+        for y in range(size):
+            p1 = (x, y, get_height(x, y))
+            p2 = (x + 1, y, get_height(x + 1, y))
+            p3 = (x + 1, y + 1, get_height(x + 1, y + 1))
+            p4 = (x, y + 1, get_height(x, y + 1))
+            model.append(Triangle(p1, p3, p2))
+            model.append(Triangle(p1, p4, p3))
+    for _ in range(8):
+        points = [(rand.uniform(0, size), rand.uniform(0, size), rand.uniform(1, 4))
+                  for _ in range(3)]
+        model.append(Triangle(*points))
+    return model
+
+
+@pytest.mark.skipif(get_max_heights is None, reason="numpy is not available")
+class VectorizedDrop(pycam.Test.PycamTestCase):
+    """Vectorized drop compared to the calculation based on single triangles"""
+
+    def setUp(self):
+        self.model = _get_wavy_model()
+        self.positions = [(x / 4.0 - 0.5, y / 3.0 - 0.5) for x in range(30) for y in range(22)]
+
+    def _compare_drop(self, cutter, minz=0, maxz=10):
+        heights = get_max_heights(self.model, cutter, self.positions, minz, maxz)
+        self.assertEqual(len(heights), len(self.positions))
+        for (x, y), result in zip(self.positions, heights):
+            expected = get_max_height_triangles(self.model, cutter, x, y, minz, maxz)
+            self.assertEqual(result, expected, msg="Position (%f, %f)" % (x, y))
+
+    def test_cylindrical(self):
+        "Drop cylindrical cutter"
+        self._compare_drop(CylindricalCutter(0.7))
+        self._compare_drop(CylindricalCutter(0.2))
+
+    def test_spherical(self):
+        "Drop spherical cutter"
+        self._compare_drop(SphericalCutter(0.7))
+        self._compare_drop(SphericalCutter(0.2))
+
+    def test_toroidal(self):
+        "Drop toroidal cutter"
+        self._compare_drop(ToroidalCutter(0.7, 0.2))
+
+    def test_height_limits(self):
+        "Drop with height limits"
+        # the cutter exceeds "maxz" in some places
+        self._compare_drop(SphericalCutter(0.5), minz=2.5, maxz=3)
+
+    def test_mesh_arrays(self):
+        "Arrays based on the mesh - without Triangle objects"
+        mesh = self.model.get_mesh().copy()
+        model = Model()
+        model.set_mesh(mesh)
+        cutter = CylindricalCutter(0.5)
+        heights = get_max_heights(model, cutter, self.positions, 0, 10)
+        self.assertEqual(heights, get_max_heights(self.model, cutter, self.positions, 0, 10))
+        self.assertEqual(len(mesh._triangles), 0)
+        # the cached arrays are replaced after a change of the model
+        model.append(Triangle((0, 0, 8), (0, 1, 8), (1, 0, 8)))
+        self.assertEqual(get_max_heights(model, cutter, [(0.2, 0.2)], 0, 10), [(0.2, 0.2, 8)])
+
+    def test_empty_model(self):
+        "Drop onto an empty model"
+        cutter = CylindricalCutter(1)
+        self.assertEqual(get_max_heights(Model(), cutter, [(1, 2)], 0, 5), [(1, 2, 0)])
+        self.assertEqual(get_max_heights(None, cutter, [(1, 2)], 0, 5), [(1, 2, 0)])
+
+
+class LineTriangles(pycam.Test.PycamTestCase):
+    """Triangles shared by all drops along a line"""
+
+    def setUp(self):
+        self.model = _get_wavy_model()
+
+    def test_candidates(self):
+        "Candidates of a line compared to the spatial index"
+        cutter = SphericalCutter(0.4)
+        for line in ([(x / 5.0 - 1, 2.2) for x in range(40)],
+                     [(3.1, y / 5.0 - 1) for y in range(40)],
+                     [(x / 7.0, x / 9.0) for x in range(40)]):
+            line_triangles = _LineTriangles(self.model, cutter, line, 1)
+            # include positions between the given ones
+            middles = [((x1 + x2) / 2, (y1 + y2) / 2)
+                       for (x1, y1), (x2, y2) in zip(line, line[1:])]
+            for x, y in line + middles:
+                expected = self.model.triangles(*_get_drop_box(cutter, x, y, 1))
+                self.assertEqual(sorted(id(t) for t in line_triangles.get_triangles(x, y)),
+                                 sorted(id(t) for t in expected))
+
+    def test_dynamic_drop(self):
+        "Drop along a line with inserted points"
+        cutter = CylindricalCutter(0.3)
+        line = [(x / 3.0, 1.7) for x in range(20)]
+        points = get_max_height_dynamic(self.model, cutter, line, 0, 10)
+        self.assertGreater(len(points), 2)
+        for x, y, z in points:
+            self.assertEqual((x, y, z), get_max_height_triangles(self.model, cutter, x, y, 0, 10))
+
+    def test_early_termination(self):
+        "Drop onto the highest triangles first"
+        for cutter in (SphericalCutter(0.6), ToroidalCutter(0.7, 0.2)):
+            for distance in (0, 0.3):
+                cutter.set_required_distance(distance)
+                for x, y in ((1.3, 2.7), (4.2, 0.8), (5.5, 5.1)):
+                    # calculate the maximum height without skipping any triangle
+                    heights = [cut[2] for cut in (cutter.drop(t, start=(x, y, 10))
+                                                  for t in self.model) if cut]
+                    self.assertEqual(get_max_height_triangles(self.model, cutter, x, y, 0, 10),
+                                     (x, y, max(heights)))
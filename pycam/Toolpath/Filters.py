@@ -20,16 +20,21 @@ along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 
 import collections
 import decimal
+import math
 
 from pycam.Geometry import epsilon
 from pycam.Geometry.Line import Line
 from pycam.Geometry.PointUtils import padd, psub, pmul, pdist, pnear, ptransform_by_matrix
-from pycam.Toolpath import MOVE_SAFETY, MOVES_LIST, MACHINE_SETTING
+from pycam.Toolpath import MOVE_STRAIGHT, MOVE_ARC, MOVE_SAFETY, MOVES_LIST, MACHINE_SETTING
 import pycam.Toolpath.Steps as ToolpathSteps
 import pycam.Utils.log
 
 
 MAX_DIGITS = 12
+# arc fitting: the minimum number of straight moves being replaced by an arc
+MIN_ARC_MOVES = 3
+# arc fitting: the maximum number of consecutive straight moves being collected before fitting
+MAX_ARC_MOVES = 1000
 
 _log = pycam.Utils.log.get_logger()
 
@@ -64,11 +69,30 @@ def toolpath_filter(our_category, key):
 
 
 def get_filtered_moves(moves, filters):
-    filters = list(filters)
-    moves = list(moves)
-    filters.sort()
+    """ apply the filters (ordered by their weight) to the moves and return the resulting list
+
+    The filters are combined into a single pass: every step runs through all filters before the
+    next one is processed.  No intermediate copies of the toolpath are created (except for
+    filters without a streaming implementation).  The result is the same as for applying the
+    filters one after another.
+    """
+    return list(iterate_filtered_moves(moves, filters))
+
+
+def iterate_filtered_moves(moves, filters):
+    """ apply the filters to a sequence of moves step by step (see "get_filtered_moves")
+
+    The moves may be a generator.  The result is an iterator: the steps are delivered as soon as
+    all filters processed them.  Filters without a streaming implementation collect all steps
+    before delivering the first one.
+    """
+    filters = sorted(filters)
+    # allow to use pycam.Toolpath.Toolpath instances (instead of a list)
+    if hasattr(moves, "path") and hasattr(moves, "filters"):
+        moves = moves.path
+    moves = iter(moves)
     for one_filter in filters:
-        moves |= one_filter
+        moves = one_filter.iterate_toolpath(moves)
     return moves
 
 
@@ -127,16 +151,37 @@ class BaseFilter:
         raise NotImplementedError(("The filter class %s failed to implement the 'filter_toolpath' "
                                    "method") % str(type(self)))
 
+    def iterate_toolpath(self, toolpath):
+        """ apply the filter to an iterable of steps and return an iterator of the result
+
+        This default implementation needs to process a complete copy of the toolpath.
+        """
+        _log.debug("Applying toolpath filter: %s", self.__class__)
+        return iter(self.filter_toolpath(list(toolpath)))
+
+
+class StreamFilter(BaseFilter):
+    """ base class for filters processing a toolpath step by step
+
+    The filter keeps only a bounded state - thus it is suitable for huge toolpaths.
+    """
+
+    def filter_toolpath(self, toolpath):
+        return list(self.iterate_toolpath(toolpath))
+
+    def iterate_toolpath(self, toolpath):
+        raise NotImplementedError(("The filter class %s failed to implement the "
+                                   "'iterate_toolpath' method") % str(type(self)))
 
-class SafetyHeight(BaseFilter):
+
+class SafetyHeight(StreamFilter):
 
     PARAMS = ("safety_height", )
     WEIGHT = 80
 
-    def filter_toolpath(self, toolpath):
+    def iterate_toolpath(self, toolpath):
         last_pos = None
         max_height = None
-        new_path = []
         safety_pending = False
         get_safe = lambda pos: tuple((pos[0], pos[1], self.settings["safety_height"]))
         for step in toolpath:
@@ -149,7 +194,7 @@ class SafetyHeight(BaseFilter):
                 if not last_pos:
                     # there was a safety move (or no move at all) before
                     # -> move sideways
-                    new_path.append(ToolpathSteps.MoveStraightRapid(get_safe(new_pos)))
+                    yield ToolpathSteps.MoveStraightRapid(get_safe(new_pos))
                 elif safety_pending:
                     safety_pending = False
                     if pnear(last_pos, new_pos, axes=(0, 1)):
@@ -157,39 +202,44 @@ class SafetyHeight(BaseFilter):
                         pass
                     else:
                         # go up, sideways and down
-                        new_path.append(ToolpathSteps.MoveStraightRapid(get_safe(last_pos)))
-                        new_path.append(ToolpathSteps.MoveStraightRapid(get_safe(new_pos)))
+                        yield ToolpathSteps.MoveStraightRapid(get_safe(last_pos))
+                        yield ToolpathSteps.MoveStraightRapid(get_safe(new_pos))
                 else:
                     # we are in the middle of usual moves -> keep going
                     pass
-                new_path.append(step)
+                yield step
                 last_pos = new_pos
             else:
                 # unknown move -> keep it
-                new_path.append(step)
+                yield step
         # process pending safety moves
         if safety_pending and last_pos:
-            new_path.append(ToolpathSteps.MoveStraightRapid(get_safe(last_pos)))
+            yield ToolpathSteps.MoveStraightRapid(get_safe(last_pos))
         if max_height > self.settings["safety_height"]:
             _log.warn("Toolpath exceeds safety height: %f => %f",
                       max_height, self.settings["safety_height"])
-        return new_path
 
 
-class MachineSetting(BaseFilter):
+class MachineSetting(StreamFilter):
 
     PARAMS = ("key", "value")
     WEIGHT = 20
 
-    def filter_toolpath(self, toolpath):
-        result = []
+    def iterate_toolpath(self, toolpath):
+        toolpath = iter(toolpath)
+        next_step = None
         # move all previous machine settings
-        while toolpath and toolpath[0].action == MACHINE_SETTING:
-            result.append(toolpath.pop(0))
+        for step in toolpath:
+            if step.action != MACHINE_SETTING:
+                next_step = step
+                break
+            yield step
         # add the new setting
         for key, value in self._get_settings():
-            result.append(ToolpathSteps.MachineSetting(key, value))
-        return result + toolpath
+            yield ToolpathSteps.MachineSetting(key, value)
+        if next_step is not None:
+            yield next_step
+        yield from toolpath
 
     def _get_settings(self):
         return [(self.settings["key"], self.settings["value"])]
@@ -214,22 +264,27 @@ class CornerStyle(MachineSetting):
                                  self.settings["naive_tolerance"])
 
 
-class SelectTool(BaseFilter):
+class SelectTool(StreamFilter):
 
     PARAMS = ("tool_id", )
     WEIGHT = 35
 
-    def filter_toolpath(self, toolpath):
-        index = 0
+    def iterate_toolpath(self, toolpath):
+        toolpath = iter(toolpath)
+        next_step = None
         # skip all non-moves
-        while (index < len(toolpath)) and (toolpath[index][0] not in MOVES_LIST):
-            index += 1
-        toolpath.insert(index, ToolpathSteps.MachineSetting("select_tool",
-                                                            self.settings["tool_id"]))
-        return toolpath
+        for step in toolpath:
+            if step.action in MOVES_LIST:
+                next_step = step
+                break
+            yield step
+        yield ToolpathSteps.MachineSetting("select_tool", self.settings["tool_id"])
+        if next_step is not None:
+            yield next_step
+        yield from toolpath
 
 
-class TriggerSpindle(BaseFilter):
+class TriggerSpindle(StreamFilter):
     """ control the spindle spin for each tool selection
 
     A spin-up command is added after each tool selection.
@@ -241,42 +296,70 @@ class TriggerSpindle(BaseFilter):
     PARAMS = ("delay", )
     WEIGHT = 36
 
-    def filter_toolpath(self, toolpath):
-        def spin_up(path, index):
-            path.insert(index, ToolpathSteps.MachineSetting("spindle_enabled", True))
+    def iterate_toolpath(self, toolpath):
+        return self._add_final_spin_down(self._add_spin_up(toolpath))
+
+    def _add_spin_up(self, toolpath):
+        """ add the spin-up and spin-down commands around tool selections
+
+        The steps starting with the first move are kept back until a tool selection or the end of
+        the toolpath is reached, if no tool was selected before.  This happens only for toolpaths
+        without a preceding tool selection (see SelectTool).
+        """
+        def spin_up():
+            yield ToolpathSteps.MachineSetting("spindle_enabled", True)
             if self.settings["delay"]:
-                path.insert(index + 1, ToolpathSteps.MachineSetting("delay",
-                                                                    self.settings["delay"]))
-
-        def spin_down(path, index):
-            path.insert(index, ToolpathSteps.MachineSetting("spindle_enabled", False))
-
-        # find all positions of "select_tool"
-        tool_changes = [index for index, step in enumerate(toolpath)
-                        if (step.action == MACHINE_SETTING) and (step.key == "select_tool")]
-        if tool_changes:
-            tool_changes.reverse()
-            for index in tool_changes:
-                spin_up(toolpath, index + 1)
-                if index > 0:
+                yield ToolpathSteps.MachineSetting("delay", self.settings["delay"])
+
+        is_first_step = True
+        tool_selected = False
+        held_steps = None
+        for step in toolpath:
+            if (step.action == MACHINE_SETTING) and (step.key == "select_tool"):
+                if held_steps is not None:
+                    yield from held_steps
+                    held_steps = None
+                if not is_first_step:
                     # add a "disable"
-                    spin_down(toolpath, index)
-        else:
-            # add a single spin-up before the first move
-            for index, step in enumerate(toolpath):
-                if step.action in MOVES_LIST:
-                    spin_up(toolpath, index)
-                    break
-        # add "stop spindle" just after the last move
-        index = len(toolpath) - 1
-        while (toolpath[index].action not in MOVES_LIST) and (index > 0):
-            index -= 1
-        if toolpath[index].action in MOVES_LIST:
-            spin_down(toolpath, index + 1)
-        return toolpath
-
-
-class SpindleSpeed(BaseFilter):
+                    yield ToolpathSteps.MachineSetting("spindle_enabled", False)
+                yield step
+                yield from spin_up()
+                tool_selected = True
+            elif held_steps is not None:
+                held_steps.append(step)
+            elif (step.action in MOVES_LIST) and not tool_selected:
+                held_steps = [step]
+            else:
+                yield step
+            is_first_step = False
+        if held_steps is not None:
+            # no tool selection is found: add a single spin-up before the first move
+            yield from spin_up()
+            yield from held_steps
+
+    def _add_final_spin_down(self, toolpath):
+        """ add "stop spindle" just after the last move
+
+        The non-move steps following the latest move are kept back until the next move arrives.
+        """
+        is_moving = False
+        pending = []
+        for step in toolpath:
+            if step.action in MOVES_LIST:
+                yield from pending
+                pending = []
+                yield step
+                is_moving = True
+            elif is_moving:
+                pending.append(step)
+            else:
+                yield step
+        if is_moving:
+            yield ToolpathSteps.MachineSetting("spindle_enabled", False)
+        yield from pending
+
+
+class SpindleSpeed(StreamFilter):
     """ add a spindle speed command after each tool selection
 
     If no tool selection is found, then a single spindle speed command is inserted before the first
@@ -286,35 +369,42 @@ class SpindleSpeed(BaseFilter):
     PARAMS = ("speed", )
     WEIGHT = 37
 
-    def filter_toolpath(self, toolpath):
-        def set_speed(path, index):
-            path.insert(index, ToolpathSteps.MachineSetting("spindle_speed",
-                                                            self.settings["speed"]))
-
-        # find all positions of "select_tool"
-        tool_changes = [index for index, step in enumerate(toolpath)
-                        if (step.action == MACHINE_SETTING) and (step.key == "select_tool")]
-        if tool_changes:
-            tool_changes.reverse()
-            for index in tool_changes:
-                set_speed(toolpath, index + 1)
-        else:
+    def iterate_toolpath(self, toolpath):
+        """ process the toolpath step by step
+
+        The steps starting with the first move are kept back until a tool selection or the end of
+        the toolpath is reached, if no tool was selected before.
+        """
+        get_speed = lambda: ToolpathSteps.MachineSetting("spindle_speed", self.settings["speed"])
+        tool_selected = False
+        held_steps = None
+        for step in toolpath:
+            if (step.action == MACHINE_SETTING) and (step.key == "select_tool"):
+                if held_steps is not None:
+                    yield from held_steps
+                    held_steps = None
+                yield step
+                yield get_speed()
+                tool_selected = True
+            elif held_steps is not None:
+                held_steps.append(step)
+            elif (step.action in MOVES_LIST) and not tool_selected:
+                held_steps = [step]
+            else:
+                yield step
+        if held_steps is not None:
             # no tool selections: add a single spindle speed command before the first move
-            for index, step in enumerate(toolpath):
-                if step.action in MOVES_LIST:
-                    set_speed(toolpath, index)
-                    break
-        return toolpath
+            yield get_speed()
+            yield from held_steps
 
 
-class PlungeFeedrate(BaseFilter):
+class PlungeFeedrate(StreamFilter):
 
     PARAMS = ("plunge_feedrate", )
     # must be greater than the weight of the SafetyHeight filter
     WEIGHT = 82
 
-    def filter_toolpath(self, toolpath):
-        new_path = []
+    def iterate_toolpath(self, toolpath):
         last_pos = None
         original_feedrate = None
         current_feedrate = None
@@ -335,29 +425,26 @@ class PlungeFeedrate(BaseFilter):
                     max_feedrate = min(original_feedrate, max_feedrate)
                     if current_feedrate != max_feedrate:
                         # we are too slow or too fast
-                        new_path.append(ToolpathSteps.MachineSetting("feedrate", max_feedrate))
+                        yield ToolpathSteps.MachineSetting("feedrate", max_feedrate)
                         current_feedrate = max_feedrate
                 else:
                     # we do not move down
                     if current_feedrate != original_feedrate:
                         # switch back to the maximum feedrate
-                        new_path.append(ToolpathSteps.MachineSetting("feedrate",
-                                                                     original_feedrate))
+                        yield ToolpathSteps.MachineSetting("feedrate", original_feedrate)
                         current_feedrate = original_feedrate
                 last_pos = step.position
             else:
                 pass
-            new_path.append(step)
-        return new_path
+            yield step
 
 
-class Crop(BaseFilter):
+class Crop(StreamFilter):
 
     PARAMS = ("polygons", )
     WEIGHT = 90
 
-    def filter_toolpath(self, toolpath):
-        new_path = []
+    def iterate_toolpath(self, toolpath):
         last_pos = None
         optional_moves = []
         for step in toolpath:
@@ -371,16 +458,14 @@ class Crop(BaseFilter):
                     # turn these lines into moves
                     for line in inner_lines:
                         if pdist(line.p1, last_pos) > epsilon:
-                            new_path.append(ToolpathSteps.MoveSafety())
-                            new_path.append(
-                                ToolpathSteps.get_step_class_by_action(step.action)(line.p1))
+                            yield ToolpathSteps.MoveSafety()
+                            yield ToolpathSteps.get_step_class_by_action(step.action)(line.p1)
                         else:
                             # we continue where we left
                             if optional_moves:
-                                new_path.extend(optional_moves)
+                                yield from optional_moves
                                 optional_moves = []
-                        new_path.append(
-                            ToolpathSteps.get_step_class_by_action(step.action)(line.p2))
+                        yield ToolpathSteps.get_step_class_by_action(step.action)(line.p2)
                         last_pos = line.p2
                     optional_moves = []
                     # finish the line by moving to its end (if necessary)
@@ -391,29 +476,26 @@ class Crop(BaseFilter):
             elif step.action == MOVE_SAFETY:
                 optional_moves = []
             else:
-                new_path.append(step)
-        return new_path
+                yield step
 
 
-class TransformPosition(BaseFilter):
+class TransformPosition(StreamFilter):
     """ shift or rotate a toolpath based on a given 3x3 or 3x4 matrix
     """
 
     PARAMS = ("matrix", )
     WEIGHT = 85
 
-    def filter_toolpath(self, toolpath):
-        new_path = []
+    def iterate_toolpath(self, toolpath):
         for step in toolpath:
             if step.action in MOVES_LIST:
                 new_pos = ptransform_by_matrix(step.position, self.settings["matrix"])
-                new_path.append(ToolpathSteps.get_step_class_by_action(step.action)(new_pos))
+                yield ToolpathSteps.get_step_class_by_action(step.action)(new_pos)
             else:
-                new_path.append(step)
-        return new_path
+                yield step
 
 
-class TimeLimit(BaseFilter):
+class TimeLimit(StreamFilter):
     """ This filter is used for the toolpath simulation. It returns only a partial toolpath within
     a given duration limit.
     """
@@ -421,9 +503,8 @@ class TimeLimit(BaseFilter):
     PARAMS = ("timelimit", )
     WEIGHT = 100
 
-    def filter_toolpath(self, toolpath):
+    def iterate_toolpath(self, toolpath):
         feedrate = min_feedrate = 1
-        new_path = []
         last_pos = None
         limit = self.settings["timelimit"]
         duration = 0
@@ -441,32 +522,177 @@ class TimeLimit(BaseFilter):
                         duration += new_duration
                 else:
                     destination = step.position
-                new_path.append(ToolpathSteps.get_step_class_by_action(step.action)(destination))
+                if destination is step.position:
+                    yield step
+                elif step.action == MOVE_ARC:
+                    # the partial arc is approximated by a straight move
+                    yield ToolpathSteps.MoveStraight(destination)
+                else:
+                    yield ToolpathSteps.get_step_class_by_action(step.action)(destination)
                 last_pos = step.position
             if (step.action == MACHINE_SETTING) and (step.key == "feedrate"):
                 feedrate = step.value
             if duration >= limit:
                 break
-        return new_path
 
 
-class MovesOnly(BaseFilter):
+def _get_arc(start, points, tolerance):
+    """ try to describe the straight moves from "start" via all "points" as a single arc
+
+    The arc lies in the xy plane.  The height may change linearly along the arc (helix).  All
+    points and the straight moves between them are within the tolerance of the arc.
+    @returns: the center (x, y) of the arc and its direction (True for clockwise) or None
+    """
+    end = points[-1]
+    middle = points[len(points) // 2]
+    # the center of the circle through the start, the middle and the end
+    ax, ay = middle[0] - start[0], middle[1] - start[1]
+    bx, by = end[0] - start[0], end[1] - start[1]
+    determinant = 2 * (ax * by - ay * bx)
+    if abs(determinant) < epsilon:
+        return None
+    a_square, b_square = ax * ax + ay * ay, bx * bx + by * by
+    center = (start[0] + (by * a_square - ay * b_square) / determinant,
+              start[1] + (ax * b_square - bx * a_square) / determinant)
+    radius = math.hypot(start[0] - center[0], start[1] - center[1])
+    # the maximum angle between two points: the straight move deviates by the sagitta
+    max_step_angle = 2 * math.acos(max(-1, 1 - tolerance / radius))
+    previous_angle = math.atan2(start[1] - center[1], start[0] - center[0])
+    sweep = 0
+    sweeps = []
+    for point in points:
+        if abs(math.hypot(point[0] - center[0], point[1] - center[1]) - radius) > tolerance:
+            return None
+        angle = math.atan2(point[1] - center[1], point[0] - center[0])
+        step_angle = (angle - previous_angle + math.pi) % (2 * math.pi) - math.pi
+        if (abs(step_angle) > max_step_angle) or (step_angle * sweep < 0):
+            return None
+        sweep += step_angle
+        sweeps.append(sweep)
+        previous_angle = angle
+    if not epsilon < abs(sweep) < 2 * math.pi - epsilon:
+        return None
+    for point, point_sweep in zip(points, sweeps):
+        if abs(start[2] + (end[2] - start[2]) * point_sweep / sweep - point[2]) > tolerance:
+            return None
+    return center, sweep < 0
+
+
+def _is_straight(start, points, tolerance):
+    """ check if all points are within the tolerance of the line from "start" to the last point
+    """
+    dx, dy = points[-1][0] - start[0], points[-1][1] - start[1]
+    limit = tolerance * math.hypot(dx, dy)
+    return all(abs((point[0] - start[0]) * dy - (point[1] - start[1]) * dx) <= limit
+               for point in points)
+
+
+def _find_longest_arc(start, points, first, tolerance):
+    """ find the largest number of points (beginning at "first") fitting into an arc
+
+    Straight lines (within the tolerance) are not turned into arcs.  But the beginning of an arc
+    may be straight within the tolerance.
+    @returns: the number of points and the arc (see "_get_arc") or None
+    """
+    best = None
+    low = 0
+    high = len(points) - first + 1
+    size = MIN_ARC_MOVES
+    # double the size until the arc does not fit anymore
+    while first + size <= len(points):
+        arc = _get_arc(start, points[first:first + size], tolerance)
+        if arc is None:
+            high = size
+            break
+        low = size
+        if not _is_straight(start, points[first:first + size], tolerance):
+            best = (size, arc)
+        size *= 2
+    if best is None:
+        return None
+    # binary search between the longest known arc and the shortest known failure
+    while high - low > 1:
+        size = (low + high) // 2
+        arc = _get_arc(start, points[first:first + size], tolerance)
+        if arc is None:
+            high = size
+        else:
+            low = size
+            best = (size, arc)
+    return best
+
+
+class ArcFit(StreamFilter):
+    """ replace sequences of straight moves along a circular arc with arc moves
+
+    Only arcs in the xy plane are detected.  All original positions are within the given
+    tolerance of the arc.  The toolpath is processed in pieces of consecutive straight moves.
+
+    The filter runs after StepWidth: the arcs are fitted to the positions remaining after the
+    step width limitation (a staircase of axis-aligned moves), not to the positions calculated
+    by the path generator.  Thus the arcs follow the machine path within the tolerance, but they
+    may differ considerably from the original shape (e.g. a smaller radius).
+    """
+
+    PARAMS = ("tolerance", )
+    # the arcs are not supported by the filters changing positions (e.g. StepWidth)
+    WEIGHT = 92
+
+    def iterate_toolpath(self, toolpath):
+        position = None
+        pending = []
+        for step in toolpath:
+            if (step.action == MOVE_STRAIGHT) and (position is not None) \
+                    and (len(step.position) == 3):
+                pending.append(step.position)
+                if len(pending) >= MAX_ARC_MOVES:
+                    yield from self._get_fitted_moves(position, pending)
+                    position = pending[-1]
+                    pending = []
+            else:
+                yield from self._get_fitted_moves(position, pending)
+                if pending:
+                    position = pending[-1]
+                    pending = []
+                yield step
+                if step.action in MOVES_LIST:
+                    position = step.position if len(step.position) == 3 else None
+                elif step.action == MOVE_SAFETY:
+                    position = None
+        yield from self._get_fitted_moves(position, pending)
+
+    def _get_fitted_moves(self, start, points):
+        index = 0
+        while index < len(points):
+            found = _find_longest_arc(start, points, index, self.settings["tolerance"])
+            if found is None:
+                start = points[index]
+                yield ToolpathSteps.MoveStraight(start)
+                index += 1
+            else:
+                size, (center, clockwise) = found
+                index += size
+                start = points[index - 1]
+                yield ToolpathSteps.MoveArc(start, center, clockwise)
+
+
+class MovesOnly(StreamFilter):
     """ Use this filter for checking if a given toolpath is empty/useless
     (only machine settings, safety moves, ...).
     """
 
     WEIGHT = 95
 
-    def filter_toolpath(self, toolpath):
-        return [step for step in toolpath if step.action in MOVES_LIST]
+    def iterate_toolpath(self, toolpath):
+        return (step for step in toolpath if step.action in MOVES_LIST)
 
 
-class Copy(BaseFilter):
+class Copy(StreamFilter):
 
     WEIGHT = 100
 
-    def filter_toolpath(self, toolpath):
-        return list(toolpath)
+    def iterate_toolpath(self, toolpath):
+        return iter(toolpath)
 
 
 def _get_num_of_significant_digits(number):
@@ -498,13 +724,20 @@ def _get_num_converter(step_width):
     return conv_func, format_string
 
 
-class StepWidth(BaseFilter):
+class StepWidth(StreamFilter):
 
     PARAMS = ("step_width", )
     NUM_OF_AXES = 3
     WEIGHT = 60
 
-    def filter_toolpath(self, toolpath):
+    def get_number_formats(self):
+        """ return the format string (e.g. "%.3f") matching the step width of every axis
+
+        The GCode exporters use these formats for rendering the coordinates.
+        """
+        return {key: _get_num_converter(self.settings["step_width"][key])[1] for key in "xyz"}
+
+    def iterate_toolpath(self, toolpath):
         minimum_steps = []
         conv = []
         for key in "xyz":
@@ -512,7 +745,6 @@ class StepWidth(BaseFilter):
         for step_width in minimum_steps:
             conv.append(_get_num_converter(step_width)[0])
         last_pos = None
-        path = []
         for step in toolpath:
             if step.action in MOVES_LIST:
                 if last_pos:
@@ -541,11 +773,10 @@ class StepWidth(BaseFilter):
                 # conversion needs to move into the GCode output hook.
 #               destination = [a_conv(a_pos) for a_conv, a_pos in zip(conv, step.position)]
                 destination = real_target_position
-                path.append(ToolpathSteps.get_step_class_by_action(step.action)(destination))
+                yield ToolpathSteps.get_step_class_by_action(step.action)(destination)
                 # We store the real machine position (instead of the "wanted" position).
                 last_pos = real_target_position
             else:
                 # forget "last_pos" - we don't know what happened in between
                 last_pos = None
-                path.append(step)
-        return path
+                yield step
@@ -0,0 +1,305 @@
+"""
+compact storage of toolpath steps
+
+The action codes and the positions of all steps are stored in contiguous arrays (about 25 bytes
+per move).  Machine settings, comments and other unusual steps are kept in a separate table.
+Step objects (see pycam.Toolpath.Steps) are created on request.
+
+Bounds and the cumulative machine time of all steps are calculated with numpy (if
+available).
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import array
+import bisect
+import math
+
+from pycam.Geometry.PointUtils import padd, pdist, pmul, psub
+from pycam.Toolpath import MOVES_LIST, MOVE_ARC, MOVE_SAFETY, MACHINE_SETTING, COMMENT
+from pycam.Toolpath.Steps import MoveClass, MachineSettingClass, CommentClass, ArcClass
+
+try:
+    import numpy
+except ImportError:
+    # numpy is not available: use the (slower) calculation based on single steps
+    numpy = None
+
+
+# the action code of steps stored in the side table
+ACTION_EXTRA = -1
+# the feedrate of moves without a preceding feedrate setting (see "get_time_index")
+MIN_FEEDRATE = 1
+
+_NO_POSITION = (math.nan, math.nan, math.nan)
+
+
+def _restore_step(values):
+    """ turn the plain tuple of a step back into a step (see "MoveArray.__getstate__") """
+    if values[0] == MACHINE_SETTING:
+        return MachineSettingClass(*values)
+    elif values[0] == COMMENT:
+        return CommentClass(*values)
+    elif (values[0] == MOVE_ARC) and (len(values) == len(ArcClass._fields)):
+        return ArcClass(*values)
+    else:
+        return MoveClass(*values)
+
+
+class MoveArray:
+    """ a read-only sequence of toolpath steps
+
+    Every step uses one action code in "actions" and three consecutive values in "positions".
+    Safety moves and all steps in the side table ("extras") use NaN values as their position.
+    The side table contains all steps besides safety moves and moves with three coordinates
+    (e.g. machine settings and comments) by their index.
+    """
+
+    def __init__(self, steps=()):
+        self.actions = array.array("b")
+        self.positions = array.array("d")
+        self.extras = {}
+        self._hash = None
+        self._bounds = None
+        self._time_index = None
+        for step in steps:
+            self._append(step)
+
+    def __getstate__(self):
+        # Skip cached data for pickling.  The step classes cannot be pickled - use plain tuples.
+        return {"actions": self.actions, "positions": self.positions,
+                "extras": {index: tuple(step) for index, step in self.extras.items()}}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.actions = state["actions"]
+        self.positions = state["positions"]
+        self.extras = {index: _restore_step(values) for index, values in state["extras"].items()}
+
+    def _append(self, step):
+        if (step.action in MOVES_LIST) and isinstance(step, MoveClass) \
+                and (len(step.position) == 3):
+            self.actions.append(step.action)
+            self.positions.extend(step.position)
+        elif (step.action == MOVE_SAFETY) and isinstance(step, MoveClass):
+            self.actions.append(MOVE_SAFETY)
+            self.positions.extend(_NO_POSITION)
+        else:
+            self.extras[len(self.actions)] = step
+            self.actions.append(ACTION_EXTRA)
+            self.positions.extend(_NO_POSITION)
+
+    def _get_step(self, index):
+        action = self.actions[index]
+        if action == ACTION_EXTRA:
+            return self.extras[index]
+        elif action == MOVE_SAFETY:
+            return MoveClass(MOVE_SAFETY, None)
+        else:
+            return MoveClass(action, tuple(self.positions[3 * index:3 * index + 3]))
+
+    def __len__(self):
+        return len(self.actions)
+
+    def __iter__(self):
+        for index in range(len(self.actions)):
+            yield self._get_step(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self._get_step(one_index)
+                         for one_index in range(*index.indices(len(self))))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Toolpath step index out of range: %d" % index)
+        return self._get_step(index)
+
+    def __eq__(self, other):
+        if isinstance(other, MoveArray):
+            # compare the bytes: NaN values are not equal to themselves
+            return ((self.actions == other.actions)
+                    and (self.positions.tobytes() == other.positions.tobytes())
+                    and (self.extras == other.extras))
+        elif isinstance(other, (list, tuple)):
+            return (len(self) == len(other)) and all(a == b for a, b in zip(self, other))
+        else:
+            return NotImplemented
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.actions.tobytes(), self.positions.tobytes(),
+                               tuple(sorted(self.extras.items()))))
+        return self._hash
+
+    def __repr__(self):
+        return "MoveArray(%d steps)" % len(self)
+
+    def _has_extra_moves(self):
+        """ check if the side table contains moves (e.g. with more than three axes) """
+        return any(step.action in MOVES_LIST for step in self.extras.values())
+
+    def get_bounds(self):
+        """ return the lowest and the highest coordinates of all moves or None (without moves)
+        """
+        if self._bounds is None:
+            if (numpy is not None) and not self._has_extra_moves():
+                positions = self._get_move_positions()
+                if len(positions):
+                    self._bounds = (tuple(positions.min(axis=0).tolist()),
+                                    tuple(positions.max(axis=0).tolist()))
+            else:
+                positions = [step.position for step in self if step.action in MOVES_LIST]
+                if positions:
+                    self._bounds = (tuple(min(values) for values in zip(*positions)),
+                                    tuple(max(values) for values in zip(*positions)))
+        return self._bounds
+
+    def get_machine_distance_and_time(self):
+        """ calculate the length of all moves and the time required by the machine
+
+        The time is based on the most recent feedrate setting (in units per minute) for every
+        move.
+        @returns: the distance and the duration in minutes
+        """
+        if not len(self):
+            return 0, 0
+        distances, times = self.get_time_index()
+        return float(distances[-1]), float(times[-1])
+
+    def get_time_index(self):
+        """ return the cumulative distance and machine time (in minutes) after every step
+
+        Both sequences (numpy arrays or arrays) contain one value for every step.  They are
+        calculated only once.
+        """
+        if self._time_index is None:
+            if (numpy is not None) and not self._has_extra_moves():
+                self._time_index = self._get_time_index_vectorized()
+            else:
+                distances = array.array("d")
+                times = array.array("d")
+                length = 0
+                duration = 0
+                feedrate = MIN_FEEDRATE
+                current_position = None
+                for step in self:
+                    if (step.action == MACHINE_SETTING) and (step.key == "feedrate"):
+                        feedrate = step.value
+                    elif step.action in MOVES_LIST:
+                        if current_position is not None:
+                            distance = pdist(step.position, current_position)
+                            duration += distance / max(feedrate, MIN_FEEDRATE)
+                            length += distance
+                        current_position = step.position
+                    distances.append(length)
+                    times.append(duration)
+                self._time_index = distances, times
+        return self._time_index
+
+    def get_partial_moves(self, max_time):
+        """ return the moves processed by the machine within the given time (in minutes)
+
+        The last move ends at the position reached at this time.  The result is the same as for
+        the filter TimeLimit (apart from rounding errors).  The end is located via a binary search
+        in the time index.
+        """
+        times = self.get_time_index()[1]
+        # the first step reaching the time limit is the last one to be processed
+        end = min(bisect.bisect_left(times, max_time) + 1, len(self))
+        if (numpy is not None) and not self._has_extra_moves():
+            mask = self._get_move_mask()[:end]
+            positions = numpy.frombuffer(self.positions, dtype=float).reshape((-1, 3))
+            result = MoveArray()
+            result.actions = array.array(
+                "b", numpy.frombuffer(self.actions, dtype=numpy.int8)[:end][mask].tobytes())
+            result.positions = array.array("d", positions[:end][mask].tobytes())
+            if (end > 0) and mask[end - 1]:
+                result.positions[-3:] = array.array("d", self.get_position_at_time(max_time))
+            return result
+        else:
+            steps = [step for step in self[:end] if step.action in MOVES_LIST]
+            if steps and self._is_move(end - 1):
+                steps[-1] = MoveClass(steps[-1].action, self.get_position_at_time(max_time))
+            return MoveArray(steps)
+
+    def get_position_at_time(self, max_time):
+        """ return the position of the machine at the given time (in minutes) or None
+
+        The position is interpolated within the move being processed at this time.  None is
+        returned if the toolpath does not contain any moves.
+        """
+        times = self.get_time_index()[1]
+        end = bisect.bisect_left(times, max_time)
+        if end >= len(self):
+            end = len(self) - 1
+        # find the move being processed at the given time
+        while (end >= 0) and not self._is_move(end):
+            end -= 1
+        if end < 0:
+            return None
+        position = self._get_step(end).position
+        if times[end] <= max_time:
+            return position
+        previous = end - 1
+        while (previous >= 0) and not self._is_move(previous):
+            previous -= 1
+        if previous < 0:
+            # the first move: no time is required for reaching its position
+            return position
+        start = self._get_step(previous).position
+        partial = (max_time - times[previous]) / (times[end] - times[previous])
+        return tuple(padd(start, pmul(psub(position, start), partial)))
+
+    def _is_move(self, index):
+        action = self.actions[index]
+        if action == ACTION_EXTRA:
+            return self.extras[index].action in MOVES_LIST
+        else:
+            return action in MOVES_LIST
+
+    def _get_move_mask(self):
+        return numpy.isin(numpy.frombuffer(self.actions, dtype=numpy.int8), MOVES_LIST)
+
+    def _get_move_positions(self):
+        positions = numpy.frombuffer(self.positions, dtype=float).reshape((-1, 3))
+        return positions[self._get_move_mask()]
+
+    def _get_feedrates(self):
+        """ return the feedrate that is valid for every step (as a numpy array)
+
+        Steps without a preceding feedrate setting use MIN_FEEDRATE.
+        """
+        feedrates = numpy.full(len(self), math.nan)
+        for index, step in self.extras.items():
+            if (step.action == MACHINE_SETTING) and (step.key == "feedrate"):
+                feedrates[index] = step.value
+        # propagate every value to the following steps
+        defined = numpy.where(numpy.isnan(feedrates), -1, numpy.arange(len(feedrates)))
+        latest = numpy.maximum.accumulate(defined) if len(defined) else defined
+        return numpy.where(latest >= 0, feedrates[numpy.maximum(latest, 0)], MIN_FEEDRATE)
+
+    def _get_time_index_vectorized(self):
+        move_indices = numpy.flatnonzero(self._get_move_mask())
+        step_distances = numpy.zeros(len(self))
+        step_times = numpy.zeros(len(self))
+        if len(move_indices) > 1:
+            positions = numpy.frombuffer(self.positions, dtype=float).reshape((-1, 3))
+            distances = numpy.sqrt((numpy.diff(positions[move_indices], axis=0) ** 2).sum(axis=1))
+            feedrates = numpy.maximum(self._get_feedrates()[move_indices[1:]], MIN_FEEDRATE)
+            step_distances[move_indices[1:]] = distances
+            step_times[move_indices[1:]] = distances / feedrates
+        return numpy.cumsum(step_distances), numpy.cumsum(step_times)
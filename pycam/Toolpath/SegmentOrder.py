@@ -0,0 +1,415 @@
+"""
+reorder the cutting segments of toolpath layers for short travel moves
+
+A segment is a sequence of cutting moves between two safety moves.  The segments of a layer (e.g.
+the lines of a grid) are processed in a new order:
+    * segments continuing each other (within the tolerance) are merged into chains
+    * the chains are ordered by a nearest neighbour heuristic - followed by 2-opt improvements
+    * no safety move is added between chains continuing each other
+
+The layers keep their order.  The direction of a segment is never changed (see the milling
+style).  Chains starting inside of a closed chain (e.g. the waterline of a pocket) are processed
+before the surrounding chain.
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+
+from pycam.Geometry import epsilon
+from pycam.Geometry.PointUtils import pdist
+from pycam.Toolpath import MOVE_SAFETY, MOVES_LIST
+from pycam.Toolpath.Steps import MoveSafety
+
+
+# the maximum distance between the end of a segment and the start of its successor (no retract)
+DEFAULT_TOLERANCE = epsilon
+# 2-opt: the maximum number of consecutive chains being reversed at once
+IMPROVEMENT_WINDOW = 20
+# 2-opt: the maximum number of passes through the chains of a layer
+MAX_IMPROVEMENT_PASSES = 4
+# layers with fewer chains are searched linearly for the nearest start (see "_StartGrid")
+MIN_GRID_CHAINS = 16
+# the lower limit for the size of the cells of "_StartGrid"
+MIN_CELL_SIZE = 0.01
+
+
+class _Chain:
+    """ consecutive segments without retracts in between """
+
+    def __init__(self, steps, tolerance):
+        self.steps = steps
+        positions = [step.position for step in steps if step.action in MOVES_LIST]
+        self.start = positions[0]
+        self.end = positions[-1]
+        xs = [position[0] for position in positions]
+        ys = [position[1] for position in positions]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+        self.area = (self.bounds[2] - self.bounds[0]) * (self.bounds[3] - self.bounds[1])
+        if (len(positions) > 2) and (pdist(self.start, self.end) <= tolerance):
+            # the xy outline of a closed chain
+            self.polygon = list(zip(xs, ys))
+        else:
+            self.polygon = None
+
+    def contains(self, point):
+        """ check if the point is inside of the xy outline of a closed chain """
+        if (self.polygon is None) or not ((self.bounds[0] <= point[0] <= self.bounds[2])
+                                          and (self.bounds[1] <= point[1] <= self.bounds[3])):
+            return False
+        x, y = point[0], point[1]
+        inside = False
+        previous_x, previous_y = self.polygon[-1]
+        for current_x, current_y in self.polygon:
+            if (current_y > y) != (previous_y > y):
+                crossing_x = current_x + ((y - current_y) * (previous_x - current_x)
+                                          / (previous_y - current_y))
+                if x < crossing_x:
+                    inside = not inside
+            previous_x, previous_y = current_x, current_y
+        return inside
+
+
+class _StartGrid:
+    """ find the nearest start point (xy) of the available chains via square cells
+
+    A few chains are just searched linearly.  The search through the rings of cells around a
+    position is replaced with a search through the occupied cells (ordered by distance), as soon
+    as it would visit more cells than there are occupied ones (e.g. for positions far away from
+    the chains).
+    """
+
+    def __init__(self, chains):
+        self.chains = chains
+        self.cells = {}
+        if len(chains) < MIN_GRID_CHAINS:
+            # a single cell containing all chains
+            self.cell_size = None
+            return
+        # the cells cover the area of all chains (not just their starts): positions (the ends of
+        # chains) are usually located within this area
+        min_x = min(chain.bounds[0] for chain in chains)
+        min_y = min(chain.bounds[1] for chain in chains)
+        width = max(chain.bounds[2] for chain in chains) - min_x
+        height = max(chain.bounds[3] for chain in chains) - min_y
+        # about one chain per cell (a single row of cells for chains along a line)
+        if width * height > epsilon:
+            cell_size = math.sqrt(width * height / len(chains))
+        else:
+            cell_size = max(width, height) / len(chains)
+        self.cell_size = max(cell_size, MIN_CELL_SIZE)
+        self.min_cell = self._get_cell((min(chain.start[0] for chain in chains),
+                                        min(chain.start[1] for chain in chains)))
+        self.max_cell = self._get_cell((max(chain.start[0] for chain in chains),
+                                        max(chain.start[1] for chain in chains)))
+
+    def _get_cell(self, point):
+        if self.cell_size is None:
+            return (0, 0)
+        return (math.floor(point[0] / self.cell_size), math.floor(point[1] / self.cell_size))
+
+    def add(self, index):
+        self.cells.setdefault(self._get_cell(self.chains[index].start), set()).add(index)
+
+    def _get_nearest_in_cells(self, cells, position, best=None):
+        for cell in cells:
+            for index in self.cells.get(cell, ()):
+                start = self.chains[index].start
+                candidate = (math.hypot(start[0] - position[0], start[1] - position[1]), index)
+                if (best is None) or (candidate < best):
+                    best = candidate
+        return best
+
+    def _get_nearest_in_occupied_cells(self, position):
+        """ check the occupied cells in the order of their distance """
+        x, y = position[0], position[1]
+        size = self.cell_size
+        cell_distances = []
+        for cell in self.cells:
+            distance_x = max(cell[0] * size - x, 0, x - (cell[0] + 1) * size)
+            distance_y = max(cell[1] * size - y, 0, y - (cell[1] + 1) * size)
+            cell_distances.append((math.hypot(distance_x, distance_y), cell))
+        cell_distances.sort()
+        best = None
+        for distance, cell in cell_distances:
+            if (best is not None) and (distance > best[0]):
+                break
+            best = self._get_nearest_in_cells((cell, ), position, best)
+        return best
+
+    def _get_nearest(self, position):
+        if self.cell_size is None:
+            return self._get_nearest_in_cells(list(self.cells), position)
+        cell_x, cell_y = self._get_cell(position)
+        max_radius = max(abs(cell_x - self.min_cell[0]), abs(cell_x - self.max_cell[0]),
+                         abs(cell_y - self.min_cell[1]), abs(cell_y - self.max_cell[1]))
+        best = None
+        # skip the empty rings around a position outside of the grid
+        radius = max(0, self.min_cell[0] - cell_x, cell_x - self.max_cell[0],
+                     self.min_cell[1] - cell_y, cell_y - self.max_cell[1])
+        visited_count = 0
+        while True:
+            if radius == 0:
+                ring = [(cell_x, cell_y)]
+            else:
+                ring = [(cell_x + offset, cell_y + side * radius)
+                        for offset in range(-radius, radius + 1) for side in (-1, 1)]
+                ring.extend((cell_x + side * radius, cell_y + offset)
+                            for offset in range(1 - radius, radius) for side in (-1, 1))
+            visited_count += len(ring)
+            if visited_count > len(self.cells):
+                # the remaining rings are sparse - check the occupied cells instead
+                return self._get_nearest_in_occupied_cells(position)
+            best = self._get_nearest_in_cells(ring, position, best)
+            # all unchecked chains are farther away than "radius" cells
+            if ((best is not None) and (best[0] <= radius * self.cell_size)) \
+                    or (radius >= max_radius):
+                return best
+            radius += 1
+
+    def pop_nearest(self, position):
+        """ remove and return the available chain starting closest to the position """
+        best = self._get_nearest(position)
+        cell = self._get_cell(self.chains[best[1]].start)
+        self.cells[cell].remove(best[1])
+        if not self.cells[cell]:
+            del self.cells[cell]
+        return best[1]
+
+
+def _split_segments(moves):
+    """ split the moves at safety moves - other steps stay with their neighbouring moves """
+    segments = []
+    current = []
+    has_move = False
+    for step in moves:
+        if step.action == MOVE_SAFETY:
+            if has_move:
+                segments.append(current)
+                current = []
+                has_move = False
+        else:
+            current.append(step)
+            has_move = has_move or (step.action in MOVES_LIST)
+    if has_move:
+        segments.append(current)
+    elif current and segments:
+        segments[-1].extend(current)
+    return segments
+
+
+def _merge_segments(segments, tolerance):
+    """ combine segments continuing each other into chains """
+    def get_start(segment):
+        return next(step.position for step in segment if step.action in MOVES_LIST)
+
+    def get_end(segment):
+        return next(step.position for step in reversed(segment) if step.action in MOVES_LIST)
+
+    def get_cell(point):
+        return tuple(math.floor(value / tolerance) for value in point)
+
+    starts = [get_start(segment) for segment in segments]
+    cells = {}
+    for index, start in enumerate(starts):
+        cells.setdefault(get_cell(start), []).append(index)
+    successors = {}
+    has_predecessor = set()
+    for index, segment in enumerate(segments):
+        end = get_end(segment)
+        cell_x, cell_y, cell_z = get_cell(end)
+        candidates = []
+        for offset_x in (-1, 0, 1):
+            for offset_y in (-1, 0, 1):
+                for offset_z in (-1, 0, 1):
+                    cell = (cell_x + offset_x, cell_y + offset_y, cell_z + offset_z)
+                    candidates.extend(other for other in cells.get(cell, ())
+                                      if (other != index) and (other not in has_predecessor)
+                                      and (pdist(end, starts[other]) <= tolerance))
+        if candidates:
+            successors[index] = min(candidates)
+            has_predecessor.add(successors[index])
+    visited = set()
+    chains = []
+
+    def follow(index):
+        steps = []
+        while (index is not None) and (index not in visited):
+            visited.add(index)
+            segment = segments[index]
+            if steps and (segment[0].action in MOVES_LIST) \
+                    and (segment[0].position == steps[-1].position):
+                # skip duplicate positions
+                segment = segment[1:]
+            steps.extend(segment)
+            index = successors.get(index)
+        return _Chain(steps, tolerance)
+
+    # open chains start with a segment without predecessor - the others are closed loops
+    for index in range(len(segments)):
+        if index not in has_predecessor:
+            chains.append(follow(index))
+    for index in range(len(segments)):
+        if index not in visited:
+            chains.append(follow(index))
+    return chains
+
+
+def _get_predecessors(chains):
+    """ chains starting inside of a closed chain need to be processed before it (inner first)
+
+    Only smaller chains (by the area of their bounding box) are taken into account.  Thus the
+    resulting dependencies are free of cycles.
+    """
+    predecessors = {}
+    for outer_index, outer in enumerate(chains):
+        if outer.polygon is None:
+            continue
+        for index, chain in enumerate(chains):
+            if (index != outer_index) and (chain.area < outer.area) \
+                    and (outer.bounds[0] <= chain.bounds[0]) \
+                    and (chain.bounds[2] <= outer.bounds[2]) \
+                    and (outer.bounds[1] <= chain.bounds[1]) \
+                    and (chain.bounds[3] <= outer.bounds[3]) and outer.contains(chain.start):
+                predecessors.setdefault(outer_index, set()).add(index)
+    return predecessors
+
+
+def _get_travel(end, start, tolerance):
+    """ the horizontal travel between two chains (zero for chains continuing each other) """
+    if (end is None) or (math.dist(end, start) <= tolerance):
+        return 0
+    return math.hypot(start[0] - end[0], start[1] - end[1])
+
+
+def _get_nearest_neighbour_order(chains, predecessors, start_position):
+    dependants = {}
+    pending = {}
+    for outer, inner_chains in predecessors.items():
+        pending[outer] = len(inner_chains)
+        for inner in inner_chains:
+            dependants.setdefault(inner, []).append(outer)
+    grid = _StartGrid(chains)
+    for index in range(len(chains)):
+        if not pending.get(index):
+            grid.add(index)
+    position = chains[0].start if start_position is None else start_position
+    order = []
+    while len(order) < len(chains):
+        index = grid.pop_nearest(position)
+        order.append(index)
+        position = chains[index].end
+        for outer in dependants.get(index, ()):
+            pending[outer] -= 1
+            if not pending[outer]:
+                grid.add(outer)
+    return order
+
+
+def _improve_order(chains, order, predecessors, start_position, tolerance):
+    """ reverse the order of consecutive chains (2-opt), if this reduces the travel
+
+    The direction of every chain is kept.  Reversals violating the "inner first" rule are
+    skipped.
+    """
+    starts = [chain.start for chain in chains]
+    ends = [chain.end for chain in chains]
+
+    for _ in range(MAX_IMPROVEMENT_PASSES):
+        improved = False
+        for first in range(len(order) - 1):
+            first_index = order[first]
+            previous_end = ends[order[first - 1]] if first > 0 else start_position
+            first_travel = _get_travel(previous_end, starts[first_index], tolerance)
+            block = {first_index}
+            forward = backward = 0
+            for last in range(first + 1, min(len(order), first + IMPROVEMENT_WINDOW)):
+                last_index, before_index = order[last], order[last - 1]
+                inner_chains = predecessors.get(last_index)
+                if inner_chains and not inner_chains.isdisjoint(block):
+                    # a chain and one of its inner chains would change their order
+                    break
+                block.add(last_index)
+                forward += _get_travel(ends[before_index], starts[last_index], tolerance)
+                backward += _get_travel(ends[last_index], starts[before_index], tolerance)
+                old = first_travel + forward
+                new = _get_travel(previous_end, starts[last_index], tolerance) + backward
+                if last + 1 < len(order):
+                    next_start = starts[order[last + 1]]
+                    old += _get_travel(ends[last_index], next_start, tolerance)
+                    new += _get_travel(ends[first_index], next_start, tolerance)
+                if new < old - epsilon:
+                    order[first:last + 1] = reversed(order[first:last + 1])
+                    improved = True
+                    break
+        if not improved:
+            break
+    return order
+
+
+def get_optimized_layer(moves, tolerance=DEFAULT_TOLERANCE, start_position=None):
+    """ reorder the segments of one layer for minimal travel
+
+    @param moves: cutting moves separated by safety moves
+    @param start_position: the position of the tool before the layer (e.g. the end of the
+        previous layer) or None
+    @returns: the list of reordered moves (ending with a safety move)
+    """
+    segments = _split_segments(moves)
+    if not segments:
+        return list(moves)
+    chains = _merge_segments(segments, tolerance)
+    predecessors = _get_predecessors(chains)
+    order = _get_nearest_neighbour_order(chains, predecessors, start_position)
+    order = _improve_order(chains, order, predecessors, start_position, tolerance)
+    result = []
+    previous_end = None
+    for index in order:
+        chain = chains[index]
+        if (previous_end is not None) and (pdist(previous_end, chain.start) > tolerance):
+            result.append(MoveSafety())
+        result.extend(chain.steps)
+        previous_end = chain.end
+    result.append(MoveSafety())
+    return result
+
+
+def iterate_optimized_layers(moves, tolerance=DEFAULT_TOLERANCE):
+    """ reorder the segments of every layer (see "get_optimized_layer")
+
+    The layers are separated by None items in "moves".  Every layer is collected completely
+    before its moves are delivered.
+    """
+    layer = []
+    position = None
+    for step in moves:
+        if step is None:
+            if layer:
+                optimized = get_optimized_layer(layer, tolerance, start_position=position)
+                position = _get_last_position(optimized, position)
+                yield from optimized
+                layer = []
+        else:
+            layer.append(step)
+    if layer:
+        yield from get_optimized_layer(layer, tolerance, start_position=position)
+
+
+def _get_last_position(moves, default=None):
+    for step in reversed(moves):
+        if step.action in MOVES_LIST:
+            return step.position
+    return default
@@ -0,0 +1,120 @@
+"""
+persistent cache of generated toolpaths
+
+The calculation of a toolpath is repeated for every run of the command line interface.  The
+cache stores the moves of generated toolpaths in a file below a cache directory.  The name of the
+file is the content digest of the task (including its tool, process, bounds and the content of
+its model files - see pycam.workspace.data_models.ContentDigest).  Thus modified settings or
+model files never use stale data.
+
+The cache file consists of a small header followed by the pickled moves (see
+"MoveArray.__getstate__").  Only trusted directories should be used for the cache, since loading
+a pickled file may execute arbitrary code.
+
+The cache is disabled by default (see "set_cache_directory").
+
+This file is part of PyCAM.
+
+PyCAM is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+PyCAM is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pickle
+import struct
+import tempfile
+
+from pycam.Toolpath.MoveArray import MoveArray
+import pycam.Utils.log
+log = pycam.Utils.log.get_logger()
+
+
+MAGIC = b"PYCAMTPH"
+# increase the version whenever the layout of the stored moves changes
+FORMAT_VERSION = 1
+FILENAME_SUFFIX = ".pycam-toolpath"
+# magic, format version
+_PREFIX_FORMAT = "<8sI"
+
+_cache_directory = None
+
+
+def set_cache_directory(path):
+    """ enable the cache (storing its files in the given directory) or disable it (None) """
+    global _cache_directory
+    if path is not None:
+        # this may throw OSError
+        os.makedirs(path, exist_ok=True)
+    _cache_directory = path
+
+
+def get_cache_directory():
+    return _cache_directory
+
+
+def _get_cache_filename(key):
+    return os.path.join(_cache_directory, key + FILENAME_SUFFIX)
+
+
+def store_moves(key, moves):
+    """ write the moves of a toolpath to the cache
+
+    Failures are not fatal - they are just reported.
+    """
+    if _cache_directory is None:
+        return False
+    if not isinstance(moves, MoveArray):
+        moves = MoveArray(moves)
+    try:
+        # write to a temporary file first - concurrent readers never see incomplete files
+        handle, temp_filename = tempfile.mkstemp(dir=_cache_directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as out_file:
+                out_file.write(struct.pack(_PREFIX_FORMAT, MAGIC, FORMAT_VERSION))
+                pickle.dump(moves, out_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_filename, _get_cache_filename(key))
+        except OSError:
+            os.unlink(temp_filename)
+            raise
+    except OSError as exc:
+        log.warning("Failed to store toolpath in cache directory (%s): %s", _cache_directory, exc)
+        return False
+    return True
+
+
+def load_moves(key):
+    """ return the cached moves (MoveArray) for the given key or None """
+    if _cache_directory is None:
+        return None
+    filename = _get_cache_filename(key)
+    prefix_size = struct.calcsize(_PREFIX_FORMAT)
+    try:
+        with open(filename, "rb") as cache_file:
+            prefix = cache_file.read(prefix_size)
+            if len(prefix) < prefix_size:
+                moves = None
+            elif struct.unpack(_PREFIX_FORMAT, prefix) != (MAGIC, FORMAT_VERSION):
+                moves = None
+            else:
+                moves = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, KeyError,
+            TypeError, ValueError) as exc:
+        log.warning("Ignoring invalid toolpath cache file (%s): %s", filename, exc)
+        return None
+    if not isinstance(moves, MoveArray):
+        log.info("Ignoring incompatible toolpath cache file: %s", filename)
+        return None
+    log.info("Loaded toolpath from cache: %s", filename)
+    return moves
@@ -21,7 +21,7 @@ from enum import Enum
 import os
 
 from pycam.Geometry import number, Box3D, DimensionalObject, Point3D
-from pycam.Geometry.PointUtils import pdist, pnormalized, psub
+from pycam.Geometry.PointUtils import pnormalized, psub
 import pycam.Utils.log
 
 
@@ -85,9 +85,13 @@ class Toolpath(DimensionalObject):
         return self.__path
 
     def __set_path(self, new_path):
-        # use a read-only tuple instead of a list
+        # late import due to dependency cycle
+        from pycam.Toolpath.MoveArray import MoveArray
+        # use a read-only compact sequence instead of a list
         # (otherwise we can't detect changes)
-        self.__path = tuple(new_path)
+        if not isinstance(new_path, MoveArray):
+            new_path = MoveArray(new_path)
+        self.__path = new_path
         self.clear_cache()
 
     def __get_filters(self):
@@ -110,56 +114,40 @@ class Toolpath(DimensionalObject):
         self._cache_basic_moves = None
         self._cache_visual_filters_string = None
         self._cache_visual_filters = None
-        self._cache_machine_distance_and_time = None
-        self._minx = None
-        self._maxx = None
-        self._miny = None
-        self._maxy = None
-        self._minz = None
-        self._maxz = None
 
     def __hash__(self):
         return hash((self.__path, self.__filters))
 
-    def _get_limit_generic(self, idx, func):
-        values = [step.position[idx] for step in self.path if step.action in MOVES_LIST]
-        return func(values)
+    def _get_limit_generic(self, idx, is_upper):
+        # the bounds are cached by the path
+        bounds = self.path.get_bounds()
+        if bounds is None:
+            raise ValueError("The toolpath does not contain any moves")
+        return bounds[1 if is_upper else 0][idx]
 
     @property
     def minx(self):
-        if self._minx is None:
-            self._minx = self._get_limit_generic(0, min)
-        return self._minx
+        return self._get_limit_generic(0, False)
 
     @property
     def maxx(self):
-        if self._maxx is None:
-            self._maxx = self._get_limit_generic(0, max)
-        return self._maxx
+        return self._get_limit_generic(0, True)
 
     @property
     def miny(self):
-        if self._miny is None:
-            self._miny = self._get_limit_generic(1, min)
-        return self._miny
+        return self._get_limit_generic(1, False)
 
     @property
     def maxy(self):
-        if self._maxy is None:
-            self._maxy = self._get_limit_generic(1, max)
-        return self._maxy
+        return self._get_limit_generic(1, True)
 
     @property
     def minz(self):
-        if self._minz is None:
-            self._minz = self._get_limit_generic(2, min)
-        return self._minz
+        return self._get_limit_generic(2, False)
 
     @property
     def maxz(self):
-        if self._maxz is None:
-            self._maxz = self._get_limit_generic(2, max)
-        return self._maxz
+        return self._get_limit_generic(2, True)
 
     def get_meta_data(self):
         meta = self.toolpath_settings.get_string()
@@ -172,9 +160,12 @@ class Toolpath(DimensionalObject):
         if max_time is None:
             return moves
         else:
-            # late import due to dependency cycle
-            import pycam.Toolpath.Filters
-            return moves | pycam.Toolpath.Filters.TimeLimit(max_time)
+            # the same result as for the filter TimeLimit - based on the cached time index
+            return moves.get_partial_moves(max_time)
+
+    def get_position_at_time(self, max_time):
+        """ return the position of the tool after the given machine time (in minutes) """
+        return self.get_basic_moves().get_position_at_time(max_time)
 
     def get_machine_time(self, safety_height=0.0):
         """ calculate an estimation of the time required for processing the
@@ -186,24 +177,8 @@ class Toolpath(DimensionalObject):
         return self.get_machine_move_distance_and_time()[1]
 
     def get_machine_move_distance_and_time(self):
-        if self._cache_machine_distance_and_time is None:
-            min_feedrate = 1
-            length = 0
-            duration = 0
-            feedrate = min_feedrate
-            current_position = None
-            # go through all points of the path
-            for step in self.get_basic_moves():
-                if (step.action == MACHINE_SETTING) and (step.key == "feedrate"):
-                    feedrate = step.value
-                elif step.action in MOVES_LIST:
-                    if current_position is not None:
-                        distance = pdist(step.position, current_position)
-                        duration += distance / max(feedrate, min_feedrate)
-                        length += distance
-                    current_position = step.position
-            self._cache_machine_distance_and_time = length, duration
-        return self._cache_machine_distance_and_time
+        # the result is cached by the compact storage of the basic moves
+        return self.get_basic_moves().get_machine_distance_and_time()
 
     def get_basic_moves(self, filters=None, reset_cache=False):
         if filters is None:
@@ -213,9 +188,10 @@ class Toolpath(DimensionalObject):
                 (str(filters) != self._cache_visual_filters_string):
             # late import due to dependency cycle
             import pycam.Toolpath.Filters
+            from pycam.Toolpath.MoveArray import MoveArray
             all_filters = tuple(self.filters) + tuple(filters)
-            self._cache_basic_moves = pycam.Toolpath.Filters.get_filtered_moves(self.path,
-                                                                                all_filters)
+            self._cache_basic_moves = MoveArray(
+                pycam.Toolpath.Filters.iterate_filtered_moves(self.path, all_filters))
             self._cache_visual_filters_string = str(filters)
             self._cache_visual_filters = filters
             _log.debug("Applying toolpath filters: %s",
@@ -17,6 +17,9 @@ You should have received a copy of the GNU General Public License
 along with PyCAM.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import atexit
+import collections
+import itertools
 # multiprocessing is imported later
 # import multiprocessing
 import os
@@ -34,6 +37,12 @@ import pycam.Utils
 import pycam.Utils.log
 log = pycam.Utils.log.get_logger()
 
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # Python < 3.8: the objects are pickled for every task
+    shared_memory = None
+
 
 try:
     from multiprocessing.managers import SyncManager as _SyncManager
@@ -53,6 +62,10 @@ else:
                 pass
 
 DEFAULT_PORT = 1250
+# the maximum duration (in seconds) of waiting for a result before checking for cancel requests
+RESULT_WAIT_TIMEOUT = 0.5
+# the interval (in seconds) for checking stale tasks while results are arriving
+STALE_TASK_CHECK_INTERVAL = 5
 
 
 # TODO: create one or two classes for these functions (to get rid of the globals)
@@ -71,6 +84,20 @@ __closing = None
 __task_source_uuid = None
 __finished_jobs = []
 __issued_warnings = []
+# the persistent pool of local worker processes (see "_get_pool")
+__pool = None
+# objects published in shared memory by this process (by uuid): shared memory block, reference
+# and the number of running jobs using it
+__shared_blocks = collections.OrderedDict()
+# shared objects attached by a worker process (by uuid): shared memory block and object
+__attached_shared_data = collections.OrderedDict()
+# the number of shared objects kept (if unused) by this process and by every worker process
+SHARED_DATA_CACHE_SIZE = 8
+# the preferred duration (in seconds) of a batch of tasks
+LOCAL_BATCH_DURATION = 0.05
+REMOTE_BATCH_DURATION = 0.5
+# the measured task durations of functions (see "_get_batch_sizer")
+__batch_sizers = {}
 
 
 def run_in_parallel(*args, **kwargs):
@@ -290,11 +317,11 @@ def init_threading(number_of_processes=None, enable_server=False, remote=None, r
             address = (host, port)
         if remote is None:
             tasks_queue = multiprocessing.Queue()
-            results_queue = multiprocessing.Queue()
+            results_channels = JobResultChannels()
             statistics = ProcessStatistics()
             cache = ProcessDataCache()
             pending_tasks = PendingTasks()
-            info = ManagerInfo(tasks_queue, results_queue, statistics, cache, pending_tasks)
+            info = ManagerInfo(tasks_queue, results_channels, statistics, cache, pending_tasks)
             TaskManager.register("tasks", callable=info.get_tasks_queue)
             TaskManager.register("results", callable=info.get_results_queue)
             TaskManager.register("statistics", callable=info.get_statistics)
@@ -341,6 +368,7 @@ def init_threading(number_of_processes=None, enable_server=False, remote=None, r
 
 def cleanup():
     global __multiprocessing, __manager, __closing
+    _shutdown_pool()
     if __multiprocessing and __closing:
         log.debug("Shutting down process handler")
         try:
@@ -423,9 +451,9 @@ def _handle_tasks(tasks, results, stats, cache, pending_tasks, closing):
                 last_worker_notification = time.time()
             start_time = time.time()
             try:
-                job_id, task_id, func, args = tasks.get(timeout=0.2)
+                # a blocking wait picks up new tasks immediately
+                job_id, task_id, func, args = tasks.get(timeout=2.0)
             except queue.Empty:
-                time.sleep(1.8)
                 timeout_counter += 1
                 continue
             # TODO: if the client aborts/disconnects between "tasks.get" and
@@ -435,33 +463,21 @@ def _handle_tasks(tasks, results, stats, cache, pending_tasks, closing):
             log.debug("Worker %s processes %s / %s", name, job_id, task_id)
             # reset the timeout counter, if we found another item in the queue
             timeout_counter = 0
-            real_args = []
-            for arg in args:
-                if isinstance(arg, ProcessDataCacheItemID):
+
+            def get_cached_item(item):
+                if isinstance(item, ProcessDataCacheItemID):
                     try:
-                        value = local_cache.get(arg)
+                        return local_cache.get(item)
                     except KeyError:
                         # TODO: we will break hard, if the item is expired
-                        value = cache.get(arg)
-                        local_cache.add(arg, value)
-                    real_args.append(value)
-                elif isinstance(arg, list) and [True for item in arg
-                                                if isinstance(item, ProcessDataCacheItemID)]:
-                    # check if any item in the list is cacheable
-                    args_list = []
-                    for item in arg:
-                        if isinstance(item, ProcessDataCacheItemID):
-                            try:
-                                value = local_cache.get(item)
-                            except KeyError:
-                                value = cache.get(item)
-                                local_cache.add(item, value)
-                            args_list.append(value)
-                        else:
-                            args_list.append(item)
-                    real_args.append(args_list)
+                        value = cache.get(item)
+                        local_cache.add(item, value)
+                        return value
                 else:
-                    real_args.append(arg)
+                    return item
+
+            # the arguments of a batch of tasks (see "_run_batch") contain the task arguments
+            real_args = _replace_task_items(args, get_cached_item, depth=4)
             stats.add_transfer_time(name, time.time() - start_time)
             start_time = time.time()
             results.put((job_id, task_id, func(real_args)))
@@ -482,57 +498,58 @@ def run_in_parallel_remote(func, args_list, unordered=False, disable_multiproces
         job_id = str(uuid.uuid1())
         log.debug("Starting parallel tasks: %s", job_id)
         tasks_queue = __manager.tasks()
-        results_queue = __manager.results()
+        results_channels = __manager.results()
         remote_cache = __manager.cache()
         stats = __manager.statistics()
         pending_tasks = __manager.pending_tasks()
-        # add all tasks of this job to the queue
-        for index, args in enumerate(args_list):
+        # the results of this job are delivered via a separate channel
+        results_channels.open(job_id)
+        # items with a uuid are transferred via the cache of the manager
+        cached_uuids = set()
+
+        def get_cache_reference(item):
+            if not hasattr(item, "uuid"):
+                return item
+            data_uuid = ProcessDataCacheItemID(item.uuid)
+            if item.uuid not in cached_uuids:
+                if not remote_cache.contains(data_uuid):
+                    log.debug("Adding cache item for job %s: %s - %s",
+                              job_id, item.uuid, item.__class__)
+                    remote_cache.add(data_uuid, item)
+                cached_uuids.add(item.uuid)
+            return data_uuid
+
+        # add all tasks of this job to the queue (combined into batches)
+        args_list = list(args_list)
+        workers = max(1, get_number_of_processes(), len(get_pool_statistics()))
+        sizer = _get_batch_sizer(func, REMOTE_BATCH_DURATION)
+        batches = _split_into_batches(len(args_list), workers, sizer)
+        for index, (start, end) in enumerate(batches):
             if callback:
                 callback()
             start_time = time.time()
-            result_args = []
-            for arg in args:
-                # add the argument to the cache if possible
-                if hasattr(arg, "uuid"):
-                    data_uuid = ProcessDataCacheItemID(arg.uuid)
-                    if not remote_cache.contains(data_uuid):
-                        log.debug("Adding cache item for job %s: %s - %s",
-                                  job_id, arg.uuid, arg.__class__)
-                        remote_cache.add(data_uuid, arg)
-                    result_args.append(data_uuid)
-                elif isinstance(arg, (list, set, tuple)):
-                    # a list with - maybe containing cacheable items
-                    new_arg_list = []
-                    for item in arg:
-                        try:
-                            data_uuid = ProcessDataCacheItemID(item.uuid)
-                        except AttributeError:
-                            # non-cacheable item
-                            new_arg_list.append(item)
-                            continue
-                        if not remote_cache.contains(data_uuid):
-                            log.debug("Adding cache item from list for job %s: %s - %s",
-                                      job_id, item.uuid, item.__class__)
-                            remote_cache.add(data_uuid, item)
-                        new_arg_list.append(data_uuid)
-                    result_args.append(new_arg_list)
-                else:
-                    result_args.append(arg)
-            tasks_queue.put((job_id, index, func, result_args))
+            batch = [_replace_task_items(args, get_cache_reference)
+                     for args in args_list[start:end]]
+            tasks_queue.put((job_id, index, _run_batch, [func, batch]))
             stats.add_queueing_time(__task_source_uuid, time.time() - start_time)
-        log.debug("Added %d tasks for job %s", len(args_list), job_id)
+        log.debug("Added %d tasks (%d batches) for job %s", len(args_list), len(batches), job_id)
         result_buffer = {}
         index = 0
         cancelled = False
+        last_stale_check = time.time()
+        waited_in_vain = False
         # wait for all results of this job
-        while (index < len(args_list)) and not cancelled:
+        while (index < len(batches)) and not cancelled:
             if callback and callback():
                 # cancel requested
                 cancelled = True
                 break
             # re-inject stale tasks if necessary
-            stale_task = pending_tasks.get_stale_task()
+            if waited_in_vain or (last_stale_check + STALE_TASK_CHECK_INTERVAL < time.time()):
+                stale_task = pending_tasks.get_stale_task()
+                last_stale_check = time.time()
+            else:
+                stale_task = None
             if stale_task:
                 stale_job_id, stale_task_id = stale_task[:2]
                 if stale_job_id in __finished_jobs:
@@ -548,45 +565,41 @@ def run_in_parallel_remote(func, args_list, unordered=False, disable_multiproces
                     log.debug("Ignoring stale non-local task: %s / %s",
                               stale_job_id, stale_task_id)
             try:
-                result_job_id, task_id, result = results_queue.get(timeout=1.0)
+                # wake up from time to time for checking the callback and stale tasks
+                _, task_id, result = results_channels.get(job_id, timeout=RESULT_WAIT_TIMEOUT)
             except queue.Empty:
-                time.sleep(1.0)
+                waited_in_vain = True
                 continue
-            if result_job_id == job_id:
-                log.debug("Received the result of a task: %s / %s", job_id, task_id)
-                try:
-                    if unordered:
-                        # just return the values in any order
-                        yield result
-                        index += 1
-                    else:
-                        # return the results in order (based on task_id)
-                        if task_id == index:
-                            yield result
-                            index += 1
-                            while index in result_buffer.keys():
-                                yield result_buffer[index]
-                                del result_buffer[index]
-                                index += 1
-                        else:
-                            result_buffer[task_id] = result
-                except GeneratorExit:
-                    # This exception is triggered when the caller stops
-                    # requesting more items from the generator.
-                    log.debug("Parallel processing cancelled: %s", job_id)
-                    _cleanup_job(job_id, tasks_queue, pending_tasks, __finished_jobs)
-                    # re-raise the GeneratorExit exception to finish destruction
-                    raise
-            elif result_job_id in __finished_jobs:
-                # throw away this result of an old job
-                log.debug("Throwing away one result of an old job: %s", result_job_id)
+            waited_in_vain = False
+            log.debug("Received the result of a task: %s / %s", job_id, task_id)
+            item_results, duration = result
+            sizer.add_measurement(len(item_results), duration)
+            ready_batches = []
+            if unordered:
+                # just return the values in any order
+                ready_batches.append(item_results)
+                index += 1
             else:
-                log.debug("Skipping result of non-local job: %s", result_job_id)
-                # put the result back to the queue for the next manager
-                results_queue.put((result_job_id, task_id, result))
-                # wait a little bit to get some idle CPU cycles
-                time.sleep(0.2)
-        _cleanup_job(job_id, tasks_queue, pending_tasks, __finished_jobs)
+                # return the results in order (based on task_id)
+                result_buffer[task_id] = item_results
+                while index in result_buffer:
+                    ready_batches.append(result_buffer.pop(index))
+                    index += 1
+            try:
+                for item_result in itertools.chain.from_iterable(ready_batches):
+                    if callback and callback():
+                        # cancel requested
+                        cancelled = True
+                        break
+                    yield item_result
+            except GeneratorExit:
+                # This exception is triggered when the caller stops
+                # requesting more items from the generator.
+                log.debug("Parallel processing cancelled: %s", job_id)
+                _cleanup_job(job_id, tasks_queue, results_channels, pending_tasks, __finished_jobs)
+                # re-raise the GeneratorExit exception to finish destruction
+                raise
+        _cleanup_job(job_id, tasks_queue, results_channels, pending_tasks, __finished_jobs)
         if cancelled:
             log.debug("Parallel processing cancelled: %s", job_id)
         else:
@@ -596,7 +609,9 @@ def run_in_parallel_remote(func, args_list, unordered=False, disable_multiproces
             yield func(args)
 
 
-def _cleanup_job(job_id, tasks_queue, pending_tasks, finished_jobs):
+def _cleanup_job(job_id, tasks_queue, results_channels, pending_tasks, finished_jobs):
+    # discard all further results of this job
+    results_channels.close(job_id)
     # flush the task queue
     try:
         queue_len = tasks_queue.qsize()
@@ -625,32 +640,221 @@ def _cleanup_job(job_id, tasks_queue, pending_tasks, finished_jobs):
         finished_jobs.pop(0)
 
 
+class SharedDataReference:
+    """ a picklable reference to an object published in shared memory
+
+    The object needs to implement "get_shared_buffers" and "from_shared_buffers" (see
+    pycam.Geometry.Model.Model).  Worker processes attach to the shared memory block by name and
+    create the object based on memoryviews of its arrays.
+    """
+
+    def __init__(self, uuid, factory, memory_name, settings, layout):
+        self.uuid = uuid
+        self.factory = factory
+        self.memory_name = memory_name
+        self.settings = settings
+        # name, typecode, offset and size of every array
+        self.layout = layout
+
+
+def _attach_shared_data(reference):
+    """ return the object behind a reference (within a worker process)
+
+    The most recently used objects are kept for subsequent tasks and jobs.
+    """
+    try:
+        __attached_shared_data.move_to_end(reference.uuid)
+        return __attached_shared_data[reference.uuid][1]
+    except KeyError:
+        pass
+    memory = shared_memory.SharedMemory(name=reference.memory_name)
+    buffers = {}
+    for name, typecode, offset, size in reference.layout:
+        buffers[name] = memory.buf[offset:offset + size].cast(typecode)
+    value = reference.factory.from_shared_buffers(reference.settings, buffers)
+    # the shared memory block needs to stay open as long as the object is used
+    __attached_shared_data[reference.uuid] = (memory, value)
+    while len(__attached_shared_data) > SHARED_DATA_CACHE_SIZE:
+        old_memory = __attached_shared_data.popitem(last=False)[1][0]
+        try:
+            old_memory.close()
+        except BufferError:
+            # the object is still in use - the block is closed along with the object
+            pass
+    return value
+
+
+def _share_data(value, job_uuids):
+    """ publish an object in shared memory (if supported) and return a reference to it
+
+    The uuids of all objects used by the current job are collected in "job_uuids".  These objects
+    are not released before the job is finished (see "_release_job_data").
+    """
+    if (shared_memory is None) or not hasattr(value, "get_shared_buffers"):
+        return value
+    try:
+        __shared_blocks.move_to_end(value.uuid)
+        entry = __shared_blocks[value.uuid]
+    except KeyError:
+        settings, buffers = value.get_shared_buffers()
+        layout = []
+        size = 0
+        for name, values in sorted(buffers.items()):
+            data_size = len(values) * values.itemsize
+            layout.append((name, values.typecode, size, data_size))
+            # keep all arrays aligned
+            size += data_size + (-data_size) % 8
+        # zero-sized blocks are not allowed
+        memory = shared_memory.SharedMemory(create=True, size=max(1, size))
+        for name, typecode, offset, data_size in layout:
+            memory.buf[offset:offset + data_size] = memoryview(buffers[name]).cast("B")
+        reference = SharedDataReference(value.uuid, value.__class__, memory.name, settings,
+                                        layout)
+        entry = [memory, reference, 0]
+        __shared_blocks[value.uuid] = entry
+    if value.uuid not in job_uuids:
+        job_uuids.add(value.uuid)
+        entry[2] += 1
+    return entry[1]
+
+
+def _release_job_data(job_uuids):
+    """ mark the shared objects of a job as unused and remove the least recently used ones """
+    for data_uuid in job_uuids:
+        if data_uuid in __shared_blocks:
+            __shared_blocks[data_uuid][2] -= 1
+    unused = [data_uuid for data_uuid, entry in __shared_blocks.items() if entry[2] <= 0]
+    for data_uuid in unused[:max(0, len(__shared_blocks) - SHARED_DATA_CACHE_SIZE)]:
+        memory = __shared_blocks.pop(data_uuid)[0]
+        memory.close()
+        memory.unlink()
+
+
+def _replace_task_items(task, replace, depth=2):
+    """ apply "replace" to the items of a task (and to the items of lists within the task) """
+    if (depth > 0) and isinstance(task, (list, tuple)):
+        items = [_replace_task_items(item, replace, depth - 1) for item in task]
+        if all(new_item is item for new_item, item in zip(items, task)):
+            # keep the original task (e.g. a namedtuple)
+            return task
+        return tuple(items) if isinstance(task, tuple) else items
+    else:
+        return replace(task)
+
+
+def _resolve_shared_data(value):
+    if isinstance(value, SharedDataReference):
+        return _attach_shared_data(value)
+    else:
+        return value
+
+
+def _get_pool():
+    """ return the pool of local worker processes - it is reused for all jobs """
+    global __pool
+    if __pool is None:
+        if shared_memory is not None:
+            # The workers need to share the resource tracker of this process.  Otherwise the
+            # tracker of a worker would remove the shared memory blocks as soon as it exits.
+            resource_tracker.ensure_running()
+        # use the number of CPUs as the default number of worker threads
+        __pool = __multiprocessing.Pool(__num_of_processes)
+    return __pool
+
+
+def _shutdown_pool():
+    """ stop all local worker processes and release all shared objects """
+    global __pool
+    if __pool is not None:
+        __pool.terminate()
+        __pool.join()
+        __pool = None
+    while __shared_blocks:
+        memory = __shared_blocks.popitem()[1][0]
+        memory.close()
+        memory.unlink()
+
+
+# the worker processes and the shared memory blocks should not outlive the main process
+atexit.register(_shutdown_pool)
+
+
 def run_in_parallel_local(func, args, unordered=False, disable_multiprocessing=False,
                           callback=None):
-    global __multiprocessing, __num_of_processes
+    global __multiprocessing, __num_of_processes, __pool
     if __multiprocessing is None:
         # threading was not configured before
         init_threading()
     if __multiprocessing and not disable_multiprocessing:
-        # use the number of CPUs as the default number of worker threads
-        pool = __multiprocessing.Pool(__num_of_processes)
-        if unordered:
-            imap_func = pool.imap_unordered
-        else:
-            imap_func = pool.imap
-        # We need to use try/finally here to ensure the garbage collection
-        # of "pool". Otherwise a memory overflow is caused for Python 2.7.
+        pool = _get_pool()
+        args = list(args)
+        sizer = _get_batch_sizer(func, LOCAL_BATCH_DURATION)
+        # Large objects (e.g. models) are published in shared memory only once.  The tasks
+        # contain just a reference to them.
+        job_uuids = set()
+
+        def share_item(item):
+            return _share_data(item, job_uuids)
+
+        # finished batches are reported by the result handler thread of the pool
+        finished_batches = queue.Queue()
+
+        def submit_batch(batch_index, start, end):
+            batch = [_replace_task_items(arg, share_item) for arg in args[start:end]]
+            pool.apply_async(
+                _run_batch, ((func, batch), ),
+                callback=lambda result: finished_batches.put((batch_index, result, None)),
+                error_callback=lambda exc: finished_batches.put((batch_index, None, exc)))
+
+        # A limited number of batches is submitted at once. The size of the following batches
+        # is based on the measured duration of the previous ones.
+        max_pending_batches = 2 * __num_of_processes
+        next_item = 0
+        submitted_count = 0
+        received_count = 0
+        result_buffer = {}
+        next_batch_index = 0
+        finished = False
         try:
-            # Beware: we may not return "pool.imap" or "pool.imap_unordered"
-            # directly. It would somehow loose the focus and just hang infinitely.
-            # Thus we wrap our own generator around it.
-            for result in imap_func(func, args):
-                if callback and callback():
-                    # cancel requested
+            while True:
+                while ((next_item < len(args))
+                       and (submitted_count - received_count < max_pending_batches)):
+                    size = sizer.get_size(len(args) - next_item, __num_of_processes)
+                    submit_batch(submitted_count, next_item, next_item + size)
+                    next_item += size
+                    submitted_count += 1
+                if received_count == submitted_count:
                     break
-                yield result
+                batch_index, result, exc = finished_batches.get()
+                received_count += 1
+                if exc is not None:
+                    raise exc
+                item_results, duration = result
+                sizer.add_measurement(len(item_results), duration)
+                ready_batches = []
+                if unordered:
+                    # just return the values in any order
+                    ready_batches.append(item_results)
+                else:
+                    # return the results in order
+                    result_buffer[batch_index] = item_results
+                    while next_batch_index in result_buffer:
+                        ready_batches.append(result_buffer.pop(next_batch_index))
+                        next_batch_index += 1
+                for item_result in itertools.chain.from_iterable(ready_batches):
+                    if callback and callback():
+                        # cancel requested
+                        return
+                    yield item_result
+            finished = True
         finally:
-            pool.terminate()
+            if not finished:
+                # the remaining tasks of a cancelled job would delay the next job
+                pool.terminate()
+                pool.join()
+                if __pool is pool:
+                    __pool = None
+            _release_job_data(job_uuids)
     else:
         for arg in args:
             if callback and callback():
@@ -659,6 +863,71 @@ def run_in_parallel_local(func, args, unordered=False, disable_multiprocessing=F
             yield func(arg)
 
 
+class _BatchSizer:
+    """ choose the number of tasks per batch based on the measured duration of previous tasks """
+
+    def __init__(self, target_duration):
+        self.target_duration = target_duration
+        # the smoothed duration of a single task
+        self.task_duration = None
+
+    def add_measurement(self, task_count, duration):
+        if task_count > 0:
+            task_duration = duration / task_count
+            if self.task_duration is None:
+                self.task_duration = task_duration
+            else:
+                self.task_duration = 0.7 * self.task_duration + 0.3 * task_duration
+
+    def get_size(self, remaining_count, workers, unknown_size=1):
+        """ return the size of the next batch
+
+        Every worker should receive at least two more batches - otherwise the load would not be
+        distributed evenly.
+        The "unknown_size" is used as long as the duration of tasks is unknown (None: balanced
+        distribution of the remaining tasks).
+        """
+        balanced_size = max(1, remaining_count // (2 * max(1, workers)))
+        if self.task_duration is None:
+            size = balanced_size if unknown_size is None else unknown_size
+        elif self.task_duration <= 0:
+            size = balanced_size
+        else:
+            size = int(self.target_duration / self.task_duration)
+        return max(1, min(size, balanced_size))
+
+
+def _get_batch_sizer(func, target_duration):
+    """ the measurements of a function are kept for subsequent jobs """
+    key = (getattr(func, "__module__", None), getattr(func, "__qualname__", repr(func)),
+           target_duration)
+    try:
+        return __batch_sizers[key]
+    except KeyError:
+        sizer = _BatchSizer(target_duration)
+        __batch_sizers[key] = sizer
+        return sizer
+
+
+def _split_into_batches(task_count, workers, sizer):
+    """ return the ranges of tasks (start and end index) for all batches of a job """
+    batches = []
+    start = 0
+    while start < task_count:
+        size = sizer.get_size(task_count - start, workers, unknown_size=None)
+        batches.append((start, start + size))
+        start += size
+    return batches
+
+
+def _run_batch(func_and_batch):
+    """ process the tasks of a batch and measure the duration """
+    func, batch = func_and_batch
+    start_time = time.time()
+    results = [func(_replace_task_items(args, _resolve_shared_data)) for args in batch]
+    return results, time.time() - start_time
+
+
 class OneProcess:
     def __init__(self, name, is_queue=False):
         self.is_queue = is_queue
@@ -813,6 +1082,38 @@ class PendingTasks:
         return len(self._jobs)
 
 
+class JobResultChannels:
+    """ a separate queue of results for every job (located in the manager process)
+
+    Clients wait for the results of their own job only.  Results of unknown (e.g. finished) jobs
+    are discarded.
+    """
+
+    def __init__(self):
+        self._channels = {}
+
+    def open(self, job_id):
+        self._channels[job_id] = queue.Queue()
+
+    def close(self, job_id):
+        self._channels.pop(job_id, None)
+
+    def put(self, item):
+        """ deliver a result (job_id, task_id, result) to the channel of its job """
+        channel = self._channels.get(item[0])
+        if channel is None:
+            log.debug("Throwing away one result of an old job: %s", item[0])
+        else:
+            channel.put(item)
+
+    def get(self, job_id, timeout=None):
+        """ wait for the next result of a job - raises queue.Empty after the timeout """
+        return self._channels[job_id].get(timeout=timeout)
+
+    def qsize(self):
+        return sum(channel.qsize() for channel in list(self._channels.values()))
+
+
 class ProcessDataCache:
 
     def __init__(self, timeout=600):
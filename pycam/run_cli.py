@@ -34,8 +34,11 @@ except ImportError:
 
 import pycam.errors
 from pycam.Flow.parser import parse_yaml
+import pycam.Importers.ModelCache
+import pycam.Toolpath.ToolpathCache
 import pycam.Utils
 import pycam.Utils.log
+import pycam.Utils.threading
 import pycam.workspace.data_models
 
 
@@ -54,6 +57,12 @@ def get_args():
                         help="choose the verbosity of log messages")
     parser.add_argument("sources", metavar="FLOW_SPEC", type=argparse.FileType('r'), nargs="+",
                         help="processing flow description files in yaml format")
+    parser.add_argument("--model-cache-dir", metavar="DIR", default=None,
+                        help="store imported models (including their spatial index) in this "
+                             "directory - subsequent runs load unchanged models from there")
+    parser.add_argument("--toolpath-cache-dir", metavar="DIR", default=None,
+                        help="store generated toolpaths in this directory - subsequent runs "
+                             "skip the calculation for unchanged tasks and models")
     parser.add_argument("--version", action="version", version="%(prog)s {}".format(VERSION))
     return parser.parse_args()
 
@@ -61,6 +70,20 @@ def get_args():
 def main_func():
     args = get_args()
     _log.setLevel(LOG_LEVELS[args.log_level])
+    if args.model_cache_dir:
+        try:
+            pycam.Importers.ModelCache.set_cache_directory(args.model_cache_dir)
+        except OSError as exc:
+            print("Failed to create model cache directory ({}): {}".format(args.model_cache_dir,
+                                                                           exc), file=sys.stderr)
+            sys.exit(1)
+    if args.toolpath_cache_dir:
+        try:
+            pycam.Toolpath.ToolpathCache.set_cache_directory(args.toolpath_cache_dir)
+        except OSError as exc:
+            print("Failed to create toolpath cache directory ({}): {}".format(
+                args.toolpath_cache_dir, exc), file=sys.stderr)
+            sys.exit(1)
     for fname in args.sources:
         try:
             parse_yaml(fname)
@@ -68,8 +91,12 @@ def main_func():
             print("Flow description parse failure ({}): {}".format(fname, exc), file=sys.stderr)
             sys.exit(1)
     pycam.Utils.set_application_key("pycam-cli")
-    for export in pycam.workspace.data_models.Export.get_collection():
-        export.run_export()
+    try:
+        for export in pycam.workspace.data_models.Export.get_collection():
+            export.run_export()
+    finally:
+        # stop the worker processes
+        pycam.Utils.threading.cleanup()
 
 
 if __name__ == "__main__":
@@ -132,6 +132,7 @@ class ToolpathFilter(Enum):
     FILENAME_EXTENSION = "filename_extension"
     TOUCH_OFF = "touch_off"
     UNIT = "unit"
+    ARC_FITTING = "arc_fitting"
 
 
 class ToolBoundaryMode(Enum):
@@ -21,6 +21,7 @@ import collections
 import copy
 from enum import Enum
 import functools
+import hashlib
 import io
 import os.path
 import time
@@ -40,6 +41,7 @@ import pycam.Toolpath
 import pycam.Toolpath.Filters as tp_filters
 import pycam.Toolpath.MotionGrid as MotionGrid
 import pycam.Toolpath.SupportGrid
+import pycam.Toolpath.ToolpathCache as ToolpathCache
 from pycam.Importers import detect_file_type
 from pycam.Utils import get_application_key, get_type_name, MultiLevelDictionaryAccess
 from pycam.Utils.events import get_event_handler
@@ -56,10 +58,20 @@ from pycam.errors import (LoadFileError, PycamBaseException, InvalidDataError, I
 
 _log = pycam.Utils.log.get_logger()
 
+try:
+    from pycam.PathGenerators.HeightMap import HeightMapCutter
+except ImportError:
+    # numpy is not available: only the exact surfacing is possible
+    HeightMapCutter = None
+
 
 # dictionary of all collections by name
 _data_collections = {}
 _cache = {}
+# digests of source files by filename (see "_get_file_digest")
+_file_digests = {}
+
+FILE_DIGEST_CHUNK_SIZE = 1024 * 1024
 
 
 APPLICATION_ATTRIBUTES_KEY = "X-Application"
@@ -226,6 +238,14 @@ def _get_collection_resolver(collection_name, many=False):
     return functools.partial(_get_from_collection, collection_name, many=many)
 
 
+def _is_reference_converter(converter):
+    """ check if an attribute converter returns other workspace items (e.g. Source or Model) """
+    if isinstance(converter, functools.partial):
+        return converter.func is _get_from_collection
+    else:
+        return isinstance(converter, type) and issubclass(converter, BaseDataContainer)
+
+
 def _set_parser_context(description):
     """ store a string describing the current parser context (useful for error messages) """
     def wrap(func):
@@ -274,11 +294,96 @@ def _require_model_type(wanted_type):
     return wrap
 
 
+def _get_file_digest(filename):
+    """ calculate the SHA-256 digest of a file's content
+
+    The digest is kept as long as the modification time and the size of the file do not change.
+    """
+    stat = os.stat(filename)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    try:
+        known_signature, digest = _file_digests[filename]
+    except KeyError:
+        pass
+    else:
+        if known_signature == signature:
+            return digest
+    file_hash = hashlib.sha256()
+    with open(filename, "rb") as in_file:
+        for chunk in iter(lambda: in_file.read(FILE_DIGEST_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    digest = file_hash.hexdigest()
+    _file_digests[filename] = (signature, digest)
+    return digest
+
+
+class ContentDigest:
+    """ calculate a hash of simple values and workspace items based on their content
+
+    The digest does not depend on the current process (in contrast to Python's "hash").  Thus it
+    may be used for identifying results across multiple runs (see "is_persistent").
+    Workspace items contribute their data including all referenced items (e.g. models) and the
+    content of their source files.
+    Objects without a canonical representation (e.g. toolpaths or objects transferred within the
+    process) are represented by their hash value.  Such a digest is only valid within the current
+    process.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.is_persistent = True
+
+    def _add_text(self, text):
+        self._hash.update(text.encode("utf-8"))
+
+    def update(self, value):
+        if isinstance(value, dict):
+            self._add_text("{%d:" % len(value))
+            for key in sorted(value):
+                self.update(key)
+                self.update(value[key])
+        elif isinstance(value, (list, tuple)):
+            self._add_text("[%d:" % len(value))
+            for item in value:
+                self.update(item)
+        elif (value is None) or isinstance(value, (bool, float, int, str)):
+            # "repr" is unambiguous for these types (including the precision of floats)
+            self._add_text("{}:{!r};".format(type(value).__name__, value))
+        elif isinstance(value, Enum):
+            self._add_text("enum:")
+            self.update(value.value)
+        elif isinstance(value, BaseDataContainer):
+            self._add_text("{}:".format(get_type_name(value)))
+            value.update_content_digest(self)
+        else:
+            self.add_volatile(value)
+
+    def add_volatile(self, value):
+        """ add a value without a canonical representation (valid only for the current process)
+        """
+        self._add_text("volatile:%d;" % hash(value))
+        self.is_persistent = False
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def get_content_digest(inst, relevant_dict_keys, args=(), kwargs=None):
+    """ calculate the digest of the given attributes of a BaseDataContainer and of arguments """
+    digest = ContentDigest()
+    for key in relevant_dict_keys:
+        digest.update(key)
+        digest.update(inst.get_value(key))
+    digest.update(args)
+    digest.update({} if kwargs is None else kwargs)
+    return digest
+
+
 class CacheStorage:
     """ cache result values of a method
 
     The method's instance object may be a BaseDataContainer (or another non-trivial object).
-    Arguments for the method call are hashed.
+    Arguments for the method call are hashed (see "ContentDigest").
     Multiple data keys for a BaseDataContainer may be specified - a change of their value
     invalidates cached values.
     """
@@ -292,38 +397,8 @@ class CacheStorage:
             return self.get_cached(inst, args, kwargs, calc_function)
         return wrapped
 
-    @classmethod
-    def _get_stable_hashs_for_value(cls, value):
-        """calculate a hash value for simple values and complex objects"""
-        if isinstance(value, dict):
-            for key_value in sorted(value.items()):
-                yield from cls._get_stable_hashs_for_value(key_value)
-        elif isinstance(value, (list, tuple)):
-            for item in value:
-                yield from cls._get_stable_hashs_for_value(item)
-        elif isinstance(value, (float, int, str)):
-            yield hash(value)
-        elif isinstance(value, pycam.Toolpath.Toolpath):
-            yield hash(value)
-        elif value is None:
-            yield hash(None)
-        elif isinstance(value, BaseDataContainer):
-            yield from cls._get_stable_hashs_for_value(value.get_dict())
-        elif isinstance(value, Enum):
-            yield hash(value.value)
-        else:
-            assert False, ("Non-hashable type needs hash conversion for cache key: {}"
-                           .format(type(value)))
-
     def _get_cache_key(self, inst, args, kwargs):
-        hashes = []
-        for key in self._relevant_dict_keys:
-            value = inst.get_value(key)
-            hashes.append(hash(key))
-            hashes.extend(self._get_stable_hashs_for_value(value))
-        return (tuple(hashes)
-                + tuple(self._get_stable_hashs_for_value(args))
-                + tuple(self._get_stable_hashs_for_value(kwargs)))
+        return get_content_digest(inst, self._relevant_dict_keys, args, kwargs).hexdigest()
 
     def get_cached(self, inst, args, kwargs, calc_function):
         # every instance manages its own cache
@@ -460,6 +535,17 @@ class BaseDataContainer:
                 result[APPLICATION_ATTRIBUTES_KEY] = minimized_data
         return result
 
+    def update_content_digest(self, digest):
+        """ add the data of this item to a ContentDigest
+
+        References to other items (e.g. models) are replaced with the content of these items.
+        """
+        data = self.get_dict()
+        for key, converter in self.attribute_converters.items():
+            if (key in data) and _is_reference_converter(converter):
+                data[key] = self.get_value(key)
+        digest.update(data)
+
     def _get_current_application_dict(self):
         try:
             return self._application_attributes[get_application_key()]
@@ -714,6 +800,42 @@ class Source(BaseDataContainer):
         else:
             raise InvalidKeyError(source_type, SourceType)
 
+    def update_content_digest(self, digest):
+        """ add the data of this source and the content of its file or its items to a digest
+
+        The content of remote files is unknown - the digest is valid only for the current
+        process.
+        """
+        source_type = self.get_value("type")
+        data = self.get_dict()
+        if source_type == SourceType.OBJECT:
+            digest.update({key: value for key, value in data.items() if key != "data"})
+            digest.add_volatile(self._get_source_object())
+            return
+        digest.update(data)
+        if source_type in (SourceType.FILE, SourceType.URL):
+            location = self._get_location_uri(source_type)
+            if location.startswith("file://"):
+                filename = location[len("file://"):]
+                try:
+                    digest.update(_get_file_digest(filename))
+                except OSError:
+                    # the import will fail later - the location is sufficient for now
+                    digest.add_volatile(filename)
+            else:
+                digest.add_volatile(location)
+        elif source_type == SourceType.COPY:
+            # the original model includes the content of its source (e.g. a chain of copies)
+            digest.update(_get_from_collection(CollectionName.MODELS, self.get_value("original")))
+        elif source_type == SourceType.MODEL:
+            digest.update(self._get_source_model())
+        elif source_type == SourceType.TASK:
+            digest.update(self._get_source_task())
+        elif source_type == SourceType.TOOLPATH:
+            digest.update(self._get_source_toolpath())
+        elif source_type == SourceType.SUPPORT_BRIDGES:
+            digest.update(self.get_value("models"))
+
     @CacheStorage({"type"})
     @_set_parser_context("Source")
     def get(self, related_collection_name):
@@ -746,9 +868,7 @@ class Source(BaseDataContainer):
         source_name = self.get_value("original")
         return _get_from_collection(related_collection_name, source_name).get_model()
 
-    @_set_parser_context("Source 'file/url'")
-    @_set_allowed_attributes({"type", "location"})
-    def _get_source_location(self, source_type):
+    def _get_location_uri(self, source_type):
         location = self.get_value("location")
         if source_type == SourceType.FILE:
             if not os.path.isabs(location):
@@ -764,6 +884,12 @@ class Source(BaseDataContainer):
                 if abs_location is not None:
                     location = abs_location
             location = "file://" + os.path.abspath(location)
+        return location
+
+    @_set_parser_context("Source 'file/url'")
+    @_set_allowed_attributes({"type", "location"})
+    def _get_source_location(self, source_type):
+        location = self._get_location_uri(source_type)
         detected_filetype = detect_file_type(location)
         if detected_filetype:
             try:
@@ -1103,25 +1229,44 @@ class Process(BaseCollectionItemDataContainer):
                                                                      many=True),
                             "rounded_corners": _bool_converter,
                             "radius_compensation": _bool_converter,
+                            "optimize_travel": _bool_converter,
                             "overlap": float,
-                            "step_down": float}
+                            "step_down": float,
+                            "height_map_resolution": float}
     attribute_defaults = {"overlap": 0,
                           "path_pattern": PathPattern.GRID,
                           "grid_direction": MotionGrid.GridDirection.X,
                           "spiral_direction": MotionGrid.SpiralDirection.OUT,
                           "rounded_corners": True,
-                          "radius_compensation": False}
+                          "radius_compensation": False,
+                          "optimize_travel": False}
 
     @_set_parser_context("Process")
     def get_path_generator(self):
         _log.debug("Retrieving path generator for process {}".format(self.get_id()))
         strategy = _get_enum_value(ProcessStrategy, self.get_value("strategy"))
+        # reorder the cutting segments of every layer for short travel moves
+        optimize_travel = self.get_value("optimize_travel")
         if strategy == ProcessStrategy.SLICE:
-            return pycam.PathGenerators.PushCutter.PushCutter(waterlines=False)
+            return pycam.PathGenerators.PushCutter.PushCutter(waterlines=False,
+                                                              optimize_travel=optimize_travel)
         elif strategy == ProcessStrategy.CONTOUR:
-            return pycam.PathGenerators.PushCutter.PushCutter(waterlines=True)
+            return pycam.PathGenerators.PushCutter.PushCutter(waterlines=True,
+                                                              optimize_travel=optimize_travel)
         elif strategy == ProcessStrategy.SURFACE:
-            return pycam.PathGenerators.DropCutter.DropCutter()
+            try:
+                # the optional approximation based on a height map (e.g. for roughing)
+                resolution = self.get_value("height_map_resolution")
+            except MissingAttributeError:
+                return pycam.PathGenerators.DropCutter.DropCutter(optimize_travel=optimize_travel)
+            if resolution <= 0:
+                raise InvalidDataError("The resolution of the height map needs to be positive: {}"
+                                       .format(resolution))
+            if HeightMapCutter is None:
+                _log.warning("Surfacing based on a height map requires the python package "
+                             "'numpy' - falling back to the exact calculation")
+                return pycam.PathGenerators.DropCutter.DropCutter(optimize_travel=optimize_travel)
+            return HeightMapCutter(resolution=resolution, optimize_travel=optimize_travel)
         elif strategy == ProcessStrategy.ENGRAVE:
             return pycam.PathGenerators.EngraveCutter.EngraveCutter()
         else:
@@ -1311,10 +1456,104 @@ class Task(BaseCollectionItemDataContainer):
                             "collision_models": _get_collection_resolver(CollectionName.MODELS,
                                                                          many=True)}
 
-    @CacheStorage({"process", "bounds", "tool", "type", "collision_models"})
+    # all attributes affecting the result of "generate_toolpath"
+    toolpath_relevant_keys = ("process", "bounds", "tool", "type", "collision_models")
+
+    def get_toolpath_cache_key(self):
+        """ return a key for the toolpath (valid across processes) or None
+
+        The key covers the settings of the task (including its tool, process and bounds), the
+        content of the collision models and the version of PyCAM.  None is returned if the
+        task refers to data, which cannot be identified by its content (e.g. remote files).
+        """
+        digest = get_content_digest(self, self.toolpath_relevant_keys)
+        if not digest.is_persistent:
+            return None
+        digest.update(pycam.VERSION)
+        return digest.hexdigest()
+
+    def _load_cached_moves(self):
+        """ retrieve the moves of the toolpath from the persistent cache (see ToolpathCache)
+
+        Returns the cache key (None, if the cache is not usable) and the moves (or None).
+        """
+        if ToolpathCache.get_cache_directory() is None:
+            return None, None
+        cache_key = self.get_toolpath_cache_key()
+        if cache_key is None:
+            return None, None
+        return cache_key, ToolpathCache.load_moves(cache_key)
+
+    @CacheStorage(toolpath_relevant_keys)
     @_set_parser_context("Task")
     def generate_toolpath(self):
         _log.debug("Generating toolpath for task {}".format(self.get_id()))
+        cache_key, moves = self._load_cached_moves()
+        if moves is None:
+            job = self._get_milling_job()
+            if job is None:
+                return
+            path_generator, tool, args, kwargs = job
+            with ProgressContext("Calculating toolpath") as progress:
+                kwargs["draw_callback"] = UpdateToolView(
+                    progress.update,
+                    max_fps=get_event_handler().get("tool_progress_max_fps", 1)).update
+                moves = path_generator.generate_toolpath(*args, **kwargs)
+            if moves and (cache_key is not None):
+                ToolpathCache.store_moves(cache_key, moves)
+        else:
+            tool = self.get_value("tool")
+        if not moves:
+            _log.info("No valid moves found")
+            return None
+        return pycam.Toolpath.Toolpath(toolpath_path=moves, tool=tool,
+                                       toolpath_filters=tool.get_toolpath_filters())
+
+    @_set_parser_context("Task")
+    def get_toolpath_stream(self):
+        """ prepare the calculation of the toolpath without storing its moves
+
+        Returns the filters of the toolpath and a generator of its moves - or None.
+        The moves are calculated while the generator is consumed.  Path generators without
+        support for streaming deliver their moves after finishing the calculation.
+        Moves from the persistent cache (see ToolpathCache) are used, if available.  Otherwise
+        the moves are stored in the cache after the generator is exhausted.
+        """
+        _log.debug("Streaming toolpath for task {}".format(self.get_id()))
+        cache_key, cached_moves = self._load_cached_moves()
+        if cached_moves is not None:
+            return self.get_value("tool").get_toolpath_filters(), cached_moves
+        job = self._get_milling_job()
+        if job is None:
+            return None
+        path_generator, tool, args, kwargs = job
+
+        def iterate_moves():
+            # the moves are collected only for the persistent cache
+            collected = [] if cache_key is not None else None
+            with ProgressContext("Calculating toolpath") as progress:
+                kwargs["draw_callback"] = UpdateToolView(
+                    progress.update,
+                    max_fps=get_event_handler().get("tool_progress_max_fps", 1)).update
+                if hasattr(path_generator, "iterate_toolpath"):
+                    moves = path_generator.iterate_toolpath(*args, **kwargs)
+                else:
+                    moves = path_generator.generate_toolpath(*args, **kwargs)
+                for move in moves:
+                    if collected is not None:
+                        collected.append(move)
+                    yield move
+            if collected:
+                ToolpathCache.store_moves(cache_key, collected)
+
+        return tool.get_toolpath_filters(), iterate_moves()
+
+    def _get_milling_job(self):
+        """ collect the path generator and its arguments for calculating the toolpath
+
+        Returns the path generator, the tool and the positional and keyword arguments for the
+        path generator - or None.
+        """
         process = self.get_value("process")
         bounds = self.get_value("bounds")
         task_type = self.get_value("type")
@@ -1325,7 +1564,7 @@ class Task(BaseCollectionItemDataContainer):
             path_generator = process.get_path_generator()
             if path_generator is None:
                 # we assume that an error message was given already
-                return
+                return None
             models = [m.get_model() for m in self.get_value("collision_models")]
             if not models:
                 # issue a warning - and go ahead ...
@@ -1335,19 +1574,9 @@ class Task(BaseCollectionItemDataContainer):
             _log.debug("MotionGrid completed")
             if motion_grid is None:
                 # we assume that an error message was given already
-                return
-            with ProgressContext("Calculating toolpath") as progress:
-                draw_callback = UpdateToolView(
-                    progress.update,
-                    max_fps=get_event_handler().get("tool_progress_max_fps", 1)).update
-                moves = path_generator.generate_toolpath(
-                    tool.get_tool_geometry(), models, motion_grid, minz=box.lower.z,
-                    maxz=box.upper.z, draw_callback=draw_callback)
-            if not moves:
-                _log.info("No valid moves found")
                 return None
-            return pycam.Toolpath.Toolpath(toolpath_path=moves, tool=tool,
-                                           toolpath_filters=tool.get_toolpath_filters())
+            return (path_generator, tool, (tool.get_tool_geometry(), models, motion_grid),
+                    {"minz": box.lower.z, "maxz": box.upper.z})
         else:
             raise InvalidKeyError(task_type, TaskType)
 
@@ -1462,6 +1691,21 @@ class Toolpath(BaseCollectionItemDataContainer):
                 toolpath = transformation.get_transformed_toolpath(toolpath)
         return toolpath
 
+    @_set_parser_context("Toolpath")
+    def get_toolpath_stream(self):
+        """ return the filters of the toolpath and an iterable of its moves - or None
+
+        The moves of a toolpath without transformations are calculated while they are consumed
+        (see Task.get_toolpath_stream).  They are not cached.
+        """
+        if self.get_value("transformations"):
+            toolpath = self.get_toolpath()
+            if toolpath is None:
+                return None
+            return toolpath.filters, toolpath.path
+        task = self.get_value("source").get(CollectionName.TOOLPATHS)
+        return task.get_toolpath_stream()
+
     def append_transformation(self, transform_dict):
         current_transformations = self.get_value("transformations", raw=True)
         current_transformations.append(copy.deepcopy(transform_dict))
@@ -1500,6 +1744,12 @@ class ExportSettings(BaseCollectionItemDataContainer):
                 result.append(tp_filters.PlungeFeedrate(float(parameters)))
             elif filter_name == ToolpathFilter.STEP_WIDTH:
                 result.append(tp_filters.StepWidth({key: float(parameters[key]) for key in "xyz"}))
+            elif filter_name == ToolpathFilter.ARC_FITTING:
+                tolerance = float(parameters)
+                if tolerance <= 0:
+                    raise InvalidDataError("The tolerance of the arc fitting needs to be "
+                                           "positive: {}".format(tolerance))
+                result.append(tp_filters.ArcFit(tolerance))
             elif filter_name == ToolpathFilter.CORNER_STYLE:
                 mode = _get_enum_value(pycam.Toolpath.ToolpathPathMode, parameters["mode"])
                 motion_tolerance = parameters.get("motion_tolerance", 0)
@@ -1527,7 +1777,7 @@ class Target(BaseDataContainer):
     attribute_converters = {"type": _get_enum_resolver(TargetType)}
 
     @_set_parser_context("Export target")
-    def open(self, dry_run=False):
+    def open(self, dry_run=False, binary=False):
         _log.debug("Opening target {}".format(self))
         target_type = self.get_value("type")
         if target_type == TargetType.FILE:
@@ -1539,7 +1789,7 @@ class Target(BaseDataContainer):
                                         .format(location))
             else:
                 try:
-                    return open(location, "w")
+                    return open(location, "wb" if binary else "w")
                 except OSError as exc:
                     raise LoadFileError(exc)
         else:
@@ -1555,10 +1805,18 @@ class Formatter(BaseDataContainer):
                             "filetype": _get_enum_resolver(FileType),
                             "dialect": _get_enum_resolver(GCodeDialect),
                             "export_settings": _get_collection_resolver(
-                                CollectionName.EXPORT_SETTINGS)}
+                                CollectionName.EXPORT_SETTINGS),
+                            "streaming": _bool_converter,
+                            "binary": _bool_converter}
     attribute_defaults = {"dialect": GCodeDialect.LINUXCNC,
                           "export_settings": None,
-                          "comment": ""}
+                          "comment": "",
+                          "streaming": False,
+                          "binary": False}
+
+    def is_binary(self):
+        """ check if the output is binary data (instead of text) """
+        return (self.get_value("type") == FormatType.MODEL) and self.get_value("binary")
 
     @staticmethod
     def _test_sources(items, test_function, message_template):
@@ -1589,7 +1847,7 @@ class Formatter(BaseDataContainer):
             raise InvalidKeyError(format_type, FormatType)
 
     @_set_parser_context("Export formatter 'GCode'")
-    @_set_allowed_attributes({"type", "comment", "dialect", "export_settings"})
+    @_set_allowed_attributes({"type", "comment", "dialect", "export_settings", "streaming"})
     def _write_gcode(self, source, target):
         comment = self.get_value("comment")
         dialect = self.get_value("dialect")
@@ -1601,15 +1859,22 @@ class Formatter(BaseDataContainer):
         if export_settings:
             generator.add_filters(export_settings.get_toolpath_filters())
         for toolpath in source:
-            calculated = toolpath.get_toolpath()
-            # TODO: implement toolpath.get_meta_data()
-            generator.add_moves(calculated.path, calculated.filters)
+            if self.get_value("streaming"):
+                # write the moves while they are calculated (without keeping the toolpath)
+                stream = toolpath.get_toolpath_stream()
+                if stream is not None:
+                    filters, moves = stream
+                    generator.add_moves(moves, filters)
+            else:
+                calculated = toolpath.get_toolpath()
+                # TODO: implement toolpath.get_meta_data()
+                generator.add_moves(calculated.path, calculated.filters)
         generator.finish()
         target.close()
         return True
 
     @_set_parser_context("Export formatter 'Model'")
-    @_set_allowed_attributes({"type", "filetype"})
+    @_set_allowed_attributes({"type", "filetype", "binary"})
     def _write_model(self, source, target):
         source = tuple(source)
         if source:
@@ -1623,14 +1888,15 @@ class Formatter(BaseDataContainer):
             from pycam.Exporters.STLExporter import STLExporter
             self._test_sources(source, lambda item: hasattr(item.get_model(), "triangles"),
                                "Models without triangles: {}")
-            exporter = STLExporter(combined_model, name=export_name)
+            exporter = STLExporter(combined_model, name=export_name,
+                                   binary=self.get_value("binary"))
             exporter.write(target)
             target.close()
         else:
             raise InvalidKeyError(filetype, FileType)
 
     def validate(self):
-        self.write_data([], io.StringIO())
+        self.write_data([], io.BytesIO() if self.is_binary() else io.StringIO())
 
 
 class Export(BaseCollectionItemDataContainer):
@@ -1645,10 +1911,11 @@ class Export(BaseCollectionItemDataContainer):
         formatter = self.get_value("format")
         source = self.get_value("source").get(CollectionName.EXPORTS)
         target = self.get_value("target")
+        binary = formatter.is_binary()
         if dry_run:
-            open_target = io.StringIO()
+            open_target = io.BytesIO() if binary else io.StringIO()
         else:
-            open_target = target.open()
+            open_target = target.open(binary=binary)
         formatter.write_data(source, open_target)
 
     def validate(self):